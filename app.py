@@ -1,189 +1,224 @@
+import os
+
 import streamlit as st
-from PIL import Image
-from google import genai  # Ensure this is installed and properly configured
-from pydantic import BaseModel
-from typing import List
 from fractions import Fraction
 
-# ------------------ Helper Function for Fraction Parsing ------------------ #
-def parse_fraction(s: str) -> Fraction:
-    try:
-        return Fraction(s)
-    except Exception:
-        return Fraction(0)
-
-# ------------------ Helper Function for Tax Rate ------------------ #
-def get_tax_rate(item_name: str) -> float:
-    """Return 0.10 (10% tax) if both 'plastic' and 'bag' are present in the item name; otherwise 0.08 (8% tax)."""
-    name_lower = item_name.lower()
-    if "plastic" in name_lower and "bag" in name_lower:
-        return 0.10
-    return 0.08
+from backend.extractors import LOCAL, ExtractionError, GeminiExtractor, make_extractor
+from backend.incremental import IncrementalSplit
+from backend.models import Bill
+from backend.pipeline import decode_image, extract, finalize_bill, prepare_image
+from backend.preprocess import PreprocessOptions
+from backend.response_parsing import ParseError
+from backend.store import BillNotFound, make_store_from_env
+from backend.tax_rules import get_tax_rate
 
-# ------------------ Pydantic Models for Structured Output ------------------ #
-class BillItem(BaseModel):
-    original_name: str
-    normalized_name: str
-    price_before_tax: float
-    discount_amount: float  # Model will output 0 if no discount exists.
+# ------------------ Bill Store (survives reloads, shareable via ?bill=<id>) ------------------ #
+@st.cache_resource
+def get_bill_store():
+    return make_store_from_env()
 
-class Bill(BaseModel):
-    items: List[BillItem]
-    total_bill: float
+def clear_allocation_state():
+    """Drop the current bill's per-item widget values before another bill replaces it.
 
-# ------------------ Utility Function to Make Item Keys Unique ------------------ #
-def make_item_keys_unique(bill_data):
+    Widget keys are built from item names, people and row indexes, so a new
+    bill reuses them and Streamlit would keep showing the old values.
     """
-    Ensure that each item's normalized_name is unique.
-    If duplicates exist, append a suffix like " 1", " 2", etc.
-    """
-    items = bill_data.get("items", [])
-    frequency = {}
-    for item in items:
-        name = item.get("normalized_name")
-        frequency[name] = frequency.get(name, 0) + 1
+    bill_data = st.session_state.get("bill_data") or {}
+    person_names = st.session_state.get("person_names", [])
+    for idx, item in enumerate(bill_data.get("items", [])):
+        item_name = item.get("normalized_name", f"Item {idx+1}")
+        version = st.session_state.pop(f"share_version_{item_name}", 0)
+        st.session_state.pop(f"total_qty_{idx}", None)
+        for person in person_names:
+            st.session_state.pop(f"{item_name}_{person}", None)
+            for v in range(version + 1):
+                st.session_state.pop(f"{item_name}_{person}_v{v}", None)
+    st.session_state.pop("split_model_identity", None)
 
-    occurrence = {}
-    for item in items:
-        name = item.get("normalized_name")
-        if frequency[name] > 1:
-            occurrence[name] = occurrence.get(name, 0) + 1
-            item["normalized_name"] = f"{name} {occurrence[name]}"
-    return bill_data
-
-# ------------------ Utility Function to Merge Discount Items ------------------ #
-def merge_discount_items(bill_data):
-    """
-    In supermarket bills, if an item has a discount,
-    the discount appears on the line immediately below the item
-    and starts with "code128割引". This function merges such discount items
-    with the item immediately preceding them.
-    """
-    items = bill_data.get("items", [])
-    merged_items = []
-    i = 0
-    while i < len(items):
-        current_item = items[i]
-        if (i + 1 < len(items)) and ("code128割引" in items[i+1]["original_name"].lower()):
-            discount_item = items[i+1]
-            current_item["discount_amount"] = discount_item["discount_amount"]
-            merged_items.append(current_item)
-            i += 2  # Skip the discount item.
-        else:
-            merged_items.append(current_item)
-            i += 1
-    bill_data["items"] = merged_items
-    return bill_data
+def load_saved_bill(bill_id):
+    """Restore a saved bill and its allocations into the session; False if not found."""
+    saved = get_bill_store().get(bill_id)
+    if saved is None:
+        return False
+    clear_allocation_state()
+    st.session_state.bill_data = saved["bill"]
+    st.session_state.person_names = saved["people"]
+    st.session_state.bill_id = bill_id
+    st.session_state.saved_allocations = saved["allocations"]
+    for item_name, allocation in saved["allocations"].items():
+        for person, share in allocation["shares"].items():
+            st.session_state[f"{item_name}_{person}"] = share
+    return True
 
 # ------------------ STEP 1: Extract Bill Data Using Gemini API ------------------ #
 def extract_bill(api_key, uploaded_image, prompt):
     if uploaded_image is not None:
         try:
-            image = Image.open(uploaded_image)
+            image = decode_image(uploaded_image)
+            prepared = prepare_image(image, uploaded_image.size, PreprocessOptions.from_env())
         except Exception as e:
             st.error("Failed to open the image. Error: " + str(e))
             return None
 
         with st.spinner("Extracting bill data..."):
-            client = genai.Client(api_key=api_key)
-            schema_dict = Bill.model_json_schema()
-            response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=[prompt, image],
-                config={
-                    'response_mime_type': 'application/json',
-                    'response_schema': schema_dict,
-                }
-            )
-            bill_obj = response.parsed
-            bill_data = bill_obj.dict() if hasattr(bill_obj, "dict") else bill_obj
-            bill_data = make_item_keys_unique(bill_data)
-            bill_data = merge_discount_items(bill_data)
+            # EXTRACTOR_MODE=auto tries local OCR first; local works offline.
+            extractor = make_extractor(os.getenv("EXTRACTOR_MODE", "gemini"), GeminiExtractor(api_key, prompt, Bill))
+            try:
+                bill_data = extract(prepared, extractor).bill
+            except (ExtractionError, ParseError, ValueError) as e:
+                st.error("Failed to extract the bill. Error: " + str(e))
+                return None
+            bill_data = finalize_bill(bill_data)
             st.success("Bill data extracted successfully!")
             st.json(bill_data)  # Display JSON for clarity.
             return bill_data
 
 # ------------------ STEP 2: Display Allocation UI ------------------ #
+def get_split_model(bill_data, person_names):
+    """The incremental split model for this bill and these people, kept across reruns."""
+    # Not keyed by bill_id: that changes when a purged bill is saved again.
+    identity = (id(bill_data), tuple(person_names))
+    if st.session_state.get("split_model_identity") != identity:
+        saved_allocations = st.session_state.get("saved_allocations", {})
+        allocations = {
+            item["normalized_name"]: {
+                "total_quantity": saved_allocations.get(item["normalized_name"], {}).get("total_quantity", 1),
+                "shares": saved_allocations.get(item["normalized_name"], {}).get("shares", {}),
+            }
+            for item in bill_data.get("items", [])
+        }
+        st.session_state.split_model = IncrementalSplit.from_allocations(
+            bill_data.get("items", []),
+            allocations,
+            person_names,
+            total_bill=bill_data.get("total_bill"),
+            store=bill_data.get("store"),
+        )
+        st.session_state.split_model_identity = identity
+    return st.session_state.split_model
+
+def current_allocations():
+    """The allocations shown in the UI, in the shape the bill store takes."""
+    split_model = st.session_state.split_model
+    allocations = {}
+    for item in st.session_state.bill_data.get("items", []):
+        item_name = item["normalized_name"]
+        allocations[item_name] = {
+            "total_quantity": split_model.quantity(item_name),
+            "shares": {
+                person: st.session_state.get(f"{item_name}_{person}", "0")
+                for person in st.session_state.person_names
+            },
+        }
+    return allocations
+
+def save_cells(shares=(), quantities=()):
+    """Save allocation edits; once the saved bill is gone, the next edit saves it under a new id."""
+    store = get_bill_store()
+    bill_id = st.session_state.get("bill_id")
+    if bill_id is None:
+        saved = store.create(st.session_state.bill_data, st.session_state.person_names, current_allocations())
+        st.session_state.bill_id = saved["id"]
+        st.query_params["bill"] = saved["id"]
+        return
+    try:
+        store.update_cells(bill_id, shares=shares, quantities=quantities)
+    except BillNotFound:
+        # Purged after BILL_STORE_TTL, or an old link.
+        st.error("This bill is no longer saved. Your next change will save it under a new link.")
+        del st.session_state.bill_id
+        st.query_params.pop("bill", None)
+
+def on_share_change(item_name, person, widget_key):
+    share = st.session_state[widget_key]
+    st.session_state[f"{item_name}_{person}"] = share
+    st.session_state.split_model.set_share(item_name, person, share)
+    save_cells(shares=[(item_name, person, share)])
+
+def on_quantity_change(item_name, widget_key):
+    quantity = st.session_state[widget_key]
+    st.session_state.split_model.set_quantity(item_name, quantity)
+    save_cells(quantities=[(item_name, quantity)])
+
+# Each item is a fragment: editing a share reruns only that item's card, and
+# the split model applies the edit as a single-cell delta.
+@st.fragment
+def allocation_card(idx, item, person_names, store):
+    split_model = st.session_state.split_model
+    item_name = item.get("normalized_name", f"Item {idx+1}")
+    price_before_tax = item.get("price_before_tax", 0)
+    discount = item.get("discount_amount", 0)
+    tax_rate = get_tax_rate(item_name, item.get("category"), store)
+    effective_price = (price_before_tax * (1 + tax_rate)) - discount
+
+    with st.expander(f"### Allocation for **{item_name}**", expanded=True):
+        col1, col2, col3, col4 = st.columns(4)
+        col1.markdown(f"**Base Price:** ¥{price_before_tax:.2f}")
+        col2.markdown(f"**Tax Rate:** {tax_rate*100:.0f}%")
+        if discount > 0:
+            col3.markdown(f"**Discount:** -¥{discount:.2f}")
+        else:
+            col3.markdown("")  
+        col4.markdown(f"**Effective Price:** ¥{effective_price:.2f}")
+        
+        # Seeded here rather than through value=, which is ignored once the key exists.
+        if f"total_qty_{idx}" not in st.session_state:
+            st.session_state[f"total_qty_{idx}"] = split_model.quantity(item_name)
+        total_qty = st.number_input(
+            f"Enter total quantity for '{item_name}':",
+            min_value=0,
+            step=1,
+            key=f"total_qty_{idx}",
+            on_change=on_quantity_change,
+            args=(item_name, f"total_qty_{idx}"),
+        )
+        
+        # Button to share equally among persons.
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            if st.button("Share Equally", key=f"share_eq_{item_name}"):
+                num_persons = len(person_names)
+                if num_persons > 0:
+                    equal_share = Fraction(total_qty, num_persons)
+                    for person in person_names:
+                        st.session_state[f"{item_name}_{person}"] = str(equal_share)
+                        split_model.set_share(item_name, person, str(equal_share))
+                    st.session_state[f"share_version_{item_name}"] = st.session_state.get(f"share_version_{item_name}", 0) + 1
+                    save_cells(shares=[(item_name, person, str(equal_share)) for person in person_names])
+        
+        version = st.session_state.get(f"share_version_{item_name}", 0)
+        
+        # Create columns for each person’s share input.
+        share_cols = st.columns(len(person_names))
+        for i, person in enumerate(person_names):
+            key = f"{item_name}_{person}_v{version}"
+            default_val = st.session_state.get(f"{item_name}_{person}", "0")
+            with share_cols[i]:
+                st.text_input(
+                    label=f"{person}'s share (e.g., 1/3)",
+                    value=default_val,
+                    key=key,
+                    on_change=on_share_change,
+                    args=(item_name, person, key),
+                )
+        
+        # Only this item's constraint is rechecked after an edit.
+        error = split_model.item_error(item_name)
+        if error:
+            st.caption(error)
+        st.markdown("---")
+
 def display_allocation_ui(bill_data, person_names):
     st.header("Allocate Items to Each Person")
-    allocations = {}
+    split_model = get_split_model(bill_data, person_names)
     for idx, item in enumerate(bill_data.get("items", [])):
-        item_name = item.get("normalized_name", f"Item {idx+1}")
-        price_before_tax = item.get("price_before_tax", 0)
-        discount = item.get("discount_amount", 0)
-        tax_rate = get_tax_rate(item_name)
-        effective_price = (price_before_tax * (1 + tax_rate)) - discount
-
-        with st.expander(f"### Allocation for **{item_name}**", expanded=True):
-            col1, col2, col3, col4 = st.columns(4)
-            col1.markdown(f"**Base Price:** ¥{price_before_tax:.2f}")
-            col2.markdown(f"**Tax Rate:** {tax_rate*100:.0f}%")
-            if discount > 0:
-                col3.markdown(f"**Discount:** -¥{discount:.2f}")
-            else:
-                col3.markdown("")  
-            col4.markdown(f"**Effective Price:** ¥{effective_price:.2f}")
-            
-            total_qty = st.number_input(
-                f"Enter total quantity for '{item_name}':",
-                min_value=0,
-                value=1,
-                step=1,
-                key=f"total_qty_{idx}"
-            )
-            
-            # Button to share equally among persons.
-            col1, col2 = st.columns([1, 3])
-            with col1:
-                if st.button("Share Equally", key=f"share_eq_{item_name}"):
-                    num_persons = len(person_names)
-                    if num_persons > 0:
-                        equal_share = Fraction(total_qty, num_persons)
-                        for person in person_names:
-                            st.session_state[f"{item_name}_{person}"] = str(equal_share)
-                        st.session_state[f"share_version_{item_name}"] = st.session_state.get(f"share_version_{item_name}", 0) + 1
-            
-            version = st.session_state.get(f"share_version_{item_name}", 0)
-            
-            # Create columns for each person’s share input.
-            share_cols = st.columns(len(person_names))
-            item_allocations = {}
-            for i, person in enumerate(person_names):
-                key = f"{item_name}_{person}_v{version}"
-                default_val = st.session_state.get(f"{item_name}_{person}", "0")
-                with share_cols[i]:
-                    share_str = st.text_input(
-                        label=f"{person}'s share (e.g., 1/3)",
-                        value=default_val,
-                        key=key
-                    )
-                    item_allocations[person] = share_str
-            
-            # Note: We removed the live allocation error check here to avoid re-rendering issues.
-            allocations[item_name] = {"total_quantity": total_qty, "shares": item_allocations}
-            st.markdown("---")
-    return allocations
+        allocation_card(idx, item, person_names, bill_data.get("store"))
+    return split_model
 
 # ------------------ STEP 3: Calculate the Split Based on Allocations ------------------ #
-def calculate_split(bill_data, allocations, person_names):
-    person_totals = {person: 0.0 for person in person_names}
-    for item in bill_data.get("items", []):
-        item_name = item.get("normalized_name")
-        price_before_tax = item.get("price_before_tax", 0)
-        discount = item.get("discount_amount", 0)
-        tax_rate = get_tax_rate(item_name)
-        effective_price = (price_before_tax * (1 + tax_rate)) - discount
-        allocation_info = allocations.get(item_name, {})
-        total_qty = allocation_info.get("total_quantity", 0)
-        shares = allocation_info.get("shares", {})
-        if total_qty <= 0:
-            continue
-        unit_cost = effective_price / total_qty
-        for person in person_names:
-            share_str = shares.get(person, "0")
-            allocated_fraction = parse_fraction(share_str)
-            person_totals[person] += float(allocated_fraction) * unit_cost
-    return person_totals
+def calculate_split(split_model):
+    """Exact split in cents; the totals add up to the bill's total_bill."""
+    return split_model.result()
 
 # ------------------ MAIN STREAMLIT UI SETUP ------------------ #
 def main():
@@ -222,7 +257,8 @@ Extract the following details:
      If the text is "FM Bifidus Yogurt 400g", output "yogurt".
    - "price_before_tax": the base price as a number.
    - "discount_amount": the discount on that item as a number. If there is no discount, output 0.
-2. Also extract the total bill amount as "total_bill".
+   - "category": "standard" for items taxed at the standard 10% rate (alcohol, non-food goods such as bags or detergent), otherwise "reduced".
+2. Also extract the total bill amount as "total_bill", and the store name as "store" if it is printed on the bill.
 
 Return a JSON object that conforms to this schema:
 {
@@ -231,11 +267,13 @@ Return a JSON object that conforms to this schema:
       "original_name": "string",
       "normalized_name": "string",
       "price_before_tax": number,
-      "discount_amount": number
+      "discount_amount": number,
+      "category": "reduced" | "standard"
     },
     ...
   ],
-  "total_bill": number
+  "total_bill": number,
+  "store": "string"
 }
 
 Return only the JSON object with no additional text.
@@ -243,40 +281,40 @@ Return only the JSON object with no additional text.
 
     # Process the bill when the button is clicked.
     if st.button("Process Bill"):
-        if api_key and num_people > 0 and len(person_names) == num_people and uploaded_image:
+        if (api_key or os.getenv("EXTRACTOR_MODE") == LOCAL) and num_people > 0 and len(person_names) == num_people and uploaded_image:
             bill_data = extract_bill(api_key, uploaded_image, prompt)
             if bill_data is not None:
+                clear_allocation_state()
                 st.session_state.bill_data = bill_data
                 st.session_state.person_names = person_names
+                st.session_state.saved_allocations = {}
+                saved = get_bill_store().create(bill_data, person_names)
+                st.session_state.bill_id = saved["id"]
+                st.query_params["bill"] = saved["id"]
         else:
             st.warning("Please fill in all fields and upload an image before proceeding.")
 
+    # A reload (or a shared link) restores the saved bill instead of re-extracting.
+    bill_id = st.query_params.get("bill")
+    if bill_id and st.session_state.get("bill_id") != bill_id and not load_saved_bill(bill_id):
+        st.warning("Saved bill not found; upload the bill again.")
+
     # If bill data has been extracted, display allocation UI.
     if "bill_data" in st.session_state and "person_names" in st.session_state:
         bill_data = st.session_state.bill_data
         person_names = st.session_state.person_names
         
-        allocations = display_allocation_ui(bill_data, person_names)
+        split_model = display_allocation_ui(bill_data, person_names)
         
         if st.button("Calculate Split"):
-            valid_allocation = True
-            # Perform allocation error checking here (only when calculating the split)
-            for item in bill_data.get("items", []):
-                item_name = item.get("normalized_name")
-                allocation_info = allocations.get(item_name, {})
-                total_qty = allocation_info.get("total_quantity", 0)
-                shares = allocation_info.get("shares", {})
-                total_allocated = sum(parse_fraction(shares.get(p, "0")) for p in person_names)
-                if total_allocated != Fraction(total_qty):
-                    st.error(
-                        f"Allocation error for '{item_name}': Total allocated is {float(total_allocated):.2f} but should equal {total_qty}."
-                    )
-                    valid_allocation = False
-            
-            if valid_allocation:
-                person_totals = calculate_split(bill_data, allocations, person_names)
+            # Each item card shows its own allocation error as it is edited; list them all here.
+            split = calculate_split(split_model)
+            for error in split.errors:
+                st.error(error)
+
+            if not split.errors:
                 st.subheader("Split Amounts")
-                for person, total in person_totals.items():
+                for person, total in split.totals.items():
                     st.write(f"**{person}:** ${total:.2f}")
 
 if __name__ == "__main__":
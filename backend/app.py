@@ -1,20 +1,42 @@
 # backend/app.py
-from flask import Flask, request, jsonify, send_from_directory
-from PIL import Image
-from google import genai
-# from google.genai import types # This wasn't strictly necessary for the original code provided
-from pydantic import BaseModel, Field
+from flask import Flask, Response, abort, g, request, jsonify, url_for
 from typing import List, Dict, Any, Optional
-from fractions import Fraction
-import io
+import json
 import os
+import threading
+import time
 import traceback
 import logging
 from pathlib import Path # Added for robust .env loading
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.wsgi import wrap_file
+
+from backend.assets import Asset, AssetIndex
+from backend.cache import cache_key, make_cache_from_env
+from backend.extractors import GEMINI, LOCAL, ExtractionError, GeminiExtractor, ModelBusyError, ModelCallError, make_extractor
+from backend.genai_client import client_manager
+from backend.imagehash import PixelDigestIndex, content_digest
+from backend.jobs import JobManager, QueueFullError
+from backend.metrics import BYTES_BUCKETS, annotate, begin_request, end_request, log_json, observe_stage, registry, stage_timer
+from backend.models import Bill
+from backend.pipeline import MAX_IMAGE_PIXELS, ImageTooLarge, extract, finalize_bill, prepare_image
+from backend.preprocess import PreprocessOptions
+from backend.profiler import SamplingProfiler, profiling_requested
+from backend.ratelimit import SingleFlight, make_gate_from_env
+from backend.resumable import UploadSessionError, UploadSessionStore
+from backend.response_parsing import ParseError, ParseStats
+from backend.split import compute_split
+from backend.store import BillNotFound, InvalidUpdate, make_store_from_env
+from backend.uploads import MAX_UPLOAD_BYTES, UploadRequest, UploadSpool, peak_rss_kb
 
 # --- Flask App Setup ---
-# Assuming frontend build is in ../frontend/build
-app = Flask(__name__, static_folder='../frontend/build', static_url_path='/')
+# The frontend build (../frontend/build) is served by the serve() route from an
+# in-memory index, so Flask's own static route is disabled.
+app = Flask(__name__, static_folder=None)
+FRONTEND_BUILD_DIR = os.path.normpath(os.path.join(app.root_path, '..', 'frontend', 'build'))
 # --- End Flask App Setup ---
 
 # --- Environment Variable Loading ---
@@ -38,130 +60,173 @@ if not server_api_key:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# --- Upload Limits ---
+# Uploads stream into hashed, size-limited spool files (backend/uploads.py);
+# MAX_CONTENT_LENGTH caps the whole request body, e.g. a batch of receipts.
+app.request_class = UploadRequest
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv("MAX_REQUEST_BYTES", str(64 * 1024 * 1024)))
+
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({"error": e.description or "Request too large"}), 413
+
+
+# --- End Upload Limits ---
+
+# --- Metrics ---
+# Counters and histograms served on /metrics (backend/metrics.py). Every /api/
+# request also logs one JSON line with its status, latency, per-stage timings
+# and peak RSS.
+http_requests = registry.counter("http_requests_total", "HTTP requests by endpoint and status.", ["method", "endpoint", "status"])
+http_latency = registry.histogram("http_request_duration_seconds", "HTTP request latency by endpoint.", ["method", "endpoint"])
+upload_bytes = registry.histogram("upload_bytes", "Size of uploaded receipt images.", buckets=BYTES_BUCKETS)
+prepared_bytes = registry.histogram("prepared_image_bytes", "Size of the preprocessed image handed to the extractor.", buckets=BYTES_BUCKETS)
+image_megapixels = registry.histogram("image_megapixels", "Pixel count of uploaded images, in megapixels.",
+                                      buckets=(0.5, 1, 2, 4, 8, 12, 16, 24, 50))
+extraction_failures = registry.counter("extraction_failures_total", "Failed extractions by HTTP status returned.", ["status"])
+
+
+@app.before_request
+def start_request_metrics():
+    g.metrics = begin_request()
+    g.peak_rss_start = peak_rss_kb()
+    g.profiler = None
+    if profiling_requested(request.headers.get("X-Profile")):
+        g.profiler = SamplingProfiler().start()
+
+
+@app.after_request
+def record_request_metrics(response):
+    record = end_request() or g.get('metrics') or {}
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+    profile_path = None
+    profiler = g.get('profiler')
+    if profiler is not None:
+        profiler.stop()
+        profile_path = profiler.dump(request.endpoint or "request")
+        response.headers["X-Profile-File"] = profile_path
+
+    peak = observe_request(request.method, request.path, endpoint, response.status_code, record,
+                           g.get('peak_rss_start'), profile=profile_path)
+    if peak is not None:
+        response.headers["X-Peak-RSS-KB"] = str(peak)
+    return response
+
+
+def observe_request(method: str, path: str, endpoint: str, status: int, record: Dict[str, Any],
+                    rss_start: Optional[int] = None, **fields) -> Optional[int]:
+    """Count and time a finished request; /api/ requests also get a JSON log line.
+
+    Returns the peak RSS (KiB) reported for /api/ requests, else None.
+    """
+    elapsed = time.perf_counter() - record.get("started", time.perf_counter())
+    http_requests.inc(method=method, endpoint=endpoint, status=status)
+    http_latency.observe(elapsed, method=method, endpoint=endpoint)
+    if not path.startswith('/api/'):
+        return None
+    # ru_maxrss is the process-wide high-water mark: growth during a request is
+    # this request's doing (or a concurrent one's) and shows where workers peak.
+    peak = peak_rss_kb()
+    log_json(
+        "request",
+        method=method,
+        path=path,
+        endpoint=endpoint,
+        status=status,
+        duration_ms=round(elapsed * 1000, 2),
+        stages={stage: round(ms, 2) for stage, ms in record.get("stages", {}).items()},
+        **{key: value for key, value in record.items() if key not in ("started", "stages")},
+        peak_rss_kb=peak,
+        rss_growth_kb=peak - (peak if rss_start is None else rss_start),
+        **fields,
+    )
+    return peak
+# --- End Metrics ---
+
+# --- Bill Result Cache ---
+# Repeat uploads of the same photo are answered from here without a model call.
+# Configured via BILL_CACHE_BACKEND / BILL_CACHE_PATH / BILL_CACHE_MAX_ENTRIES / BILL_CACHE_TTL.
+bill_cache = make_cache_from_env()
+# Updated from every request thread (and job workers); read through cache_lookup_counts().
+bill_cache_stats = {"hits": 0, "misses": 0}
+bill_cache_stats_lock = threading.Lock()
+
+
+def cache_lookup_counts() -> Dict[str, int]:
+    with bill_cache_stats_lock:
+        return dict(bill_cache_stats)
+
+
+# Re-sent images whose bytes differ (stripped metadata, another container) miss
+# the exact cache; this index maps a digest of the preprocessed pixels of recent
+# uploads to their cache keys.
+pixel_duplicates = PixelDigestIndex(
+    max_entries=int(os.getenv("BILL_PIXEL_INDEX_SIZE", "512")),
+    max_age=float(os.getenv("BILL_PIXEL_MAX_AGE", "900")),
+)
+# --- End Bill Result Cache ---
+
+# Downscale/grayscale/crop settings for uploads (PREPROCESS_* environment variables).
+preprocess_options = PreprocessOptions.from_env()
+
+
+# --- Static File Serving ---
+# Every build file is read, hashed and precompressed once, here; requests are
+# answered from memory with ETags and cache headers (backend/assets.py).
+assets = AssetIndex.build(FRONTEND_BUILD_DIR)
+
+
+def favicon_asset() -> Optional[Asset]:
+    # Create React App puts it at the build root; older builds had it under static/.
+    return assets.get('static/favicon.ico') or assets.get('favicon.ico')
+
+
+def spa_asset(path: str) -> Optional[Asset]:
+    """The build file at ``path``, falling back to index.html for client-side routes."""
+    return (assets.get(path) if path else None) or assets.get('index.html')
+
+
+def asset_response(asset: Asset) -> Response:
+    # Always respond as for GET: werkzeug drops the body of HEAD responses itself.
+    result = assets.respond(asset, "GET", request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match'))
+    if result.file_path is not None:
+        body = wrap_file(request.environ, open(result.file_path, 'rb'))
+        return Response(body, result.status, result.headers, direct_passthrough=True)
+    return Response(result.body, result.status, result.headers)
+
 
 @app.route('/favicon.ico')
 def favicon():
-     # Adjust path if your react build structure is different ('static' is common in create-react-app)
-    return send_from_directory(os.path.join(app.static_folder, 'static'), 'favicon.ico', mimetype='image/vnd.microsoft.icon')
-
-# --- Pydantic Models and Helper Functions (Keep exactly as original) ---
-class BillItem(BaseModel):
-    original_name: str
-    normalized_name: str
-    price_before_tax: float
-    discount_amount: float = 0.0
-    emoji: Optional[str] = None
-
-class Bill(BaseModel):
-    items: List[BillItem]
-    total_bill: float
-
-def get_tax_rate(item_name: str) -> float:
-    name_lower = item_name.lower()
-    if "plastic" in name_lower and "bag" in name_lower:
-        return 0.10
-    return 0.08
-
-def parse_fraction(s: str) -> Fraction:
-    try:
-        return Fraction(s)
-    except Exception:
-        return Fraction(0)
-
-def make_item_keys_unique(bill_data: Dict[str, Any]) -> Dict[str, Any]:
-    items = bill_data.get("items", [])
-    frequency = {}
-    for item in items:
-        name = item.get("normalized_name")
-        frequency[name] = frequency.get(name, 0) + 1
-    occurrence = {}
-    for item in items:
-        name = item.get("normalized_name")
-        if frequency[name] > 1:
-            occurrence[name] = occurrence.get(name, 0) + 1
-            item["normalized_name"] = f"{name} {occurrence[name]}"
-    return bill_data
-
-
-def merge_discount_items(bill_data: Dict[str, Any]) -> Dict[str, Any]:
-    items = bill_data.get("items", [])
-    merged_items = []
-    i = 0
-    while i < len(items):
-        current_item = items[i]
-        # Check if next item exists and is a discount line
-        if (i + 1 < len(items)) and ("code128割引" in items[i+1].get("original_name", "").lower()):
-            discount_item = items[i+1]
-            # Assign the price of the discount line as the discount amount to the item ABOVE it
-            discount_value = discount_item.get("price_before_tax", 0.0)
-            try:
-                current_item["discount_amount"] = float(discount_value)
-            except (ValueError, TypeError):
-                 logger.warning(f"Could not parse discount amount ({discount_value}) for item {current_item.get('original_name', 'N/A')}. Setting discount to 0.")
-                 current_item["discount_amount"] = 0.0
-
-            merged_items.append(current_item)
-            i += 2  # Skip the current item and the discount item
-        else:
-            # Ensure discount_amount exists even if no discount line follows
-            if "discount_amount" not in current_item:
-                 current_item["discount_amount"] = 0.0
-            merged_items.append(current_item)
-            i += 1
-    bill_data["items"] = merged_items
-    return bill_data
-# --- End Pydantic Models and Helper Functions ---
+    asset = favicon_asset()
+    if asset is None:
+        abort(404)
+    return asset_response(asset)
 
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    full_path = os.path.join(app.static_folder, path)
-    if path != "" and os.path.exists(full_path):
-         if os.path.isfile(full_path):
-             return send_from_directory(app.static_folder, path)
-    # Fallback for SPA routing
-    return send_from_directory(app.static_folder, 'index.html')
+    asset = spa_asset(path)
+    if asset is None:
+        abort(404)
+    return asset_response(asset)
 # --- End Static File Serving ---
 
 
 # --- API Endpoint (/api/process-bill) ---
-@app.route('/api/process-bill', methods=['POST'])
-def process_bill():
-    # ---> Check if server API key was loaded correctly <---
-    if not server_api_key:
-        logger.error("API_KEY environment variable is not set on the server.")
-        return jsonify({"error": "Server configuration error. Cannot process request."}), 500
-
-    try:
-        # --- REMOVED API key retrieval from request ---
-        # api_key = request.form.get('api_key') # REMOVED
-        # if not api_key: # REMOVED
-        #     return jsonify({"error": "API key is required"}), 400 # REMOVED
-        # --- End REMOVED ---
+MODEL_NAME = "gemini-2.0-flash"
 
-        # Get the uploaded image (Keep as original)
-        if 'image' not in request.files:
-            return jsonify({"error": "No image provided"}), 400
-        image_file = request.files['image']
+# "structured" constrains the model with response_schema and validates the
+# SDK-parsed object directly; "text" parses free-form text as before.
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "structured").lower()
+# Smaller model used to fix malformed JSON without re-sending the image; empty disables.
+REPAIR_MODEL_NAME = os.getenv("REPAIR_MODEL_NAME", "gemini-2.0-flash-lite")
+parse_stats = ParseStats()
 
-        # Process the image (Keep as original)
-        try:
-            image = Image.open(io.BytesIO(image_file.read()))
-        except Exception as e:
-            logger.error(f"Error opening image: {str(e)}")
-            return jsonify({"error": f"Failed to open the image: {str(e)}"}), 400
-
-        try:
-            # Use the server_api_key loaded from environment variable
-            client = genai.Client(api_key=server_api_key)
-        except Exception as e:
-             logger.error(f"Failed to initialize GenAI client: {str(e)}")
-             return jsonify({"error": "Failed to initialize AI service."}), 500
-
-
-        # Prepare the prompt
-        prompt = """
+# The prompt is part of the cache key, so editing it invalidates cached bills.
+BILL_PROMPT = """
 You are given a supermarket grocery bill in Japanese that may have been OCRed and translated.
 The person who has the bill does not know Japanese and needs to translate the bill into English in order to split it manually with friends.
 For supermarket bills, note that if an item has a discount, the discount is mentioned on the line immediately below the item and starts with "code128割引". The value shown on the discount line is the amount of the discount. Associate this discount value with the item immediately preceding it.
@@ -174,8 +239,9 @@ Extract the following details:
    - "price_before_tax": the base price as a number.
    - "discount_amount": the discount on *that* specific item as a positive number. If there is no discount associated with it, output 0.
    - "emoji": an appropriate emoji that represents this item.
+   - "category": "standard" for items taxed at the standard 10% rate (alcohol, non-food goods such as bags or detergent), otherwise "reduced".
 
-2. Also extract the total bill amount as "total_bill".
+2. Also extract the total bill amount as "total_bill", and the store name as "store" if it is printed on the bill.
 
 Return a JSON object that conforms to this schema:
 {
@@ -185,52 +251,766 @@ Return a JSON object that conforms to this schema:
       "normalized_name": "string",
       "price_before_tax": number,
       "discount_amount": number,
-      "emoji": "string"
+      "emoji": "string",
+      "category": "reduced" | "standard"
     },
     ...
   ],
-  "total_bill": number
+  "total_bill": number,
+  "store": "string"
 }
 
 Return *only* the JSON object with no additional text or markdown formatting.
 """
 
+# Token bucket (bounded wait queue) and 429/503 backoff around every model
+# call; configured via the MODEL_* environment variables.
+model_gate = make_gate_from_env()
+# Concurrent uploads of the same image share one extraction.
+extraction_flight = SingleFlight()
+
+# EXTRACTOR_MODE picks the engine: "gemini", "auto" (local OCR first, Gemini
+# when it is not trusted) or "local" (fully offline, no API key needed).
+EXTRACTOR_MODE = os.getenv("EXTRACTOR_MODE", GEMINI).lower()
+gemini_extractor = GeminiExtractor(
+    server_api_key,
+    BILL_PROMPT,
+    Bill,
+    model_name=MODEL_NAME,
+    structured=EXTRACTION_MODE == "structured",
+    repair_model_name=REPAIR_MODEL_NAME or None,
+    parse_stats=parse_stats,
+    gate=model_gate,
+)
+bill_extractor = make_extractor(EXTRACTOR_MODE, gemini_extractor)
+# Results from different engines must not answer for each other in the cache.
+CACHE_MODEL_ID = MODEL_NAME if EXTRACTOR_MODE == GEMINI else f"{EXTRACTOR_MODE}:{MODEL_NAME}"
+
+
+def api_key_missing() -> bool:
+    """True when the configured engine needs Gemini but API_KEY is unset."""
+    return not server_api_key and EXTRACTOR_MODE != LOCAL
+
+
+class BillProcessingError(Exception):
+    """A failed extraction, carrying the JSON payload and HTTP status to return."""
+
+    def __init__(self, message: str, status: int = 500, headers: Optional[Dict[str, str]] = None, **extra):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+        self.payload = {"error": message, **extra}
+
+
+UNREADABLE_IMAGE = "Uploaded file is not a readable image"
+
+
+def _no_progress(stage: str) -> None:
+    pass
+
+
+def extract_bill_data(upload: UploadSpool, progress=_no_progress) -> Dict[str, Any]:
+    """Run the full extraction for one uploaded image and return the bill dict.
+
+    Shared by the synchronous endpoint, batches and background jobs. ``progress`` is
+    called with the name of each stage as it starts. Concurrent calls for the
+    same image wait for the extraction already running instead of starting
+    their own. Raises BillProcessingError on failure (503 with Retry-After
+    when the model is rate limited).
+    """
+    progress("cache_lookup")
+    key, cached_bill = lookup_cached_bill(upload)
+    if cached_bill is not None:
+        return cached_bill
+
+    try:
+        bill, shared = extraction_flight.do(key, partial(_extract_uncached, upload, key, progress))
+    except BillProcessingError as e:
+        extraction_failures.inc(status=e.status)
+        raise
+    if shared:
+        logger.info(f"Joined in-flight extraction for {key[:12]}")
+        annotate(cache="coalesced")
+    return bill
+
+
+def _extract_uncached(upload: UploadSpool, key: str, progress) -> Dict[str, Any]:
+    """Cache miss path of extract_bill_data; runs once per in-flight image."""
+    prepared, pixel_digest, duplicate_bill = prepare_upload(upload, key, progress)
+    if duplicate_bill is not None:
+        return duplicate_bill
+    check_model_client()
+
+    progress("extracting")
+    try:
+        with stage_timer("extract"):
+            extraction = extract(prepared, bill_extractor)
+    except (ExtractionError, ParseError) as e:
+        raise extraction_error(e)
+    return finish_extraction(extraction, key, pixel_digest, progress)
+
+
+# The steps of extract_bill_data, shared with the async path in backend/asgi.py.
+def lookup_cached_bill(upload: UploadSpool):
+    """Return (cache key, cached bill or None) for an upload."""
+    upload_bytes.observe(upload.size)
+    annotate(upload_bytes=upload.size)
+    key = cache_key(upload.digest, BILL_PROMPT, CACHE_MODEL_ID)
+    with stage_timer("cache_lookup"):
+        cached_bill = bill_cache.get(key)
+    with bill_cache_stats_lock:
+        bill_cache_stats["hits" if cached_bill is not None else "misses"] += 1
+    if cached_bill is not None:
+        logger.info(f"Bill cache hit for {key[:12]}")
+        annotate(cache="hit")
+    return key, cached_bill
+
+
+def prepare_upload(upload: UploadSpool, key: str, progress=_no_progress):
+    """Decode and preprocess an upload; returns (prepared, pixel digest, duplicate bill or None)."""
+    # Pipeline stages (backend/pipeline.py), with the caches checked in between.
+    progress("preprocessing")
+    annotate(cache="miss")
+    try:
+        with stage_timer("open_image"):
+            image = upload.open_image()
+    except ImageTooLarge as e:
+        logger.warning(f"Rejected image before decoding: {str(e)}")
+        raise BillProcessingError(str(e), status=413)
+    except Exception as e:
+        # The exception text can hold internals (object reprs, paths): log it only.
+        logger.error(f"Error decoding image: {str(e)}")
+        raise BillProcessingError(UNREADABLE_IMAGE, status=400)
+    image_megapixels.observe(image.width * image.height / 1e6)
+    try:
+        with stage_timer("preprocess"):
+            prepared = prepare_image(image, upload.size, preprocess_options)
+    except Exception as e:
+        logger.error(f"Error preprocessing image: {str(e)}\nTraceback: {traceback.format_exc()}")
+        raise BillProcessingError(UNREADABLE_IMAGE, status=400)
+    # Sub-steps already timed by preprocess_image.
+    for step in ("decode", "transform", "encode"):
+        observe_stage(f"preprocess.{step}", prepared.stats[f"{step}_ms"])
+    prepared_bytes.observe(prepared.stats["output_bytes"])
+
+    pixel_digest = None
+    if pixel_duplicates.enabled:
         try:
-            response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=[prompt, image]
-            )
+            with stage_timer("pixel_digest"):
+                pixel_digest = content_digest(prepared.image)
         except Exception as e:
-            logger.error(f"GenAI content generation failed: {str(e)}\nTraceback: {traceback.format_exc()}")
-            return jsonify({"error": f"AI model processing failed: {str(e)}"}), 500
+            logger.warning(f"Failed to compute pixel digest: {str(e)}")
+    if pixel_digest is not None:
+        duplicate_key = pixel_duplicates.find(pixel_digest)
+        duplicate_bill = bill_cache.get(duplicate_key) if duplicate_key else None
+        pixel_duplicates.record(duplicate_bill is not None)
+        if duplicate_bill is not None:
+            logger.info(f"Pixel digest cache hit: {key[:12]} matches {duplicate_key[:12]}")
+            annotate(cache="pixel_digest")
+            return prepared, pixel_digest, duplicate_bill
+    return prepared, pixel_digest, None
+
+
+def check_model_client() -> None:
+    if EXTRACTOR_MODE != LOCAL:
+        try:
+            # Use the server_api_key loaded from environment variable; the client
+            # (and its connection pool) is shared by all requests in this process.
+            client_manager.get(server_api_key)
+        except Exception as e:
+            logger.error(f"Failed to initialize GenAI client: {str(e)}")
+            raise BillProcessingError("Failed to initialize AI service.")
+
+
+def extraction_error(e: Exception) -> BillProcessingError:
+    """Map an extractor failure to the error the endpoints return."""
+    if isinstance(e, ModelBusyError):
+        retry_after = max(1, round(e.retry_after))
+        logger.warning(f"GenAI call rate limited: {str(e)}")
+        return BillProcessingError(str(e), status=503, headers={"Retry-After": str(retry_after)}, retry_after=retry_after)
+    if isinstance(e, ModelCallError):
+        logger.error(f"GenAI content generation failed: {str(e)}\nTraceback: {traceback.format_exc()}")
+        return BillProcessingError(f"AI model processing failed: {str(e)}")
+    if isinstance(e, ParseError):
+        logger.error(f"Error parsing model response: {str(e)}\nTraceback: {traceback.format_exc()}\nResponse text: {e.raw_text}")
+        return BillProcessingError(f"Failed to parse model response: {str(e)}", raw_response=e.raw_text)
+    logger.error(f"Local extraction failed: {str(e)}")
+    return BillProcessingError(f"Failed to read the bill: {str(e)}", status=422)
+
+
+def finish_extraction(extraction, key: str, pixel_digest, progress=_no_progress) -> Dict[str, Any]:
+    """Normalize an extraction and store it in the caches; returns the bill dict."""
+    logger.info(f"Bill extracted by {extraction.engine} (confidence {extraction.confidence:.2f})")
+    annotate(engine=extraction.engine)
+
+    progress("parsing")
+    try:
+        with stage_timer("normalize"):
+            bill_data_final = finalize_bill(extraction.bill)
+    except Exception as e:
+        logger.error(f"Error normalizing extracted bill: {str(e)}\nTraceback: {traceback.format_exc()}")
+        raise BillProcessingError(f"Failed to parse model response: {str(e)}")
 
+    # Saved before caching so the cached copy carries its bill_id: cache and
+    # pixel digest hits then answer with that saved bill, not a new row each.
+    bill_data_final = save_extracted_bill(bill_data_final)
+    try:
+        with stage_timer("cache_store"):
+            bill_cache.set(key, bill_data_final)
+            if pixel_digest is not None:
+                pixel_duplicates.add(pixel_digest, key)
+    except Exception as e:
+        # A broken cache must never fail an otherwise good extraction.
+        logger.warning(f"Failed to store bill in cache: {str(e)}")
 
-        try:
-            response_text = response.text
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].strip()
+    return bill_data_final
 
-            # Use Pydantic (Keep as original)
-            bill_data_raw = Bill.parse_raw(response_text).dict()
 
-            bill_data_merged = merge_discount_items(bill_data_raw) # Ensure discounts are handled
-            bill_data_final = make_item_keys_unique(bill_data_merged)
+def extract_claimed_upload(upload: UploadSpool, progress=_no_progress) -> Dict[str, Any]:
+    """extract_bill_data (and save_extracted_bill) for work that outlives the request; releases the upload."""
+    try:
+        return save_extracted_bill(extract_bill_data(upload, progress=progress))
+    finally:
+        upload.release()
 
-            return jsonify(bill_data_final)
 
-        except Exception as e:
-            raw_response_text = getattr(response, 'text', 'Response object has no text attribute')
-            logger.error(f"Error parsing model response: {str(e)}\nTraceback: {traceback.format_exc()}\nResponse text: {raw_response_text}")
-            return jsonify({"error": f"Failed to parse model response: {str(e)}", "raw_response": raw_response_text}), 500
+def save_extracted_bill(bill_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Make sure an extracted bill is saved; returns it with its ``bill_id`` when saving worked.
 
+    A bill that already has a ``bill_id`` (one answered from the cache) keeps
+    it; if that bill has been purged from the store since, it is saved again
+    under the same id.
+    """
+    bill_id = bill_data.get("bill_id")
+    bill = {field: value for field, value in bill_data.items() if field != "bill_id"}
+    try:
+        if bill_id is None:
+            bill_id = bill_store.create(bill)["id"]
+        elif not bill_store.exists(bill_id):
+            bill_store.replace(bill_id, bill, [], {})
+    except Exception as e:
+        # The extraction is still good; the client just can't reload it later.
+        logger.warning(f"Failed to save bill: {str(e)}")
+        return bill_data
+    return {**bill, "bill_id": bill_id}
+
+
+def _read_uploaded_image():
+    """Return the spooled 'image' upload, or None if it is missing."""
+    if 'image' not in request.files:
+        return None
+    return request.files['image'].stream
+
+
+@app.route('/api/process-bill', methods=['POST'])
+def process_bill():
+    # ---> Check if server API key was loaded correctly <---
+    if api_key_missing():
+        logger.error("API_KEY environment variable is not set on the server.")
+        return jsonify({"error": "Server configuration error. Cannot process request."}), 500
+
+    try:
+        # Get the uploaded image (Keep as original)
+        upload = _read_uploaded_image()
+        if upload is None:
+            return jsonify({"error": "No image provided"}), 400
+        return jsonify(save_extracted_bill(extract_bill_data(upload)))
+    except BillProcessingError as e:
+        return jsonify(e.payload), e.status, e.headers
+    except HTTPException:
+        raise  # e.g. 413 from the upload limits
     except Exception as e:
         logger.error(f"Unexpected error in /api/process-bill: {str(e)}\nTraceback: {traceback.format_exc()}")
         return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
 # --- End API Endpoint (/api/process-bill) ---
 
 
+# --- API Endpoint (/api/process-bills) ---
+# Several receipts are extracted concurrently, so a batch takes about as long
+# as its slowest receipt rather than the sum of all of them.
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "20"))
+BATCH_DEADLINE = float(os.getenv("BATCH_DEADLINE", "60"))
+batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BATCH_MAX_WORKERS", "8")),
+    thread_name_prefix="bill-batch",
+)
+
+
+def _release_if_cancelled(upload: UploadSpool, future) -> None:
+    # A cancelled future never runs extract_claimed_upload, so release here.
+    if future.cancelled():
+        upload.release()
+
+
+def combine_bills(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge successful per-receipt bills into one, namespacing items by receipt."""
+    items = []
+    total = 0.0
+    for result in results:
+        if result["status"] != "ok":
+            continue
+        receipt = result["index"] + 1
+        for item in result["bill"].get("items", []):
+            items.append({
+                **item,
+                "normalized_name": f"{item.get('normalized_name')} (receipt {receipt})",
+                "receipt": receipt,
+            })
+        total += result["bill"].get("total_bill", 0.0)
+    return {"items": items, "total_bill": total}
+
+
+@app.route('/api/process-bills', methods=['POST'])
+def process_bills():
+    if api_key_missing():
+        logger.error("API_KEY environment variable is not set on the server.")
+        return jsonify({"error": "Server configuration error. Cannot process request."}), 500
+
+    image_files = request.files.getlist('images')
+    if not image_files:
+        return jsonify({"error": "No images provided"}), 400
+    if len(image_files) > BATCH_MAX_IMAGES:
+        return jsonify({"error": f"Too many images: at most {BATCH_MAX_IMAGES} per batch"}), 400
+    try:
+        deadline = min(float(request.form.get('deadline', BATCH_DEADLINE)), BATCH_DEADLINE)
+    except ValueError:
+        return jsonify({"error": "deadline must be a number of seconds"}), 400
+
+    started = time.monotonic()
+    # Timed-out extractions keep running after the response, so each claims its upload.
+    futures = [batch_executor.submit(extract_claimed_upload, image_file.stream.claim()) for image_file in image_files]
+    for image_file, future in zip(image_files, futures):
+        future.add_done_callback(partial(_release_if_cancelled, image_file.stream))
+    wait(futures, timeout=deadline)
+
+    results = []
+    for index, (image_file, future) in enumerate(zip(image_files, futures)):
+        result = {"index": index, "filename": image_file.filename}
+        if not future.done():
+            # Still running extractions finish in the background and land in
+            # the cache, so retrying the receipt later is cheap.
+            future.cancel()
+            result.update(status="timeout", error={"error": f"Not processed within the {deadline:g}s deadline"})
+        elif isinstance(future.exception(), BillProcessingError):
+            result.update(status="error", error=future.exception().payload)
+        elif future.exception() is not None:
+            error = future.exception()
+            logger.error(f"Unexpected error in /api/process-bills for image {index}: {str(error)}")
+            result.update(status="error", error={"error": f"An unexpected server error occurred: {str(error)}"})
+        else:
+            result.update(status="ok", bill=future.result())
+        results.append(result)
+
+    return jsonify({
+        "results": results,
+        "bill": combine_bills(results),
+        "elapsed": time.monotonic() - started,
+    })
+# --- End API Endpoint (/api/process-bills) ---
+
+
+# --- API Endpoints (/api/jobs) ---
+# Asynchronous variant of /api/process-bill: the upload is queued on a bounded
+# thread pool and the request returns immediately with a job id.
+bill_jobs = JobManager(
+    max_workers=int(os.getenv("JOB_MAX_WORKERS", "4")),
+    max_queued=int(os.getenv("JOB_MAX_QUEUED", "32")),
+    ttl=float(os.getenv("JOB_RESULT_TTL", "600")),
+)
+
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    if api_key_missing():
+        logger.error("API_KEY environment variable is not set on the server.")
+        return jsonify({"error": "Server configuration error. Cannot process request."}), 500
+
+    upload = _read_uploaded_image()
+    if upload is None:
+        return jsonify({"error": "No image provided"}), 400
+    try:
+        job = bill_jobs.submit(extract_claimed_upload, upload.claim())
+    except QueueFullError as e:
+        upload.release()
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+
+    payload = job.to_dict()
+    payload["status_url"] = url_for('get_job', job_id=job.id)
+    payload["events_url"] = url_for('job_events', job_id=job.id)
+    response = jsonify(payload)
+    response.headers["Location"] = payload["status_url"]
+    return response, 202
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = bill_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    job = bill_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def stream():
+        for event in job.follow():
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+# --- End API Endpoints (/api/jobs) ---
+
+
+# --- API Endpoints (/api/upload-config, /api/uploads) ---
+# The client downscales and re-encodes photos to what the server advertises
+# before sending them; large files go up in resumable chunks
+# (backend/resumable.py). The server-side limits still apply to both.
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(512 * 1024)))
+UPLOAD_RESUMABLE_MIN_BYTES = int(os.getenv("UPLOAD_RESUMABLE_MIN_BYTES", str(1024 * 1024)))
+# Autocrop runs on the server, so the client keeps headroom for the receipt
+# to still fill PREPROCESS_MAX_EDGE after cropping.
+UPLOAD_TARGET_EDGE = int(os.getenv("UPLOAD_TARGET_EDGE", str(preprocess_options.max_edge * (2 if preprocess_options.autocrop else 1))))
+UPLOAD_TARGET_QUALITY = float(os.getenv("UPLOAD_TARGET_QUALITY", "0.9"))
+upload_sessions = UploadSessionStore(
+    max_sessions=int(os.getenv("UPLOAD_MAX_SESSIONS", "64")),
+    ttl=float(os.getenv("UPLOAD_SESSION_TTL", "900")),
+)
+
+
+def upload_formats() -> List[str]:
+    """Formats the client may re-encode to, preferred first; WebP only if Pillow can decode it."""
+    from PIL import features
+
+    return (["image/webp"] if features.check("webp") else []) + ["image/jpeg"]
+
+
+@app.route('/api/upload-config', methods=['GET'])
+def upload_config():
+    response = jsonify({
+        "target": {
+            "max_edge": UPLOAD_TARGET_EDGE,
+            "formats": upload_formats(),
+            "quality": UPLOAD_TARGET_QUALITY,
+        },
+        "max_upload_bytes": MAX_UPLOAD_BYTES,
+        "max_pixels": MAX_IMAGE_PIXELS,
+        "chunk_bytes": UPLOAD_CHUNK_BYTES,
+        "resumable_min_bytes": UPLOAD_RESUMABLE_MIN_BYTES,
+    })
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _session_response(session, status=200):
+    payload = session.to_dict()
+    payload["upload_url"] = url_for('upload_chunk', upload_id=session.id)
+    payload["process_url"] = url_for('process_uploaded_bill', upload_id=session.id)
+    response = jsonify(payload)
+    response.headers["Upload-Offset"] = str(session.offset)
+    if status == 201:
+        response.headers["Location"] = payload["upload_url"]
+    return response, status
+
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """Open a resumable upload. Body: {"size": bytes, "content_type": optional, "sha256": optional hex}."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("size"), int) or isinstance(data.get("size"), bool):
+        return jsonify({"error": "Expected a JSON object with an integer 'size'"}), 400
+    try:
+        session = upload_sessions.create(data["size"], data.get("content_type"), data.get("sha256"))
+    except UploadSessionError as e:
+        headers = {"Retry-After": "5"} if e.status == 503 else {}
+        return jsonify(e.to_dict()), e.status, headers
+    return _session_response(session, 201)
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return jsonify({"error": "Upload not found"}), 404
+    return _session_response(session)
+
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Append the request body at the offset given by the Upload-Offset header."""
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return jsonify({"error": "Upload not found"}), 404
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return jsonify({"error": "Missing Upload-Offset header", "offset": session.offset}), 400
+    if not session.busy.acquire(blocking=False):
+        return jsonify({"error": "Another chunk of this upload is in progress", "offset": session.offset}), 409
+    try:
+        # Deleted or expired between the lookup and taking the lock.
+        if session.closed:
+            return jsonify({"error": "Upload not found"}), 404
+        session.append(offset, request.stream, request.content_length)
+    except UploadSessionError as e:
+        return jsonify(e.to_dict()), e.status
+    finally:
+        session.busy.release()
+    return _session_response(session)
+
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def delete_upload(upload_id):
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return jsonify({"error": "Upload not found"}), 404
+    # Closing the spool under a chunk that is being written would fail that write.
+    if not session.busy.acquire(blocking=False):
+        return jsonify({"error": "This upload is in progress", "offset": session.offset}), 409
+    try:
+        if session.closed:
+            return jsonify({"error": "Upload not found"}), 404
+        upload_sessions.remove(upload_id)
+    finally:
+        session.busy.release()
+    return '', 204
+
+
+@app.route('/api/uploads/<upload_id>/process', methods=['POST'])
+def process_uploaded_bill(upload_id):
+    """Extract a completed upload; same response as /api/process-bill."""
+    if api_key_missing():
+        logger.error("API_KEY environment variable is not set on the server.")
+        return jsonify({"error": "Server configuration error. Cannot process request."}), 500
+
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return jsonify({"error": "Upload not found"}), 404
+    if not session.busy.acquire(blocking=False):
+        return jsonify({"error": "This upload is already being processed", "offset": session.offset}), 409
+    try:
+        if session.closed:
+            return jsonify({"error": "Upload not found"}), 404
+        bill = save_extracted_bill(extract_bill_data(session.finish()))
+        upload_sessions.remove(upload_id, completed=True)
+    except UploadSessionError as e:
+        return jsonify(e.to_dict()), e.status
+    except BillProcessingError as e:
+        # The upload is kept, so e.g. a rate-limited extraction can be retried without sending it again.
+        return jsonify(e.payload), e.status, e.headers
+    except Exception as e:
+        logger.error(f"Unexpected error in /api/uploads/{upload_id}/process: {str(e)}\nTraceback: {traceback.format_exc()}")
+        return jsonify({"error": f"An unexpected server error occurred: {str(e)}"}), 500
+    finally:
+        session.busy.release()
+    return jsonify(bill)
+# --- End API Endpoints (/api/upload-config, /api/uploads) ---
+
+
+# --- API Endpoint (/api/split) ---
+@app.route('/api/split', methods=['POST'])
+def split_bill():
+    """Split a bill using the same exact engine as the Streamlit app.
+
+    Body: {"items": [...], "allocations": {item: {"total_quantity"|"totalQuantity", "shares": {person: "1/3"}}},
+           "people": [...], "total_bill": optional, "store": optional, "minor_units": optional (default 100)}
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("people"), list):
+        return jsonify({"error": "Expected a JSON object with 'items', 'allocations' and 'people'"}), 400
+    minor_units = data.get("minor_units", 100)
+    if isinstance(minor_units, bool) or not isinstance(minor_units, int) or minor_units <= 0:
+        return jsonify({"error": "'minor_units' must be a positive integer"}), 400
+    try:
+        result = compute_split(
+            data.get("items", []),
+            data.get("allocations", {}),
+            [str(person) for person in data["people"]],
+            total_bill=data.get("total_bill"),
+            minor_units=minor_units,
+            store=data.get("store"),
+        )
+    except (TypeError, ValueError, AttributeError) as e:
+        return jsonify({"error": f"Invalid split request: {str(e)}"}), 400
+    if result.errors:
+        return jsonify({"error": "Invalid allocations", **result.to_dict()}), 400
+    return jsonify(result.to_dict())
+# --- End API Endpoint (/api/split) ---
+
+
+# --- API Endpoints (/api/bills) ---
+# Saved bills let a reload (or a friend with the link) pick up the allocation
+# without uploading and extracting again. Configured via BILL_STORE_PATH.
+bill_store = make_store_from_env()
+
+
+def _bill_document_from_request():
+    """Validate a {"bill", "people", "allocations"} body; returns (document, error)."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("bill"), dict):
+        return None, "Expected a JSON object with a 'bill'"
+    people = data.get("people", [])
+    allocations = data.get("allocations", {})
+    if not isinstance(people, list) or not isinstance(allocations, dict):
+        return None, "'people' must be a list and 'allocations' an object"
+    try:
+        bill = Bill.model_validate(data["bill"]).model_dump()
+    except Exception as e:
+        return None, f"Invalid bill: {str(e)}"
+    # Keep extra per-item fields added server-side (tax_rate, receipt).
+    for item, original in zip(bill["items"], data["bill"]["items"]):
+        item.update({key: value for key, value in original.items() if key not in item})
+    return {"bill": bill, "people": [str(person) for person in people], "allocations": allocations}, None
+
+
+@app.route('/api/bills', methods=['POST'])
+def create_bill():
+    document, error = _bill_document_from_request()
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        saved = bill_store.create(**document)
+    except (TypeError, ValueError, AttributeError) as e:
+        return jsonify({"error": f"Invalid allocations: {str(e)}"}), 400
+    response = jsonify(saved)
+    response.headers["Location"] = url_for('get_bill', bill_id=saved["id"])
+    return response, 201
+
+
+@app.route('/api/bills/<bill_id>', methods=['GET'])
+def get_bill(bill_id):
+    saved = bill_store.get(bill_id)
+    if saved is None:
+        return jsonify({"error": "Bill not found"}), 404
+    return jsonify(saved)
+
+
+@app.route('/api/bills/<bill_id>', methods=['PUT'])
+def replace_bill(bill_id):
+    document, error = _bill_document_from_request()
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        return jsonify(bill_store.replace(bill_id, **document))
+    except (TypeError, ValueError, AttributeError) as e:
+        return jsonify({"error": f"Invalid allocations: {str(e)}"}), 400
+
+
+@app.route('/api/bills/<bill_id>', methods=['PATCH'])
+def update_bill_cells(bill_id):
+    """Update individual allocation cells.
+
+    Body: {"shares": [{"item", "person", "share"}], "quantities": [{"item", "total_quantity"}],
+           "people": optional full list}
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    try:
+        shares = [(cell["item"], str(cell["person"]), str(cell["share"])) for cell in data.get("shares", [])]
+        quantities = [(cell["item"], int(cell["total_quantity"])) for cell in data.get("quantities", [])]
+        people = data.get("people")
+        if people is not None:
+            people = [str(person) for person in people]
+        version = bill_store.update_cells(bill_id, shares=shares, quantities=quantities, people=people)
+    except BillNotFound:
+        return jsonify({"error": "Bill not found"}), 404
+    except InvalidUpdate as e:
+        return jsonify({"error": str(e)}), 400
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid update: {str(e)}"}), 400
+    return jsonify({"id": bill_id, "version": version, "updated": len(shares) + len(quantities)})
+# --- End API Endpoints (/api/bills) ---
+
+
+# --- API Endpoint (/api/health) ---
+@app.route('/api/health', methods=['GET'])
+def health():
+    return jsonify({"status": "ok", "genai_client": client_manager.health()})
+# --- End API Endpoint (/api/health) ---
+
+
+# --- API Endpoint (/api/cache/stats) ---
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    counts = cache_lookup_counts()
+    lookups = counts["hits"] + counts["misses"]
+    return jsonify({
+        "exact": {
+            **counts,
+            "hit_ratio": (counts["hits"] / lookups) if lookups else 0.0,
+        },
+        "pixel_digest": pixel_duplicates.stats(),
+    })
+# --- End API Endpoint (/api/cache/stats) ---
+
+
+# --- API Endpoint (/api/extraction/stats) ---
+@app.route('/api/extraction/stats', methods=['GET'])
+def extraction_stats():
+    return jsonify({
+        "mode": EXTRACTION_MODE,
+        "extractor": EXTRACTOR_MODE,
+        **parse_stats.to_dict(),
+        "model_gate": model_gate.stats(),
+        "single_flight": {"in_flight": extraction_flight.in_flight(), "coalesced": extraction_flight.coalesced},
+    })
+# --- End API Endpoint (/api/extraction/stats) ---
+
+
+# --- Metrics Endpoint (/metrics) ---
+def collect_component_stats():
+    """Expose the statistics components already keep, read at scrape time."""
+    parse = parse_stats.to_dict()
+    cache_counts = cache_lookup_counts()
+    yield ("parse_total", "counter", "Model responses parsed, by parse path.",
+           [({"path": path}, count) for path, count in parse["paths"].items()])
+    yield ("cache_lookups_total", "counter", "Bill cache lookups by cache and result.", [
+        ({"cache": "exact", "result": "hit"}, cache_counts["hits"]),
+        ({"cache": "exact", "result": "miss"}, cache_counts["misses"]),
+        ({"cache": "pixel_digest", "result": "hit"}, pixel_duplicates.hits),
+        ({"cache": "pixel_digest", "result": "miss"}, pixel_duplicates.misses),
+    ])
+    yield ("single_flight_coalesced_total", "counter", "Uploads that joined an in-flight extraction of the same image.",
+           [({}, extraction_flight.coalesced)])
+    yield ("single_flight_in_flight", "gauge", "Extractions currently in flight.", [({}, extraction_flight.in_flight())])
+    gate = model_gate.stats()
+    yield ("model_retries_total", "counter", "Model calls retried after 429/503.", [({}, gate["retried"])])
+    yield ("model_retries_exhausted_total", "counter", "Model calls still rejected after every retry.", [({}, gate["exhausted"])])
+    if gate["bucket"] is not None:
+        yield ("model_queue_waiting", "gauge", "Requests waiting for a model rate-limit token.", [({}, gate["bucket"]["waiting"])])
+        yield ("model_queue_rejected_total", "counter", "Requests turned away because the model queue was full.",
+               [({}, gate["bucket"]["rejected"])])
+    uploads = upload_sessions.stats()
+    yield ("upload_sessions_open", "gauge", "Resumable uploads in progress.", [({}, uploads["open"])])
+    yield ("upload_sessions_total", "counter", "Resumable uploads by outcome.", [
+        ({"outcome": "created"}, uploads["created"]),
+        ({"outcome": "completed"}, uploads["completed"]),
+        ({"outcome": "expired"}, uploads["expired"]),
+    ])
+    client = client_manager.health()
+    yield ("genai_clients_created_total", "counter", "GenAI clients created.", [({}, client["created"])])
+    yield ("genai_client_resets_total", "counter", "GenAI clients discarded after connection errors.", [({}, client["resets"])])
+
+
+registry.add_collector(collect_component_stats)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+# --- End Metrics Endpoint (/metrics) ---
+
+
 # --- Main Execution ---
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
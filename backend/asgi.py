@@ -0,0 +1,339 @@
+# backend/asgi.py
+"""ASGI entry point for the backend: ``uvicorn backend.asgi:app``.
+
+With sync gunicorn workers, every in-flight model call pins a whole worker
+process. Here ``POST /api/process-bill`` is a coroutine instead:
+
+* the model call is awaited on the event loop (``client.aio``), so a request
+  waiting for Gemini holds no thread and almost no memory;
+* decode, preprocessing, parsing and the caches, which are CPU or disk work,
+  run in worker threads, reusing the same step functions as the Flask
+  endpoint (``lookup_cached_bill``, ``prepare_upload``,
+  ``finish_extraction``);
+* frontend files are answered from the same in-memory asset index as the
+  Flask app (``backend/assets.py``); files too large to hold in memory are
+  streamed with async file I/O.
+
+Every other route is served by the Flask app itself through a WSGI adapter,
+so the whole API keeps the same contract: same routes, same JSON, same
+errors. Requires Starlette and python-multipart (``pip install starlette
+uvicorn python-multipart``).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import traceback
+from functools import partial
+from typing import Any, Dict, List, Optional
+
+try:
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+    from starlette.responses import FileResponse, PlainTextResponse, Response
+    from starlette.routing import Route
+except ImportError as e:  # pragma: no cover - optional dependency
+    raise ImportError("The ASGI server needs Starlette: pip install starlette uvicorn python-multipart") from e
+try:
+    from python_multipart.exceptions import FormParserError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # pragma: no cover - python-multipart < 0.0.13
+    try:
+        from multipart.exceptions import FormParserError
+        from multipart.multipart import MultipartParser, parse_options_header
+    except ImportError as e:
+        raise ImportError("The ASGI server needs python-multipart: pip install python-multipart") from e
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from backend import app as backend
+from backend.extractors import ExtractionError
+from backend.metrics import annotate, begin_request, end_request, registry, stage_timer
+from backend.pipeline import extract_async
+from backend.ratelimit import AsyncSingleFlight
+from backend.response_parsing import ParseError
+from backend.uploads import UploadSpool, peak_rss_kb
+
+logger = logging.getLogger(__name__)
+
+# httpx allows 100 connections per client by default; raise it so hundreds of
+# concurrent extractions don't queue for a model connection.
+MODEL_CONNECTIONS = int(os.getenv("ASGI_MODEL_CONNECTIONS", "512"))
+
+# Concurrent uploads of the same image share one extraction, as in the Flask app.
+async_extraction_flight = AsyncSingleFlight()
+
+
+def _configure_model_connections() -> None:
+    import httpx
+    from google.genai import types
+
+    # Older google-genai releases have no async_client_args and reject unknown
+    # http_options; keep httpx's default pool there rather than fail to start.
+    if "async_client_args" not in types.HttpOptions.model_fields:
+        logger.warning("This google-genai version cannot size the async connection pool; "
+                       "ASGI_MODEL_CONNECTIONS is ignored (upgrade google-genai to apply it).")
+        return
+    limits = httpx.Limits(max_connections=MODEL_CONNECTIONS, max_keepalive_connections=MODEL_CONNECTIONS)
+    http_options = dict(backend.client_manager.http_options or {})
+    http_options["async_client_args"] = {**http_options.get("async_client_args", {}), "limits": limits}
+    backend.client_manager.http_options = http_options
+    backend.client_manager.reset()
+
+
+def json_response(payload: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serialize with Flask's own jsonify so both servers return identical bodies."""
+    with backend.app.app_context():
+        body = backend.app.json.response(payload).get_data()
+    return Response(body, status_code=status, headers=headers, media_type="application/json")
+
+
+# --- Extraction ---
+class _ImagePartReader:
+    """python-multipart callbacks that keep the first 'image' file part and drop every other part.
+
+    The parser only collects the part's bytes; ``read_upload`` writes them to
+    the spool between network chunks, so the limits apply as the body arrives.
+    """
+
+    def __init__(self):
+        self.spool: Optional[UploadSpool] = None
+        self.receiving = False
+        self.chunks: List[bytes] = []
+        self._header_field = b""
+        self._header_value = b""
+        self._disposition = b""
+
+    def callbacks(self) -> Dict[str, Any]:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self) -> None:
+        self._disposition = b""
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        if self._header_field.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_field = self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        # Like request.files in Flask: only parts with a filename are files.
+        self.receiving = self.spool is None and options.get(b"name") == b"image" and b"filename" in options
+        if self.receiving:
+            self.spool = UploadSpool()
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self.receiving:
+            self.chunks.append(data[start:end])
+
+    def on_part_end(self) -> None:
+        self.receiving = False
+
+
+async def read_upload(request: Request) -> Optional[UploadSpool]:
+    """Stream the multipart 'image' field into an UploadSpool (hashed, size-checked); None if missing.
+
+    The body is parsed as it arrives rather than buffered by ``request.form()``
+    first, so ``UPLOAD_MAX_BYTES`` (the file) and ``MAX_CONTENT_LENGTH`` (the
+    whole body) stop an oversized upload at the chunk that crosses them, with
+    or without a Content-Length header, and the bytes are written once.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        return None
+    max_request_bytes = backend.app.config['MAX_CONTENT_LENGTH']
+    reader = _ImagePartReader()
+    parser = MultipartParser(params[b"boundary"], reader.callbacks())
+    received = 0
+
+    async def write_received() -> None:
+        if reader.chunks:
+            data, reader.chunks = b"".join(reader.chunks), []
+            # Writes go to memory until the spool rolls over to disk.
+            if reader.spool.on_disk:
+                await asyncio.to_thread(reader.spool.write, data)
+            else:
+                reader.spool.write(data)
+
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if max_request_bytes is not None and received > max_request_bytes:
+                raise RequestEntityTooLarge()
+            parser.write(chunk)
+            await write_received()
+        parser.finalize()
+        await write_received()
+    except FormParserError as e:
+        logger.warning(f"Malformed multipart upload: {str(e)}")
+        if reader.spool is not None:
+            reader.spool.close()
+        return None
+    except BaseException:
+        if reader.spool is not None:
+            reader.spool.close()
+        raise
+    if reader.spool is not None:
+        reader.spool.seek(0)
+    return reader.spool
+
+
+async def extract_bill_data_async(upload: UploadSpool) -> Dict[str, Any]:
+    """``backend.app.extract_bill_data`` with the model call awaited instead of blocking a thread."""
+    key, cached_bill = await asyncio.to_thread(backend.lookup_cached_bill, upload)
+    if cached_bill is not None:
+        return cached_bill
+
+    try:
+        bill, shared = await async_extraction_flight.do(key, partial(_extract_uncached_async, upload, key))
+    except backend.BillProcessingError as e:
+        backend.extraction_failures.inc(status=e.status)
+        raise
+    if shared:
+        logger.info(f"Joined in-flight extraction for {key[:12]}")
+        annotate(cache="coalesced")
+    return bill
+
+
+async def _extract_uncached_async(upload: UploadSpool, key: str) -> Dict[str, Any]:
+    prepared, pixel_digest, duplicate_bill = await asyncio.to_thread(backend.prepare_upload, upload, key)
+    if duplicate_bill is not None:
+        return duplicate_bill
+    backend.check_model_client()
+
+    try:
+        with stage_timer("extract"):
+            extraction = await extract_async(prepared, backend.bill_extractor)
+    except (ExtractionError, ParseError) as e:
+        raise backend.extraction_error(e)
+    return await asyncio.to_thread(backend.finish_extraction, extraction, key, pixel_digest)
+
+
+async def process_bill(request: Request) -> Response:
+    """Same contract as the Flask ``/api/process-bill``."""
+    if backend.api_key_missing():
+        logger.error("API_KEY environment variable is not set on the server.")
+        return json_response({"error": "Server configuration error. Cannot process request."}, 500)
+
+    max_request_bytes = backend.app.config['MAX_CONTENT_LENGTH']
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_request_bytes:
+        return json_response({"error": "The data value transmitted exceeds the capacity limit."}, 413)
+
+    upload = None
+    try:
+        try:
+            upload = await read_upload(request)
+        except RequestEntityTooLarge as e:
+            # UploadTooLarge for the file itself, the generic one for the whole body.
+            return json_response({"error": e.description}, 413)
+        if upload is None:
+            return json_response({"error": "No image provided"}, 400)
+        bill_data = await extract_bill_data_async(upload)
+        return json_response(await asyncio.to_thread(backend.save_extracted_bill, bill_data))
+    except backend.BillProcessingError as e:
+        return json_response(e.payload, e.status, e.headers)
+    except Exception as e:
+        logger.error(f"Unexpected error in /api/process-bill: {str(e)}\nTraceback: {traceback.format_exc()}")
+        return json_response({"error": f"An unexpected server error occurred: {str(e)}"}, 500)
+    finally:
+        if upload is not None:
+            upload.close()
+# --- End Extraction ---
+
+
+# --- Static File Serving ---
+async def serve(request: Request) -> Response:
+    """Frontend build files, falling back to index.html for SPA routes (like the Flask route)."""
+    asset = backend.spa_asset(request.path_params.get("path", ""))
+    if asset is None:
+        return PlainTextResponse("Not Found", status_code=404)
+    result = backend.assets.respond(asset, request.method, request.headers.get("accept-encoding"),
+                                    request.headers.get("if-none-match"))
+    if result.file_path is not None:
+        return FileResponse(result.file_path, result.status, result.headers)
+    return Response(result.body, result.status, result.headers)
+# --- End Static File Serving ---
+
+
+def _native_route(scope) -> bool:
+    """Requests answered by the async routes; everything else goes to Flask."""
+    path, method = scope["path"], scope["method"]
+    if path == "/api/process-bill":
+        return method == "POST"
+    return method in ("GET", "HEAD") and not path.startswith("/api/") and path not in ("/metrics", "/favicon.ico")
+
+
+def _wsgi_adapter(wsgi_app):
+    try:
+        from a2wsgi import WSGIMiddleware
+    except ImportError:
+        import warnings
+
+        with warnings.catch_warnings():
+            # Starlette's own adapter is deprecated in favour of a2wsgi but still works.
+            warnings.simplefilter("ignore")
+            from starlette.middleware.wsgi import WSGIMiddleware
+    return WSGIMiddleware(wsgi_app)
+
+
+class BackendASGI:
+    """Dispatches to the async routes or the Flask app, and records request metrics."""
+
+    def __init__(self):
+        self.native = Starlette(routes=[
+            Route("/api/process-bill", process_bill, methods=["POST"]),
+            Route("/{path:path}", serve, methods=["GET", "HEAD"]),
+        ])
+        self.flask = _wsgi_adapter(backend.app)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _native_route(scope):
+            # Flask requests are measured by its own before/after_request hooks.
+            await (self.native if scope["type"] == "lifespan" else self.flask)(scope, receive, send)
+            return
+
+        record = begin_request()
+        rss_start = peak_rss_kb()
+        status = {"code": 500}
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if scope["path"].startswith("/api/"):
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-peak-rss-kb", str(peak_rss_kb()).encode())]
+            await send(message)
+
+        try:
+            await self.native(scope, receive, send_with_metrics)
+        finally:
+            end_request()
+            endpoint = "/api/process-bill" if scope["path"] == "/api/process-bill" else "/<path:path>"
+            backend.observe_request(scope["method"], scope["path"], endpoint, status["code"], record, rss_start, server="asgi")
+
+
+def collect_async_stats():
+    yield ("async_single_flight_coalesced_total", "counter",
+           "Uploads that joined an in-flight extraction of the same image (ASGI server).",
+           [({}, async_extraction_flight.coalesced)])
+    yield ("async_single_flight_in_flight", "gauge", "Extractions in flight on the ASGI server.",
+           [({}, async_extraction_flight.in_flight())])
+
+
+_configure_model_connections()
+registry.add_collector(collect_async_stats)
+app = BackendASGI()
@@ -0,0 +1,227 @@
+# backend/assets.py
+"""In-memory index of the frontend build, built once at startup.
+
+``AssetIndex.build(root)`` walks the build directory and, for every file,
+records its content type, a content-hash ETag and its cache policy. Files up
+to ``ASSET_MAX_INLINE_BYTES`` are held in memory, together with gzip (and,
+when the ``brotli`` package is installed, brotli) variants of the
+compressible ones, so serving them touches neither the filesystem nor a
+compressor. Larger files (source maps) are hashed but streamed from disk.
+
+``AssetIndex.respond`` then answers a request from the index:
+
+* content-hashed names (``main.7592a614.js``) get a year-long ``immutable``
+  Cache-Control; everything else (``index.html``, ``manifest.json``) is
+  ``no-cache``, so browsers revalidate it;
+* ``If-None-Match`` with a current ETag gets ``304 Not Modified``;
+* the encoding is negotiated from ``Accept-Encoding`` (q-values honoured)
+  and ``Vary: Accept-Encoding`` is set wherever a choice exists.
+
+It returns a framework-neutral ``AssetResponse`` used by both the Flask and
+the ASGI server. The index is not refreshed: restart after a new build.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_INLINE_BYTES = int(os.getenv("ASSET_MAX_INLINE_BYTES", str(2 * 1024 * 1024)))
+BROTLI_QUALITY = int(os.getenv("ASSET_BROTLI_QUALITY", "11"))
+# Compressing tiny files costs more in headers than it saves.
+MIN_COMPRESS_BYTES = 1024
+# A variant must save at least this fraction of the bytes to be kept.
+MIN_SAVING = 0.1
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Create React App names build output <name>.<content hash>[.chunk].<ext>.
+_HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.")
+_COMPRESSIBLE_TYPES = ("application/javascript", "application/json", "application/manifest+json",
+                       "application/xml", "image/svg+xml", "image/vnd.microsoft.icon")
+
+mimetypes.add_type("application/json", ".map")
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+
+
+def _compressible(content_type: str) -> bool:
+    return content_type.startswith("text/") or content_type in _COMPRESSIBLE_TYPES
+
+
+def _content_type(path: str) -> str:
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+        content_type += "; charset=utf-8"
+    return content_type
+
+
+def _compressors():
+    compressors = {"gzip": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        compressors["br"] = lambda data: brotli.compress(data, quality=BROTLI_QUALITY)
+    return compressors
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> Dict[str, float]:
+    """``Accept-Encoding`` as {coding: q}; codings with q=0 are refused."""
+    accepted: Dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def etag_matches(if_none_match: Optional[str], etags: List[str]) -> bool:
+    """Weak comparison of an ``If-None-Match`` header against the asset's ETags."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return any(etag in candidates for etag in etags)
+
+
+@dataclass
+class Asset:
+    path: str
+    content_type: str
+    size: int
+    digest: str
+    cache_control: str
+    # Encoding ("identity", "gzip", "br") -> bytes; empty for files streamed from disk.
+    variants: Dict[str, bytes] = field(default_factory=dict)
+    file_path: Optional[str] = None
+
+    def etag(self, encoding: str = "identity") -> str:
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+    def etags(self) -> List[str]:
+        return [self.etag(encoding) for encoding in (self.variants or {"identity": b""})]
+
+    def select(self, accept_encoding: Optional[str]) -> str:
+        """Smallest variant the client accepts; identity unless it is refused."""
+        accepted = accepted_encodings(accept_encoding)
+        wildcard = accepted.get("*", 0.0)
+        best = "identity"
+        for encoding, data in self.variants.items():
+            if encoding == "identity" or accepted.get(encoding, wildcard) <= 0:
+                continue
+            if best == "identity" or len(data) < len(self.variants[best]):
+                best = encoding
+        return best
+
+
+@dataclass
+class AssetResponse:
+    status: int
+    headers: Dict[str, str]
+    # Body held in memory, or None with ``file_path`` set to stream it from disk.
+    body: bytes = b""
+    file_path: Optional[str] = None
+
+
+class AssetIndex:
+    def __init__(self, root: Optional[str], assets: Dict[str, Asset]):
+        self.root = root
+        self.assets = assets
+        self.build_ms = 0.0
+
+    @classmethod
+    def build(cls, root: Optional[str], max_inline_bytes: int = MAX_INLINE_BYTES) -> "AssetIndex":
+        started = time.perf_counter()
+        assets: Dict[str, Asset] = {}
+        if root and os.path.isdir(root):
+            compressors = _compressors()
+            for directory, _, filenames in os.walk(root):
+                for filename in filenames:
+                    full_path = os.path.join(directory, filename)
+                    path = os.path.relpath(full_path, root).replace(os.sep, "/")
+                    assets[path] = cls._index_file(path, full_path, max_inline_bytes, compressors)
+        else:
+            logger.warning(f"Frontend build directory {root} not found; only the API will be served.")
+        index = cls(root, assets)
+        index.build_ms = (time.perf_counter() - started) * 1000
+        stats = index.stats()
+        logger.info(f"Indexed {stats['files']} frontend files ({stats['bytes']} bytes, "
+                    f"{stats['compressed_bytes']} compressed) in {index.build_ms:.1f}ms")
+        return index
+
+    @staticmethod
+    def _index_file(path: str, full_path: str, max_inline_bytes: int, compressors) -> Asset:
+        with open(full_path, "rb") as f:
+            data = f.read()
+        content_type = _content_type(path)
+        asset = Asset(
+            path=path,
+            content_type=content_type,
+            size=len(data),
+            digest=hashlib.sha256(data).hexdigest()[:20],
+            cache_control=IMMUTABLE if _HASHED_NAME.search(os.path.basename(path)) else REVALIDATE,
+        )
+        if len(data) > max_inline_bytes:
+            asset.file_path = full_path
+            return asset
+        asset.variants["identity"] = data
+        if len(data) >= MIN_COMPRESS_BYTES and _compressible(content_type.split(";")[0]):
+            for encoding, compress in compressors.items():
+                compressed = compress(data)
+                if len(compressed) <= len(data) * (1 - MIN_SAVING):
+                    asset.variants[encoding] = compressed
+        return asset
+
+    def get(self, path: str) -> Optional[Asset]:
+        return self.assets.get(path.lstrip("/"))
+
+    def respond(self, asset: Asset, method: str = "GET", accept_encoding: Optional[str] = None,
+                if_none_match: Optional[str] = None) -> AssetResponse:
+        encoding = asset.select(accept_encoding)
+        headers = {"ETag": asset.etag(encoding), "Cache-Control": asset.cache_control}
+        if len(asset.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        if etag_matches(if_none_match, asset.etags()):
+            return AssetResponse(304, headers)
+
+        headers["Content-Type"] = asset.content_type
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if asset.file_path is not None:
+            headers["Content-Length"] = str(asset.size)
+            return AssetResponse(200, headers, file_path=None if method == "HEAD" else asset.file_path)
+        body = asset.variants[encoding]
+        headers["Content-Length"] = str(len(body))
+        return AssetResponse(200, headers, b"" if method == "HEAD" else body)
+
+    def stats(self) -> Dict[str, object]:
+        inline = [asset for asset in self.assets.values() if asset.file_path is None]
+        return {
+            "files": len(self.assets),
+            "inline_files": len(inline),
+            "bytes": sum(asset.size for asset in self.assets.values()),
+            "compressed_bytes": sum(min(len(data) for data in asset.variants.values()) for asset in inline),
+            "encodings": sorted({encoding for asset in inline for encoding in asset.variants}),
+            "build_ms": round(self.build_ms, 1),
+        }
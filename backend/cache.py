@@ -0,0 +1,181 @@
+# backend/cache.py
+"""Result cache for extracted bills.
+
+Entries are keyed by the SHA-256 of the uploaded image (computed while the
+upload streams in) together with the prompt and model name, so a change to
+either invalidates old results. Values are the final (merged and
+de-duplicated) bill dicts returned to the client.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def cache_key(image_digest: str, prompt: str, model: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(image_digest.encode("ascii"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Interface for bill result caches."""
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class NullCache(ResultCache):
+    """Cache that never stores anything (BILL_CACHE_BACKEND=none)."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache(ResultCache):
+    """In-process cache with LRU eviction by entry count and a TTL."""
+
+    def __init__(self, max_entries: int = 256, ttl: Optional[float] = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            # Hand out copies so callers can't mutate the cached result.
+            return json.loads(value)
+
+    def set(self, key, value):
+        encoded = json.dumps(value)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), encoded)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache(ResultCache):
+    """On-disk cache that survives worker restarts and is shared between workers."""
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: Optional[float] = 7 * 24 * 3600.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bill_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " stored_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS bill_cache_stored_at ON bill_cache (stored_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across threads; keep one per thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute("SELECT value, stored_at FROM bill_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, stored_at = row
+        if self.ttl is not None and time.time() - stored_at > self.ttl:
+            with conn:
+                conn.execute("DELETE FROM bill_cache WHERE key = ?", (key,))
+            return None
+        return json.loads(value)
+
+    def set(self, key, value):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO bill_cache (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time()),
+            )
+            if self.ttl is not None:
+                conn.execute("DELETE FROM bill_cache WHERE stored_at < ?", (time.time() - self.ttl,))
+            conn.execute(
+                "DELETE FROM bill_cache WHERE key IN ("
+                " SELECT key FROM bill_cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM bill_cache")
+
+
+def _optional_float(value: Optional[str], default: Optional[float]) -> Optional[float]:
+    if value is None or value == "":
+        return default
+    number = float(value)
+    return number if number > 0 else None
+
+
+def make_cache_from_env() -> ResultCache:
+    """Build the cache configured by the BILL_CACHE_* environment variables.
+
+    BILL_CACHE_BACKEND   memory (default), sqlite or none
+    BILL_CACHE_PATH      database file for the sqlite backend
+    BILL_CACHE_MAX_ENTRIES
+    BILL_CACHE_TTL       seconds; 0 disables expiry
+    """
+    backend = os.getenv("BILL_CACHE_BACKEND", "memory").lower()
+    max_entries = os.getenv("BILL_CACHE_MAX_ENTRIES")
+    ttl = os.getenv("BILL_CACHE_TTL")
+    if backend == "none":
+        return NullCache()
+    if backend == "sqlite":
+        path = os.getenv("BILL_CACHE_PATH", os.path.join(os.path.dirname(__file__), "bill_cache.sqlite3"))
+        return SQLiteCache(
+            path,
+            max_entries=int(max_entries) if max_entries else 10000,
+            ttl=_optional_float(ttl, 7 * 24 * 3600.0),
+        )
+    if backend == "memory":
+        return LRUCache(
+            max_entries=int(max_entries) if max_entries else 256,
+            ttl=_optional_float(ttl, 3600.0),
+        )
+    raise ValueError(f"Unknown BILL_CACHE_BACKEND: {backend!r}")
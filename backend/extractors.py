@@ -0,0 +1,367 @@
+# backend/extractors.py
+"""Bill extraction engines.
+
+An ``Extractor`` turns a preprocessed receipt image into a raw bill dict
+(items may still include discount lines; merging, key de-duplication and tax
+rates are applied afterwards by the caller). Engines:
+
+* ``GeminiExtractor``: the Gemini model call plus response parsing.
+* ``TesseractExtractor``: local OCR with pytesseract. No network and no
+  model cost, but item names are the receipt text as printed (untranslated).
+* ``RoutingExtractor``: tries the local engine first and escalates to Gemini
+  when OCR confidence is low or the line prices don't reconcile with the
+  printed total.
+
+``EXTRACTOR_MODE`` selects ``gemini`` (default), ``auto`` (routing) or
+``local`` (fully offline, Tesseract only).
+"""
+import asyncio
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Type
+
+from pydantic import BaseModel
+
+from backend.genai_client import ClientManager, client_manager
+from backend.metrics import stage_timer
+from backend.pipeline import DISCOUNT_MARKER
+from backend.preprocess import PreprocessedImage
+from backend.ratelimit import ModelGate, RateLimited
+from backend.response_parsing import ParseStats, parse_bill_response
+from backend.tax_rules import get_tax_rate
+
+logger = logging.getLogger(__name__)
+
+GEMINI = "gemini"
+AUTO = "auto"
+LOCAL = "local"
+EXTRACTOR_MODES = (GEMINI, AUTO, LOCAL)
+
+
+class ExtractionError(Exception):
+    """The engine could not produce a bill from the image."""
+
+
+class ModelCallError(ExtractionError):
+    """The Gemini request itself failed."""
+
+
+class ModelBusyError(ModelCallError):
+    """The model call was rate limited: our queue was full or the API kept answering 429/503."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class Extraction:
+    bill: Dict[str, Any]
+    engine: str
+    # 0..1; how much the engine trusts its own result.
+    confidence: float = 1.0
+    reconciled: Optional[bool] = None
+
+
+class Extractor:
+    name = "base"
+
+    def extract(self, prepared: PreprocessedImage) -> Extraction:
+        raise NotImplementedError
+
+    async def aextract(self, prepared: PreprocessedImage) -> Extraction:
+        """Async ``extract``; engines without async I/O run in a worker thread."""
+        return await asyncio.to_thread(self.extract, prepared)
+
+
+class GeminiExtractor(Extractor):
+    name = GEMINI
+
+    def __init__(
+        self,
+        api_key: str,
+        prompt: str,
+        bill_model: Type[BaseModel],
+        model_name: str = "gemini-2.0-flash",
+        structured: bool = True,
+        repair_model_name: Optional[str] = None,
+        parse_stats: Optional[ParseStats] = None,
+        clients: ClientManager = client_manager,
+        gate: Optional[ModelGate] = None,
+    ):
+        self.api_key = api_key
+        self.prompt = prompt
+        self.bill_model = bill_model
+        self.model_name = model_name
+        self.structured = structured
+        self.repair_model_name = repair_model_name
+        self.parse_stats = parse_stats or ParseStats()
+        self.clients = clients
+        # Rate limit and 429/503 retries around every call; None calls directly.
+        self.gate = gate
+        self.config = {
+            'response_mime_type': 'application/json',
+            'response_schema': bill_model,
+        }
+
+    def _generate(self, model_name, contents, config):
+        def call():
+            return self.clients.call(self.api_key, lambda client: client.models.generate_content(
+                model=model_name,
+                contents=contents,
+                config=config,
+            ))
+
+        return self.gate.call(call) if self.gate is not None else call()
+
+    async def _agenerate(self, model_name, contents, config):
+        def call():
+            return self.clients.acall(self.api_key, lambda client: client.aio.models.generate_content(
+                model=model_name,
+                contents=contents,
+                config=config,
+            ))
+
+        return await (self.gate.acall(call) if self.gate is not None else call())
+
+    def _contents(self, prepared):
+        from google.genai import types
+
+        return [self.prompt, types.Part.from_bytes(data=prepared.data, mime_type=prepared.mime_type)]
+
+    def _parse(self, response):
+        def repair_with_model(repair_prompt):
+            # Text-only request to a smaller model: far cheaper than re-sending the image.
+            return self._generate(self.repair_model_name, [repair_prompt], self.config)
+
+        with stage_timer("parse"):
+            bill = parse_bill_response(
+                response, self.bill_model, self.parse_stats,
+                structured=self.structured,
+                repair_with_model=repair_with_model if self.repair_model_name else None,
+            )
+        return Extraction(bill=bill, engine=self.name)
+
+    def extract(self, prepared):
+        try:
+            with stage_timer("model_call"):
+                response = self._generate(self.model_name, self._contents(prepared), self.config if self.structured else None)
+        except RateLimited as e:
+            raise ModelBusyError(str(e), retry_after=e.retry_after) from e
+        except Exception as e:
+            raise ModelCallError(str(e)) from e
+        return self._parse(response)
+
+    async def aextract(self, prepared):
+        """``extract`` with the model call awaited on the event loop (``client.aio``).
+
+        Parsing, and the rare repair call, run in a worker thread.
+        """
+        try:
+            with stage_timer("model_call"):
+                response = await self._agenerate(self.model_name, self._contents(prepared), self.config if self.structured else None)
+        except RateLimited as e:
+            raise ModelBusyError(str(e), retry_after=e.retry_after) from e
+        except Exception as e:
+            raise ModelCallError(str(e)) from e
+        return await asyncio.to_thread(self._parse, response)
+
+
+# A receipt line: item text followed by a price, optionally with a yen sign,
+# a leading minus for discounts and trailing tax marks (※, *, 軽, 外, 内).
+_PRICE_LINE = re.compile(
+    r"^(?P<name>.*?\S)\s*(?P<sign>[-−▲△]?)\s*[¥\\￥]?\s*(?P<price>\d{1,3}(?:[,，]\d{3})+|\d+)\s*[※*軽外内Ｘx]?\s*$"
+)
+_TOTAL_WORDS = ("合計", "total")
+_DISCOUNT_WORDS = ("割引", "値引", "discount", "code128")
+# Lines with prices that are not items: subtotals, tax lines, payment and change.
+_SKIP_WORDS = (
+    "小計", "subtotal", "税", "tax", "お預", "預り", "釣", "change", "現金", "cash",
+    "クレジット", "credit", "点数", "ポイント", "point",
+)
+
+
+def _amount(text: str) -> float:
+    return float(text.replace(",", "").replace("，", ""))
+
+
+def parse_receipt_lines(lines: List[str]) -> Dict[str, Any]:
+    """Parse OCR'd receipt lines into a raw bill dict.
+
+    Discount lines become separate items named with the code128割引 marker,
+    so the usual discount merging attaches them to the item above.
+    """
+    items: List[Dict[str, Any]] = []
+    total_bill = None
+    for line in lines:
+        match = _PRICE_LINE.match(line.strip())
+        if not match:
+            continue
+        name = match.group("name").strip(" .:・")
+        lowered = name.lower()
+        amount = _amount(match.group("price"))
+        if any(word in lowered for word in _TOTAL_WORDS) and "小計" not in lowered:
+            total_bill = amount
+            continue
+        if any(word in lowered for word in _DISCOUNT_WORDS) or match.group("sign"):
+            if items:
+                if not name.lower().startswith(DISCOUNT_MARKER):
+                    name = f"{DISCOUNT_MARKER} {name}"
+                items.append({
+                    "original_name": name,
+                    "normalized_name": name,
+                    "price_before_tax": amount,
+                    "discount_amount": amount,
+                })
+            continue
+        if any(word in lowered for word in _SKIP_WORDS):
+            continue
+        items.append({
+            "original_name": name,
+            "normalized_name": name,
+            "price_before_tax": amount,
+            "discount_amount": 0.0,
+        })
+    return {"items": items, "total_bill": total_bill}
+
+
+def reconcile(bill: Dict[str, Any], tolerance: float = 0.01) -> bool:
+    """Check the extracted lines against the printed total.
+
+    Receipts print either tax-exclusive prices (外税) or tax-inclusive ones
+    (内税). If the lines only add up with tax included, prices are converted
+    to before-tax amounts in place so the bill means the same as a Gemini one.
+    """
+    total = bill.get("total_bill")
+    items = bill.get("items", [])
+    if not total or not items:
+        return False
+    allowed = max(2.0, total * tolerance)
+    net, with_tax = 0.0, 0.0
+    for item in items:
+        amount = item["price_before_tax"]
+        if item["original_name"].startswith(DISCOUNT_MARKER):
+            amount = -amount
+        rate = get_tax_rate(item["normalized_name"])
+        net += amount
+        with_tax += amount * (1 + rate)
+    if abs(with_tax - total) <= allowed:
+        return True
+    if abs(net - total) <= allowed:
+        for item in items:
+            rate = get_tax_rate(item["normalized_name"])
+            item["price_before_tax"] = round(item["price_before_tax"] / (1 + rate), 2)
+            if item["original_name"].startswith(DISCOUNT_MARKER):
+                item["discount_amount"] = item["price_before_tax"]
+        return True
+    return False
+
+
+class TesseractExtractor(Extractor):
+    name = "tesseract"
+
+    def __init__(self, lang: str = "jpn+eng"):
+        self.lang = lang
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import pytesseract
+
+            pytesseract.get_tesseract_version()
+            return True
+        except Exception:
+            return False
+
+    def extract(self, prepared):
+        try:
+            import pytesseract
+        except ImportError as e:
+            raise ExtractionError("pytesseract is not installed") from e
+        try:
+            with stage_timer("ocr"):
+                data = pytesseract.image_to_data(prepared.image, lang=self.lang, output_type=pytesseract.Output.DICT)
+        except Exception as e:
+            raise ExtractionError(f"Tesseract OCR failed: {str(e)}") from e
+
+        # Group words into lines, keeping the mean word confidence per line.
+        lines: Dict[tuple, List[str]] = {}
+        confidences: Dict[tuple, List[float]] = {}
+        for i, word in enumerate(data["text"]):
+            confidence = float(data["conf"][i])
+            if not word.strip() or confidence < 0:
+                continue
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            lines.setdefault(key, []).append(word)
+            confidences.setdefault(key, []).append(confidence)
+        # Japanese OCR output separates characters with spaces; keep spaces
+        # only where they split ASCII words.
+        texts = [re.sub(r"(?<=[^\x00-\x7f]) (?=[^\x00-\x7f])", "", " ".join(words)) for words in lines.values()]
+        bill = parse_receipt_lines(texts)
+
+        line_confidences = [sum(c) / len(c) for c in confidences.values()]
+        confidence = (sum(line_confidences) / len(line_confidences) / 100.0) if line_confidences else 0.0
+        reconciled = reconcile(bill)
+        if not bill["items"]:
+            raise ExtractionError("No item lines recognized")
+        if bill["total_bill"] is None:
+            bill["total_bill"] = sum(
+                -item["price_before_tax"] if item["original_name"].startswith(DISCOUNT_MARKER) else item["price_before_tax"]
+                for item in bill["items"]
+            )
+        return Extraction(bill=bill, engine=self.name, confidence=confidence, reconciled=reconciled)
+
+
+class RoutingExtractor(Extractor):
+    """Local OCR first; escalate to the remote engine when it isn't trustworthy."""
+
+    name = AUTO
+
+    def __init__(self, local: Extractor, remote: Extractor, min_confidence: float = 0.80):
+        self.local = local
+        self.remote = remote
+        self.min_confidence = min_confidence
+
+    def extract(self, prepared):
+        try:
+            extraction = self.local.extract(prepared)
+        except ExtractionError as e:
+            logger.info(f"Local extraction failed ({str(e)}); escalating to {self.remote.name}")
+            return self.remote.extract(prepared)
+        if self._trusted(extraction):
+            return extraction
+        return self.remote.extract(prepared)
+
+    async def aextract(self, prepared):
+        try:
+            extraction = await self.local.aextract(prepared)
+        except ExtractionError as e:
+            logger.info(f"Local extraction failed ({str(e)}); escalating to {self.remote.name}")
+            return await self.remote.aextract(prepared)
+        if self._trusted(extraction):
+            return extraction
+        return await self.remote.aextract(prepared)
+
+    def _trusted(self, extraction: Extraction) -> bool:
+        if extraction.reconciled and extraction.confidence >= self.min_confidence:
+            return True
+        logger.info(
+            f"Local extraction not trusted (confidence {extraction.confidence:.2f}, "
+            f"reconciled {extraction.reconciled}); escalating to {self.remote.name}"
+        )
+        return False
+
+
+def make_extractor(mode: str, gemini: Optional[Extractor]) -> Extractor:
+    """Build the extractor for EXTRACTOR_MODE; ``gemini`` may be None in local mode."""
+    mode = (mode or GEMINI).lower()
+    if mode not in EXTRACTOR_MODES:
+        raise ValueError(f"Unknown EXTRACTOR_MODE: {mode!r}")
+    if mode == GEMINI:
+        return gemini
+    local = TesseractExtractor(lang=os.getenv("TESSERACT_LANG", "jpn+eng"))
+    if mode == LOCAL:
+        return local
+    return RoutingExtractor(local, gemini, min_confidence=float(os.getenv("LOCAL_MIN_CONFIDENCE", "0.80")))
@@ -0,0 +1,131 @@
+# backend/genai_client.py
+"""Process-wide pool of Gemini clients.
+
+Building a ``genai.Client`` sets up auth and a fresh HTTP connection pool, so
+constructing one per request pays client setup plus a new TCP/TLS handshake
+every time. ``ClientManager`` keeps one client per API key and reuses it, so
+its keep-alive connections carry later requests.
+
+Clients are created lazily on first use and are tied to the process that
+created them: after gunicorn forks a worker, the worker builds its own
+instead of sharing the parent's sockets. A client that fails with a
+connection-level error is discarded and rebuilt.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _default_factory(api_key: str, http_options: Optional[Dict[str, Any]] = None):
+    from google import genai
+
+    return genai.Client(api_key=api_key, http_options=http_options)
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """True for transport failures after which the client's pool is suspect."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # httpx / requests transport errors, matched by module so neither library
+    # has to be importable here.
+    module = type(error).__module__.split(".")[0]
+    name = type(error).__name__
+    return module in ("httpx", "httpcore", "requests", "urllib3") and (
+        "Connect" in name or "Timeout" in name or "Protocol" in name or "Network" in name
+    )
+
+
+class ClientManager:
+    def __init__(self, factory: Callable[..., Any] = _default_factory, http_options: Optional[Dict[str, Any]] = None):
+        self.factory = factory
+        self.http_options = http_options
+        self._clients: Dict[str, Any] = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.resets = 0
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+
+    def _check_fork(self) -> None:
+        if os.getpid() != self._pid:
+            # Inherited clients share sockets with the parent; drop them
+            # without closing so the parent's connections stay intact.
+            self._clients = {}
+            self._pid = os.getpid()
+
+    def get(self, api_key: str):
+        with self._lock:
+            self._check_fork()
+            client = self._clients.get(api_key)
+            if client is None:
+                client = self.factory(api_key, http_options=self.http_options)
+                self._clients[api_key] = client
+                self.created += 1
+            return client
+
+    def reset(self, api_key: Optional[str] = None) -> None:
+        """Discard the client for ``api_key`` (or all clients) and close it."""
+        with self._lock:
+            self._check_fork()
+            if api_key is None:
+                stale, self._clients = list(self._clients.values()), {}
+            else:
+                client = self._clients.pop(api_key, None)
+                stale = [client] if client is not None else []
+            self.resets += len(stale)
+        for client in stale:
+            close = getattr(client, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    logger.warning(f"Failed to close GenAI client: {str(e)}")
+
+    def call(self, api_key: str, fn: Callable[[Any], Any]):
+        """Run ``fn(client)``; on a connection error, rebuild the client and retry once."""
+        client = self.get(api_key)
+        try:
+            return fn(client)
+        except Exception as e:
+            if not is_connection_error(e):
+                raise
+            self._record_error(e)
+            logger.warning(f"GenAI client connection failed ({type(e).__name__}: {str(e)}); rebuilding client")
+            self.reset(api_key)
+            return fn(self.get(api_key))
+
+    async def acall(self, api_key: str, fn: Callable[[Any], Awaitable[Any]]):
+        """Async ``call``: awaits ``fn(client)``, e.g. ``client.aio.models.generate_content(...)``."""
+        client = self.get(api_key)
+        try:
+            return await fn(client)
+        except Exception as e:
+            if not is_connection_error(e):
+                raise
+            self._record_error(e)
+            logger.warning(f"GenAI client connection failed ({type(e).__name__}: {str(e)}); rebuilding client")
+            self.reset(api_key)
+            return await fn(self.get(api_key))
+
+    def _record_error(self, error: BaseException) -> None:
+        self.last_error = f"{type(error).__name__}: {str(error)}"
+        self.last_error_at = time.time()
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pid": self._pid,
+                "clients": len(self._clients),
+                "created": self.created,
+                "resets": self.resets,
+                "last_error": self.last_error,
+                "last_error_at": self.last_error_at,
+            }
+
+
+client_manager = ClientManager()
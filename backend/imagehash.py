@@ -0,0 +1,92 @@
+# backend/imagehash.py
+"""Pixel digests for spotting re-sent receipt images.
+
+The exact result cache is keyed by the uploaded bytes, so the same image sent
+again with stripped metadata, in another container, or downscaled by the
+client to the same pixels misses it. ``content_digest`` hashes the
+preprocessed pixels instead, and ``PixelDigestIndex`` maps the digests of
+recently processed receipts to their cache keys.
+
+Only identical pixels match. A perceptual hash follows the framing of a
+receipt more than the figures printed on it: receipts from the same till land
+a few bits apart, while a re-photographed or lossily re-encoded copy of one
+receipt can differ by as much. Neither kind of match can be confirmed without
+reading the receipt, which is the model call the lookup is meant to save.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional, Tuple
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+def content_digest(image: Image.Image) -> str:
+    """SHA-256 of the decoded pixels, independent of the file format and metadata."""
+    digest = hashlib.sha256(f"{image.mode}:{image.width}x{image.height}:".encode("ascii"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class PixelDigestIndex:
+    """Bounded map of pixel digest -> cache key for recent receipts.
+
+    Entries older than ``max_age`` seconds no longer match (a re-sent receipt
+    is re-uploaded within minutes), and the oldest entries are dropped beyond
+    ``max_entries``. ``max_entries=0`` disables the index.
+    """
+
+    def __init__(self, max_entries: int = 512, max_age: Optional[float] = 900.0):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def find(self, digest: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            added_at, key = entry
+            if self.max_age is not None and time.monotonic() - added_at > self.max_age:
+                del self._entries[digest]
+                return None
+            return key
+
+    def add(self, digest: str, key: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[digest] = (time.monotonic(), key)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "entries": len(self._entries),
+            }
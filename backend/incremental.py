@@ -0,0 +1,163 @@
+# backend/incremental.py
+"""Incremental split model for interactive allocation editing.
+
+``compute_split`` rebuilds the whole items x people matrix on every call.
+While someone is typing shares into the UI only one cell changes at a time,
+so ``IncrementalSplit`` keeps per-item unit costs, per-item share sums and
+per-person running totals (exact fractions of a minor unit) and applies each
+edit as a delta:
+
+* ``set_share`` is O(1): one person's total and one item's sum change, and
+  only that item's sum-to-quantity constraint is rechecked.
+* ``set_quantity`` is O(people sharing that item).
+* ``result`` only rounds the running totals (O(people)); it gives the same
+  ``SplitResult`` as ``compute_split`` for the same allocations.
+"""
+import math
+from fractions import Fraction
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+
+from backend.split import (
+    SplitResult,
+    _allocation_fields,
+    _rate_multiplier,
+    check_minor_units,
+    largest_remainder,
+    parse_share,
+    to_minor_units,
+)
+from backend.tax_rules import get_tax_rate
+
+ZERO = Fraction(0)
+
+
+def _share_value(share: Any) -> Fraction:
+    numerator, denominator = parse_share(str(share))
+    return Fraction(numerator, denominator)
+
+
+class IncrementalSplit:
+    def __init__(
+        self,
+        items: Sequence[Mapping[str, Any]],
+        people: Sequence[str],
+        tax_rate: Optional[Callable[[str], float]] = None,
+        total_bill: Optional[float] = None,
+        minor_units: int = 100,
+        store: Optional[str] = None,
+        default_quantity: int = 1,
+    ):
+        self.people = list(people)
+        self.minor_units = check_minor_units(minor_units)
+        self.total_bill = total_bill
+        self.names: List[str] = []
+        # Effective cost of each item (price with tax, minus discount), in minor units.
+        self._cost: Dict[str, Fraction] = {}
+        self._quantity: Dict[str, int] = {}
+        self._shares: Dict[str, Dict[str, Fraction]] = {}
+        self._share_sum: Dict[str, Fraction] = {}
+        self._totals: Dict[str, Fraction] = {person: ZERO for person in self.people}
+        self._errors: Dict[str, str] = {}
+        for item in items:
+            name = item.get("normalized_name")
+            rate = tax_rate(name) if tax_rate is not None else get_tax_rate(name, item.get("category"), store)
+            rate_num, rate_den = _rate_multiplier(rate)
+            self._cost[name] = Fraction(
+                to_minor_units(item.get("price_before_tax"), minor_units) * rate_num
+                - to_minor_units(item.get("discount_amount"), minor_units) * rate_den,
+                rate_den,
+            )
+            self.names.append(name)
+            self._quantity[name] = default_quantity
+            self._shares[name] = {}
+            self._share_sum[name] = ZERO
+            self._validate(name)
+
+    @classmethod
+    def from_allocations(
+        cls,
+        items: Sequence[Mapping[str, Any]],
+        allocations: Mapping[str, Mapping[str, Any]],
+        people: Sequence[str],
+        **kwargs,
+    ) -> "IncrementalSplit":
+        split = cls(items, people, default_quantity=0, **kwargs)
+        for name, allocation in allocations.items():
+            if name not in split._cost:
+                continue
+            quantity, shares = _allocation_fields(allocation)
+            split.set_quantity(name, int(quantity or 0))
+            for person, share in shares.items():
+                if person in split._totals:
+                    split.set_share(name, person, share)
+        return split
+
+    def _unit_cost(self, name: str) -> Fraction:
+        quantity = self._quantity[name]
+        # Items with a non-positive quantity are skipped, as in compute_split.
+        return self._cost[name] / quantity if quantity > 0 else ZERO
+
+    def _validate(self, name: str) -> None:
+        quantity = self._quantity[name]
+        allocated = self._share_sum[name]
+        if quantity <= 0:
+            if any(self._shares[name].values()):
+                self._errors[name] = f"Allocation error for '{name}': Shares are allocated but the quantity is {quantity}."
+            else:
+                self._errors.pop(name, None)
+        elif allocated != quantity:
+            self._errors[name] = (
+                f"Allocation error for '{name}': Total allocated is {float(allocated):.2f} but should equal {quantity}."
+            )
+        else:
+            self._errors.pop(name, None)
+
+    def set_share(self, name: str, person: str, share: Any) -> None:
+        """Set one cell; O(1)."""
+        value = _share_value(share)
+        shares = self._shares[name]
+        delta = value - shares.get(person, ZERO)
+        if not delta:
+            return
+        if value:
+            shares[person] = value
+        else:
+            shares.pop(person, None)
+        self._share_sum[name] += delta
+        self._totals[person] += delta * self._unit_cost(name)
+        self._validate(name)
+
+    def set_quantity(self, name: str, quantity: int) -> None:
+        """Change an item's quantity; re-prices only the people sharing it."""
+        old_unit = self._unit_cost(name)
+        self._quantity[name] = int(quantity)
+        new_unit = self._unit_cost(name)
+        if new_unit != old_unit:
+            for person, share in self._shares[name].items():
+                self._totals[person] += share * (new_unit - old_unit)
+        self._validate(name)
+
+    def quantity(self, name: str) -> int:
+        return self._quantity[name]
+
+    def item_error(self, name: str) -> Optional[str]:
+        return self._errors.get(name)
+
+    @property
+    def errors(self) -> List[str]:
+        return [self._errors[name] for name in self.names if name in self._errors]
+
+    def result(self) -> SplitResult:
+        exact = [self._totals[person] for person in self.people]
+        common = math.lcm(*(total.denominator for total in exact)) if exact else 1
+        weights = [total.numerator * (common // total.denominator) for total in exact]
+        exact_sum = sum(exact, ZERO)
+        items_total = math.floor(exact_sum + Fraction(1, 2))  # round half up
+        target = to_minor_units(self.total_bill, self.minor_units) if self.total_bill else items_total
+        rounded = largest_remainder(weights, common, target)
+        return SplitResult(
+            totals={person: rounded[i] / self.minor_units for i, person in enumerate(self.people)},
+            totals_minor={person: rounded[i] for i, person in enumerate(self.people)},
+            errors=self.errors,
+            adjustment_minor=target - items_total if any(weights) else 0,
+        )
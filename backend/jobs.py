@@ -0,0 +1,146 @@
+# backend/jobs.py
+"""Background execution of bill extraction jobs.
+
+``POST /api/jobs`` hands the upload to a ``JobManager``, which runs it on a
+bounded thread pool and records progress events. Clients either poll the job
+or follow its event stream. Jobs live in process memory, so every request for
+a job must reach the worker process that created it.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED_STATES = (SUCCEEDED, FAILED)
+
+
+class QueueFullError(Exception):
+    """Raised by JobManager.submit when the job queue is at capacity."""
+
+
+class Job:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = QUEUED
+        self.stage: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[Dict[str, Any]] = None
+        self.status_code = 200
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.events: List[Dict[str, Any]] = []
+        self._changed = threading.Condition()
+
+    def _emit(self, event: str, data: Dict[str, Any]) -> None:
+        with self._changed:
+            self.events.append({"event": event, "data": data})
+            self._changed.notify_all()
+
+    def _finish(self, status: str, event: str, data: Dict[str, Any]) -> None:
+        # Status and final event change together so followers never see a
+        # finished job without its result.
+        with self._changed:
+            self.status = status
+            self.finished_at = time.time()
+            self.events.append({"event": event, "data": data})
+            self._changed.notify_all()
+
+    def set_stage(self, stage: str) -> None:
+        self.stage = stage
+        self._emit("progress", {"status": self.status, "stage": stage})
+
+    def to_dict(self) -> Dict[str, Any]:
+        payload = {"job_id": self.id, "status": self.status, "stage": self.stage}
+        if self.status == SUCCEEDED:
+            payload["result"] = self.result
+        elif self.status == FAILED:
+            payload["error"] = self.error
+        return payload
+
+    def follow(self, start: int = 0, heartbeat: float = 15.0) -> Iterator[Optional[Dict[str, Any]]]:
+        """Yield events from index ``start`` until the job finishes.
+
+        Yields None every ``heartbeat`` seconds without news so streaming
+        responses can keep the connection alive.
+        """
+        index = start
+        while True:
+            with self._changed:
+                if index >= len(self.events) and self.status not in FINISHED_STATES:
+                    self._changed.wait(timeout=heartbeat)
+                pending = self.events[index:]
+                finished = self.status in FINISHED_STATES
+            if not pending and not finished:
+                yield None
+            for event in pending:
+                yield event
+            index += len(pending)
+            if finished and index >= len(self.events):
+                return
+
+
+class JobManager:
+    """Runs jobs on at most ``max_workers`` threads with ``max_queued`` waiting.
+
+    Finished jobs are kept for ``ttl`` seconds so clients can collect results.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queued: int = 32, ttl: float = 600.0):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bill-job")
+        self._jobs: Dict[str, Job] = {}
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[..., Dict[str, Any]], *args, **kwargs) -> Job:
+        """Queue ``fn(*args, progress=callback, **kwargs)``.
+
+        ``fn`` returns the result dict. To fail the job with a specific
+        payload it raises an exception carrying ``payload`` and ``status``
+        attributes (see ``BillProcessingError``); anything else is reported
+        as a 500.
+        """
+        job = Job()
+        with self._lock:
+            self._prune()
+            if self._active >= self.max_workers + self.max_queued:
+                raise QueueFullError("Too many bills are being processed. Please try again shortly.")
+            self._active += 1
+            self._jobs[job.id] = job
+        job._emit("progress", {"status": QUEUED, "stage": None})
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, fn, args, kwargs) -> None:
+        job.status = RUNNING
+        job._emit("progress", {"status": RUNNING, "stage": None})
+        try:
+            job.result = fn(*args, progress=job.set_stage, **kwargs)
+            job._finish(SUCCEEDED, "result", job.result)
+        except Exception as e:
+            job.error = getattr(e, "payload", None) or {"error": f"An unexpected server error occurred: {str(e)}"}
+            job.status_code = getattr(e, "status", 500)
+            job._finish(FAILED, "error", job.error)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,234 @@
+# backend/metrics.py
+"""In-process metrics with Prometheus text exposition.
+
+Counters and histograms live in a ``Registry``; ``registry.render()``
+produces the text format served on ``/metrics``. Components that already
+keep their own statistics (ParseStats, the caches, the model gate) are not
+counted twice: they are registered as collectors whose values are read at
+scrape time.
+
+``stage_timer`` times one pipeline stage into the ``picsplit_stage_seconds``
+histogram and, when a request is being recorded (``begin_request``), into that
+request's timings so they can be logged as one JSON line per request.
+Stages that run on other threads (batches, jobs) only reach the histogram.
+"""
+import contextvars
+import json
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Structured lines go out bare (no level/logger prefix) so log shippers can parse them.
+json_logger = logging.getLogger("picsplit.metrics")
+if not json_logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    json_logger.addHandler(_handler)
+    json_logger.setLevel(logging.INFO)
+    json_logger.propagate = False
+
+PREFIX = "picsplit_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = tuple(float(16 * 1024 * 4 ** power) for power in range(7))  # 16 KiB .. 64 MiB
+
+# One collector sample: (metric name, type, help, [(labels, value), ...]).
+Sample = Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value is None:
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self, **labels) -> Dict[str, float]:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._values.get(key)
+            return {"sum": series[-2], "count": series[-1]} if series else {"sum": 0.0, "count": 0}
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            values = sorted((key, list(series)) for key, series in self._values.items())
+        for key, series in values:
+            labels = dict(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, series):
+                yield f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {_format_value(count)}"
+            yield f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {_format_value(series[-1])}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(series[-2])}"
+            yield f"{self.name}_count{_format_labels(labels)} {_format_value(series[-1])}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            # Re-registering returns the existing metric (module reloads, Streamlit reruns).
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(PREFIX + name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(PREFIX + name, help, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        """Register ``collector()``, called on every scrape, for values kept elsewhere."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                # One broken source must not take down the whole scrape.
+                logger.warning(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {str(e)}")
+                continue
+            for name, kind, help, values in samples:
+                lines.append(f"# HELP {PREFIX}{name} {help}")
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                for labels, value in values:
+                    lines.append(f"{PREFIX}{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram("stage_seconds", "Time spent in each pipeline stage.", ["stage"])
+stage_errors = registry.counter("stage_errors_total", "Pipeline stages that raised.", ["stage"])
+
+
+# --- Per-request timings ---
+_current_request: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("metrics_request", default=None)
+
+
+def begin_request() -> Dict[str, Any]:
+    """Start recording stage timings for the request on this thread."""
+    record = {"stages": {}, "started": time.perf_counter()}
+    _current_request.set(record)
+    return record
+
+
+def end_request() -> Optional[Dict[str, Any]]:
+    record = _current_request.get()
+    _current_request.set(None)
+    return record
+
+
+def annotate(**fields) -> None:
+    """Attach fields (cache result, image size, ...) to the current request's log line."""
+    record = _current_request.get()
+    if record is not None:
+        record.update(fields)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage=stage)
+        record = _current_request.get()
+        if record is not None:
+            stages = record["stages"]
+            # A stage can run more than once per request (e.g. a repair call).
+            stages[stage] = stages.get(stage, 0.0) + elapsed * 1000
+
+
+def observe_stage(stage: str, milliseconds: float) -> None:
+    """Record a stage that was timed elsewhere (e.g. preprocess sub-steps)."""
+    stage_seconds.observe(milliseconds / 1000, stage=stage)
+    record = _current_request.get()
+    if record is not None:
+        record["stages"][stage] = record["stages"].get(stage, 0.0) + milliseconds
+
+
+def log_json(event: str, **fields) -> None:
+    """One structured log line: {"ts": ..., "event": ..., **fields}."""
+    json_logger.info(json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str, separators=(",", ":")))
+# --- End Per-request timings ---
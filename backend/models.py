@@ -0,0 +1,24 @@
+# backend/models.py
+"""Structured-output schema for extracted bills.
+
+Used as the Gemini ``response_schema`` and to validate parsed responses and
+saved bills, by both the Flask backend and the Streamlit app.
+"""
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class BillItem(BaseModel):
+    original_name: str
+    normalized_name: str
+    price_before_tax: float
+    discount_amount: float = 0.0  # Model outputs 0 if no discount exists.
+    emoji: Optional[str] = None
+    category: Optional[str] = None  # "reduced" or "standard" tax rate, when the model can tell
+
+
+class Bill(BaseModel):
+    items: List[BillItem]
+    total_bill: float
+    store: Optional[str] = None
@@ -0,0 +1,174 @@
+# backend/pipeline.py
+"""Bill extraction pipeline shared by the Flask backend and the Streamlit app.
+
+The stages are plain functions so callers can put their own steps between
+them (the backend checks its caches after preprocessing):
+
+    decode -> preprocess -> extract -> normalize -> merge discounts -> dedupe keys
+
+The last three run together in one pass over the items (``iter_normalized_items``).
+
+``run_pipeline`` chains all of them. PIL is only imported once an image is
+decoded, and google-genai only once the Gemini extractor makes a call, so
+importing this module (or the backend) stays cheap.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from itertools import chain
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, Optional
+
+from backend.preprocess import PreprocessedImage, PreprocessOptions, preprocess_image
+from backend.tax_rules import default_engine
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+    from backend.extractors import Extraction, Extractor
+
+logger = logging.getLogger(__name__)
+
+MAX_IMAGE_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", "50000000"))
+# Supermarket discount lines start with this and apply to the item above them.
+DISCOUNT_MARKER = "code128割引"
+
+
+class ImageTooLarge(ValueError):
+    """The image header declares more pixels than we are willing to decode."""
+
+
+def check_pixels(image: Image.Image, max_pixels: int = MAX_IMAGE_PIXELS) -> None:
+    """Reject decompression bombs from the header alone, before any decode."""
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageTooLarge(f"Image is {width}x{height}; at most {max_pixels} pixels are accepted")
+
+
+# --- Stage: decode ---
+_pillow_limit_set = False
+
+
+def _set_pillow_limit() -> None:
+    """Point Pillow's process-wide decompression bomb limit at MAX_IMAGE_PIXELS, once."""
+    global _pillow_limit_set
+    if not _pillow_limit_set:
+        from PIL import Image
+
+        # Pillow itself refuses images over twice this size and warns above it.
+        Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+        _pillow_limit_set = True
+
+
+def decode_image(source, max_pixels: int = MAX_IMAGE_PIXELS) -> Image.Image:
+    """Open (not decode) an image from a path or file object and check its size.
+
+    Pixel data is read lazily by the preprocess stage. ``max_pixels`` is
+    checked per call by ``check_pixels``; Pillow's own limit is left global.
+    """
+    from PIL import Image
+
+    _set_pillow_limit()
+    image = Image.open(source)
+    check_pixels(image, max_pixels)
+    return image
+
+
+# --- Stage: preprocess ---
+def prepare_image(image: Image.Image, input_size: int = 0, options: Optional[PreprocessOptions] = None) -> PreprocessedImage:
+    return preprocess_image(image, input_size, options)
+
+
+# --- Stage: extract ---
+def extract(prepared: PreprocessedImage, extractor: Extractor) -> Extraction:
+    return extractor.extract(prepared)
+
+
+async def extract_async(prepared: PreprocessedImage, extractor: Extractor) -> Extraction:
+    return await extractor.aextract(prepared)
+
+
+# --- Stages: normalize -> merge discounts -> dedupe keys ---
+def iter_normalized_items(
+    items: Iterable[Dict[str, Any]],
+    store: Optional[str] = None,
+    minor_units: int = 100,
+) -> Iterator[Dict[str, Any]]:
+    """Normalize model items in a single pass.
+
+    For each item, in one traversal:
+
+    * fill defaults (``normalized_name`` from ``original_name``, a missing
+      ``discount_amount`` becomes 0),
+    * fold a code128割引 discount line into the item immediately above it; the
+      discount is the line's ``discount_amount`` when set, otherwise the
+      magnitude of its price (models and OCR report the line either way),
+    * make ``normalized_name`` unique by suffixing " 1", " 2", ... to repeated
+      names,
+    * add ``price_minor`` / ``discount_minor`` in integer minor units and
+      resolve ``tax_rate``.
+
+    An item is held back only until the next one shows whether it is a
+    discount line. When a name repeats, its first occurrence (already
+    yielded) is renamed in place to "<name> 1", so names are final once the
+    generator is exhausted.
+    """
+    tax_rate = default_engine().rate
+    counts: Dict[str, int] = {}
+    firsts: Dict[str, Dict[str, Any]] = {}
+    pending = None
+    # A trailing None flushes the last held-back item through the same path.
+    for item in chain(items, (None,)):
+        if item is None:
+            done, pending = pending, None
+            if done is None:
+                break
+        else:
+            original_name = item.get("original_name", "")
+            if "normalized_name" not in item:
+                item["normalized_name"] = original_name
+            if item.get("discount_amount") is None:
+                item["discount_amount"] = 0.0
+            if pending is None:
+                pending = item
+                continue
+            if DISCOUNT_MARKER in original_name.lower():
+                discount_value = item["discount_amount"] or item.get("price_before_tax", 0.0)
+                try:
+                    pending["discount_amount"] = abs(float(discount_value))
+                except (ValueError, TypeError):
+                    logger.warning(f"Could not parse discount amount ({discount_value}) for item {pending.get('original_name', 'N/A')}. Setting discount to 0.")
+                    pending["discount_amount"] = 0.0
+                done, pending = pending, None
+            else:
+                done, pending = pending, item
+
+        name = done["normalized_name"]
+        count = counts.get(name, 0) + 1
+        counts[name] = count
+        if count == 1:
+            firsts[name] = done
+        else:
+            if count == 2:
+                first = firsts.pop(name)
+                first["normalized_name"] = f"{name} 1"
+                first["tax_rate"] = tax_rate(first["normalized_name"], first.get("category"), store)
+            done["normalized_name"] = name = f"{name} {count}"
+        # round() of a float is already an int.
+        done["price_minor"] = round(float(done.get("price_before_tax") or 0) * minor_units)
+        done["discount_minor"] = round(float(done["discount_amount"] or 0) * minor_units)
+        done["tax_rate"] = tax_rate(name, done.get("category"), store)
+        yield done
+
+
+def finalize_bill(bill_data: Dict[str, Any], minor_units: int = 100) -> Dict[str, Any]:
+    """Normalize, merge discounts, dedupe keys and resolve tax rates in one pass."""
+    bill_data["items"] = list(iter_normalized_items(bill_data.get("items", []), bill_data.get("store"), minor_units))
+    return bill_data
+
+
+def run_pipeline(source, extractor: Extractor, input_size: int = 0,
+                 options: Optional[PreprocessOptions] = None) -> Dict[str, Any]:
+    """Run every stage on one image (a path or file object) and return the bill dict."""
+    prepared = prepare_image(decode_image(source), input_size, options)
+    return finalize_bill(extract(prepared, extractor).bill)
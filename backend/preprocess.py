@@ -0,0 +1,179 @@
+# backend/preprocess.py
+"""Image preprocessing shared by the Flask backend and the Streamlit app.
+
+Phone photos of receipts are typically 4000px / 5MB, far more than the model
+needs to read printed text. Before upload we:
+
+1. decode JPEGs at reduced scale with ``Image.draft`` (DCT scaling is much
+   cheaper than a full decode followed by a resize),
+2. apply the EXIF orientation,
+3. convert to grayscale,
+4. crop to the bright paper region,
+5. stretch contrast, and
+6. downscale to a configurable longest edge and re-encode as JPEG.
+"""
+from __future__ import annotations
+
+import io
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Side length of the thumbnail used to locate the receipt.
+_CROP_PROBE_SIZE = 256
+# Ignore crops that would keep almost everything or almost nothing.
+_MIN_CROP_AREA = 0.15
+_MAX_CROP_AREA = 0.95
+_CROP_MARGIN = 0.02
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off", "")
+
+
+@dataclass(frozen=True)
+class PreprocessOptions:
+    max_edge: int = 1600
+    grayscale: bool = True
+    autocrop: bool = True
+    autocontrast: bool = True
+    jpeg_quality: int = 85
+
+    @classmethod
+    def from_env(cls) -> "PreprocessOptions":
+        return cls(
+            max_edge=int(os.getenv("PREPROCESS_MAX_EDGE", cls.max_edge)),
+            grayscale=_env_flag("PREPROCESS_GRAYSCALE", cls.grayscale),
+            autocrop=_env_flag("PREPROCESS_AUTOCROP", cls.autocrop),
+            autocontrast=_env_flag("PREPROCESS_AUTOCONTRAST", cls.autocontrast),
+            jpeg_quality=int(os.getenv("PREPROCESS_JPEG_QUALITY", cls.jpeg_quality)),
+        )
+
+
+@dataclass
+class PreprocessedImage:
+    image: Image.Image
+    data: bytes
+    mime_type: str
+    stats: Dict[str, Any] = field(default_factory=dict)
+
+
+def _otsu_threshold(histogram) -> int:
+    total = sum(histogram)
+    weighted_total = sum(i * count for i, count in enumerate(histogram))
+    background, weighted_background = 0, 0.0
+    best_threshold, best_variance = 0, -1.0
+    for level, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        weighted_background += level * count
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = level, variance
+    return best_threshold
+
+
+def find_receipt_box(image: Image.Image):
+    """Return the bounding box of the bright paper region, or None.
+
+    Works on a small thumbnail: Otsu-threshold the luminance, erode away
+    specks and glare, and take the bounding box of what remains.
+    """
+    from PIL import ImageFilter
+
+    probe = image.convert("L")
+    probe.thumbnail((_CROP_PROBE_SIZE, _CROP_PROBE_SIZE))
+    threshold = _otsu_threshold(probe.histogram())
+    mask = probe.point(lambda p: 255 if p > threshold else 0).filter(ImageFilter.MinFilter(5))
+    box = mask.getbbox()
+    if box is None:
+        return None
+    scale_x = image.width / probe.width
+    scale_y = image.height / probe.height
+    left, top, right, bottom = box
+    area = ((right - left) * (bottom - top)) / float(probe.width * probe.height)
+    if not _MIN_CROP_AREA <= area <= _MAX_CROP_AREA:
+        return None
+    margin_x = image.width * _CROP_MARGIN
+    margin_y = image.height * _CROP_MARGIN
+    return (
+        max(0, int(left * scale_x - margin_x)),
+        max(0, int(top * scale_y - margin_y)),
+        min(image.width, int(math.ceil(right * scale_x + margin_x))),
+        min(image.height, int(math.ceil(bottom * scale_y + margin_y))),
+    )
+
+
+def preprocess_image(image: Image.Image, input_size: int = 0, options: PreprocessOptions = None) -> PreprocessedImage:
+    """Shrink and clean up a freshly opened (not yet loaded) image for the model.
+
+    ``input_size`` is the size of the uploaded file in bytes and is only used
+    for reporting how much the preprocessing saved.
+    """
+    from PIL import Image, ImageOps
+
+    options = options or PreprocessOptions()
+    stats: Dict[str, Any] = {"input_bytes": input_size, "input_size": image.size}
+
+    started = time.perf_counter()
+    if image.format == "JPEG":
+        # Ask the decoder for the smallest DCT scale that still covers max_edge,
+        # with headroom for the crop when the receipt fills only part of the photo.
+        target_edge = options.max_edge * (2 if options.autocrop else 1)
+        ratio = min(1.0, target_edge / float(max(image.size)))
+        requested = (int(math.ceil(image.width * ratio)), int(math.ceil(image.height * ratio)))
+        image.draft("L" if options.grayscale else "RGB", requested)
+    image.load()
+    stats["decoded_size"] = image.size
+    stats["decode_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    image = ImageOps.exif_transpose(image)
+    if options.grayscale:
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if options.autocrop:
+        box = find_receipt_box(image)
+        if box is not None:
+            image = image.crop(box)
+            stats["crop_box"] = box
+    if options.autocontrast:
+        image = ImageOps.autocontrast(image, cutoff=1)
+    if max(image.size) > options.max_edge:
+        image.thumbnail((options.max_edge, options.max_edge), Image.Resampling.LANCZOS)
+    stats["output_size"] = image.size
+    stats["transform_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=options.jpeg_quality, optimize=True)
+    data = buffer.getvalue()
+    stats["encode_ms"] = (time.perf_counter() - started) * 1000
+    stats["output_bytes"] = len(data)
+    stats["bytes_saved"] = input_size - len(data) if input_size else None
+
+    logger.info(
+        "Preprocessed image %sx%s (%s bytes) -> %sx%s (%s bytes); decode %.1fms, transform %.1fms, encode %.1fms",
+        stats["input_size"][0], stats["input_size"][1], input_size or "?",
+        stats["output_size"][0], stats["output_size"][1], len(data),
+        stats["decode_ms"], stats["transform_ms"], stats["encode_ms"],
+    )
+    return PreprocessedImage(image=image, data=data, mime_type="image/jpeg", stats=stats)
@@ -0,0 +1,373 @@
+# backend/ratelimit.py
+"""Admission control in front of the Gemini model.
+
+* ``SingleFlight`` coalesces concurrent extractions of the same image (keyed
+  by the upload digest's cache key) onto one in-flight call; the callers that
+  arrive while it runs wait for its result instead of calling the model again.
+* ``TokenBucket`` limits model calls to a steady rate with bursts. Callers
+  that find the bucket empty wait their turn, but only up to ``max_waiters``
+  of them and only up to ``max_wait`` seconds; beyond that ``RateLimited`` is
+  raised at once so the endpoint can answer 503 with Retry-After instead of
+  piling up threads.
+* ``retry_with_backoff`` retries calls the model rejected with 429 / 503,
+  sleeping an exponentially growing, fully jittered delay in between.
+
+``ModelGate`` combines the bucket and the retries; ``make_gate_from_env``
+builds it from the MODEL_* environment variables. Each piece has an async
+variant for the ASGI server (``backend/asgi.py``); a bucket shared by both
+keeps one rate across sync and async callers.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses after which the same request may succeed later.
+RETRYABLE_STATUSES = (429, 503)
+
+
+class RateLimited(Exception):
+    """The call was not attempted (queue full) or kept being rejected (429/503)."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# --- Single flight ---
+class SingleFlight:
+    """Run at most one ``fn`` per key at a time; concurrent callers share its outcome."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return ``(result, shared)``; ``shared`` is True if another caller ran ``fn``.
+
+        Exceptions from ``fn`` are raised in every caller waiting on it.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            # Later callers start a fresh call (and usually hit the cache).
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # shield: a cancelled follower must not cancel the shared call.
+            return await asyncio.shield(future), True
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited failure doesn't log "never retrieved".
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+# --- End Single flight ---
+
+
+# --- Token bucket ---
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``burst``.
+
+    Each ``acquire`` reserves the next token: if none is available the caller
+    sleeps until its reserved token has refilled, so waiters are served in
+    arrival order without a condition variable.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, max_waiters: int = 32, max_wait: float = 10.0,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_waiters = max_waiters
+        self.max_wait = max_wait
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._waiters = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self) -> float:
+        """Reserve the next token; returns the delay until it is ours (0 if available now)."""
+        with self._lock:
+            self._refill(self._clock())
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            delay = -self._tokens / self.rate
+            if self._waiters >= self.max_waiters or delay > self.max_wait:
+                self._tokens += 1
+                self.rejected += 1
+                raise RateLimited("Too many bills are being processed. Please try again shortly.", retry_after=delay)
+            self._waiters += 1
+            return delay
+
+    def _done_waiting(self) -> None:
+        with self._lock:
+            self._waiters -= 1
+
+    def acquire(self) -> float:
+        """Take a token, waiting if needed; returns the seconds waited.
+
+        Raises RateLimited without waiting when ``max_waiters`` callers are
+        already queued or the wait would exceed ``max_wait``.
+        """
+        delay = self._reserve()
+        if delay:
+            try:
+                self._sleep(delay)
+            finally:
+                self._done_waiting()
+        return delay
+
+    async def acquire_async(self) -> float:
+        """``acquire`` that waits on the event loop instead of blocking a thread."""
+        delay = self._reserve()
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self._done_waiting()
+        return delay
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill(self._clock())
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "tokens": max(0.0, self._tokens),
+                "waiting": self._waiters,
+                "max_waiters": self.max_waiters,
+                "rejected": self.rejected,
+            }
+# --- End Token bucket ---
+
+
+# --- Retries ---
+def error_status(error: BaseException) -> Optional[int]:
+    """HTTP status of a failed model call (google.genai APIError carries ``code``)."""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def retry_after_hint(error: BaseException) -> Optional[float]:
+    """Seconds from the Retry-After header of the rejected response, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    return error_status(error) in RETRYABLE_STATUSES
+
+
+def backoff_delay(attempt: int, base: float, cap: float, rng: random.Random = random) -> float:
+    """Full jitter: uniform in [0, min(cap, base * 2**attempt)]."""
+    return rng.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_with_backoff(fn: Callable[[], Any], retries: int = 3, base: float = 0.5, cap: float = 8.0,
+                       retryable: Callable[[BaseException], bool] = is_retryable,
+                       sleep: Callable[[float], None] = time.sleep, before_attempt: Callable[[], Any] = None):
+    """Call ``fn`` up to ``retries + 1`` times while it fails with a retryable error.
+
+    The delay is the larger of the jittered backoff and the server's
+    Retry-After. When every attempt was rejected, raises RateLimited from the
+    last error. ``before_attempt`` runs before each attempt (e.g. to take a
+    rate-limit token).
+    """
+    if retries < 0:
+        raise ValueError("retries must be non-negative")
+    for attempt in range(retries + 1):
+        if before_attempt is not None:
+            before_attempt()
+        try:
+            return fn()
+        except Exception as e:
+            if not retryable(e):
+                raise
+            sleep(_retry_delay(e, attempt, retries, base, cap))
+
+
+async def retry_with_backoff_async(fn: Callable[[], Awaitable[Any]], retries: int = 3, base: float = 0.5, cap: float = 8.0,
+                                   retryable: Callable[[BaseException], bool] = is_retryable,
+                                   before_attempt: Callable[[], Awaitable[Any]] = None):
+    """``retry_with_backoff`` for coroutines; the waits don't block the event loop."""
+    if retries < 0:
+        raise ValueError("retries must be non-negative")
+    for attempt in range(retries + 1):
+        if before_attempt is not None:
+            await before_attempt()
+        try:
+            return await fn()
+        except Exception as e:
+            if not retryable(e):
+                raise
+            await asyncio.sleep(_retry_delay(e, attempt, retries, base, cap))
+
+
+def _retry_delay(error: BaseException, attempt: int, retries: int, base: float, cap: float) -> float:
+    """Delay before the next attempt; raises RateLimited from ``error`` after the last one."""
+    delay = max(backoff_delay(attempt, base, cap), retry_after_hint(error) or 0.0)
+    if attempt == retries:
+        raise RateLimited(f"AI model is busy (HTTP {error_status(error)}). Please try again shortly.",
+                          retry_after=max(delay, base)) from error
+    logger.warning(f"Model call rejected with HTTP {error_status(error)}; retry {attempt + 1}/{retries} in {delay:.2f}s")
+    return delay
+# --- End Retries ---
+
+
+class ModelGate:
+    """Rate-limits and retries model calls: ``gate.call(fn)``.
+
+    ``bucket`` may be None to only retry. Every attempt, retries included,
+    takes a token, so backing off never exceeds the configured rate.
+    """
+
+    def __init__(self, bucket: Optional[TokenBucket] = None, retries: int = 3, base: float = 0.5, cap: float = 8.0):
+        if retries < 0:
+            raise ValueError("retries must be non-negative")
+        self.bucket = bucket
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+        self.retried = 0
+        self.exhausted = 0
+        # Request threads, job workers and the event loop all finish calls here.
+        self._lock = threading.Lock()
+
+    def _record(self, attempts: int, exhausted: bool) -> None:
+        with self._lock:
+            self.retried += max(0, attempts - 1)
+            if exhausted:
+                self.exhausted += 1
+
+    def call(self, fn: Callable[[], Any]):
+        attempts = 0
+
+        def take_token():
+            nonlocal attempts
+            attempts += 1
+            if self.bucket is not None:
+                self.bucket.acquire()
+
+        exhausted = False
+        try:
+            return retry_with_backoff(fn, self.retries, self.base, self.cap, before_attempt=take_token)
+        except RateLimited as e:
+            exhausted = e.__cause__ is not None
+            raise
+        finally:
+            self._record(attempts, exhausted)
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]]):
+        """``call`` for coroutine functions."""
+        attempts = 0
+
+        async def take_token():
+            nonlocal attempts
+            attempts += 1
+            if self.bucket is not None:
+                await self.bucket.acquire_async()
+
+        exhausted = False
+        try:
+            return await retry_with_backoff_async(fn, self.retries, self.base, self.cap, before_attempt=take_token)
+        except RateLimited as e:
+            exhausted = e.__cause__ is not None
+            raise
+        finally:
+            self._record(attempts, exhausted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            retried, exhausted = self.retried, self.exhausted
+        return {
+            "bucket": self.bucket.stats() if self.bucket is not None else None,
+            "retries": self.retries,
+            "retried": retried,
+            "exhausted": exhausted,
+        }
+
+
+def make_gate_from_env() -> ModelGate:
+    """MODEL_RATE_LIMIT (calls/s, 0 disables), MODEL_BURST, MODEL_QUEUE_SIZE,
+    MODEL_MAX_WAIT, MODEL_RETRIES, MODEL_BACKOFF_BASE, MODEL_BACKOFF_CAP."""
+    rate = float(os.getenv("MODEL_RATE_LIMIT", "2"))
+    bucket = None
+    if rate > 0:
+        bucket = TokenBucket(
+            rate,
+            burst=int(os.getenv("MODEL_BURST", "4")),
+            max_waiters=int(os.getenv("MODEL_QUEUE_SIZE", "16")),
+            max_wait=float(os.getenv("MODEL_MAX_WAIT", "15")),
+        )
+    return ModelGate(
+        bucket,
+        retries=int(os.getenv("MODEL_RETRIES", "3")),
+        base=float(os.getenv("MODEL_BACKOFF_BASE", "0.5")),
+        cap=float(os.getenv("MODEL_BACKOFF_CAP", "8")),
+    )
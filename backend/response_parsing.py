@@ -0,0 +1,137 @@
+# backend/response_parsing.py
+"""Turning Gemini responses into validated bills.
+
+In structured mode the model is constrained by ``response_schema`` and the
+SDK validates the JSON straight into the pydantic model (``response.parsed``),
+so there is no fence stripping and no second parse. When that fails, cheaper
+paths are tried before giving up:
+
+1. ``local_repair``: strip code fences, trailing commas and anything after
+   the outermost object, then validate the text again;
+2. ``model_repair``: send only the broken JSON text (no image) back to a
+   smaller model, asking for a schema-conforming copy.
+
+``ParseStats`` counts how often each path is taken and the time spent
+parsing, to show how many full re-extractions are being avoided.
+"""
+import json
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Type
+
+from pydantic import BaseModel
+
+STRUCTURED = "structured"
+TEXT = "text"
+LOCAL_REPAIR = "local_repair"
+MODEL_REPAIR = "model_repair"
+FAILED = "failed"
+
+REPAIR_PROMPT = """
+The following text was meant to be a JSON object matching the given JSON schema, but it is malformed or does not match it.
+Return the corrected JSON object only. Do not invent items that are not present in the text.
+
+Schema:
+{schema}
+
+Text:
+{text}
+"""
+
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+class ParseError(Exception):
+    """Raised when no parse path produced a valid bill."""
+
+    def __init__(self, message: str, raw_text: str = ""):
+        super().__init__(message)
+        self.raw_text = raw_text
+
+
+class ParseStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {STRUCTURED: 0, TEXT: 0, LOCAL_REPAIR: 0, MODEL_REPAIR: 0, FAILED: 0}
+        self.parse_seconds = 0.0
+
+    def record(self, path: str, seconds: float) -> None:
+        with self._lock:
+            self.counts[path] += 1
+            self.parse_seconds += seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.counts.values())
+            return {
+                "paths": dict(self.counts),
+                "parses": total,
+                "mean_parse_ms": (self.parse_seconds * 1000 / total) if total else 0.0,
+            }
+
+
+def strip_fences(text: str) -> str:
+    # Same fence handling the text mode has always used.
+    if "```json" in text:
+        return text.split("```json")[1].split("```")[0].strip()
+    if "```" in text:
+        return text.split("```")[1].strip()
+    return text.strip()
+
+
+def repair_json_text(text: str) -> str:
+    text = strip_fences(text)
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        text = text[start:end + 1]
+    return _TRAILING_COMMA.sub(r"\1", text)
+
+
+def parse_bill_response(
+    response,
+    model: Type[BaseModel],
+    stats: ParseStats,
+    structured: bool = True,
+    repair_with_model: Optional[Callable[[str], Any]] = None,
+) -> Dict[str, Any]:
+    """Return the bill dict from a generate_content response.
+
+    ``repair_with_model(prompt)`` should return a structured-mode response
+    for a text-only repair request; if None, the model repair path is skipped.
+    """
+    started = time.perf_counter()
+    parsed = getattr(response, "parsed", None) if structured else None
+    if isinstance(parsed, model):
+        stats.record(STRUCTURED, time.perf_counter() - started)
+        return parsed.model_dump()
+
+    text = getattr(response, "text", None) or ""
+    try:
+        if structured:
+            bill = model.model_validate_json(repair_json_text(text))
+            path = LOCAL_REPAIR
+        else:
+            bill = model.model_validate_json(strip_fences(text))
+            path = TEXT
+        stats.record(path, time.perf_counter() - started)
+        return bill.model_dump()
+    except ValueError as e:
+        error = e
+
+    if repair_with_model is not None and text:
+        try:
+            repaired = repair_with_model(REPAIR_PROMPT.format(
+                schema=json.dumps(model.model_json_schema()),
+                text=text,
+            ))
+            parsed = getattr(repaired, "parsed", None)
+            if not isinstance(parsed, model):
+                parsed = model.model_validate_json(repair_json_text(getattr(repaired, "text", None) or ""))
+            stats.record(MODEL_REPAIR, time.perf_counter() - started)
+            return parsed.model_dump()
+        except Exception as e:
+            error = e
+
+    stats.record(FAILED, time.perf_counter() - started)
+    raise ParseError(str(error), raw_text=text)
@@ -0,0 +1,172 @@
+# backend/resumable.py
+"""Chunked, resumable uploads for large receipt photos.
+
+Over a flaky cellular connection a single multi-megabyte POST fails as a
+whole. Instead the client:
+
+1. ``POST /api/uploads`` with the total ``size`` (and optionally the
+   ``sha256`` of the file) to open a session;
+2. ``PUT /api/uploads/<id>`` each chunk in order, with its starting byte in
+   the ``Upload-Offset`` header. After a dropped connection it asks
+   ``GET /api/uploads/<id>`` for the offset the server has and carries on
+   from there;
+3. ``POST /api/uploads/<id>/process`` once every byte has arrived, which
+   answers exactly like ``/api/process-bill``.
+
+Chunks are appended to an ``UploadSpool`` as they stream in, so the file is
+hashed, size-checked and (past ``UPLOAD_SPOOL_MEMORY``) spooled to disk
+incrementally; nothing is reassembled at the end. Sessions live in process
+memory, like jobs, and expire after ``ttl`` seconds without activity.
+"""
+import re
+import threading
+import time
+import uuid
+from typing import Any, BinaryIO, Dict, Optional
+
+from backend.uploads import MAX_UPLOAD_BYTES, UploadSpool, UploadTooLarge
+
+READ_CHUNK_BYTES = 64 * 1024
+_SHA256_HEX = re.compile(r"[0-9a-fA-F]{64}")
+
+
+class UploadSessionError(Exception):
+    """A rejected session request, with the HTTP status and the offset the server holds."""
+
+    def __init__(self, message: str, status: int = 400, offset: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+    def to_dict(self) -> Dict[str, Any]:
+        payload = {"error": str(self)}
+        if self.offset is not None:
+            payload["offset"] = self.offset
+        return payload
+
+
+class UploadSession:
+    def __init__(self, size: int, content_type: Optional[str] = None, sha256: Optional[str] = None,
+                 max_bytes: int = MAX_UPLOAD_BYTES):
+        self.id = uuid.uuid4().hex
+        self.size = size
+        self.content_type = content_type
+        self.sha256 = sha256.lower() if sha256 else None
+        self.spool = UploadSpool(max_bytes=max_bytes)
+        self.updated_at = time.monotonic()
+        # Held while a chunk is written, the upload is processed or the session
+        # is closed; never waited on. Holders check ``closed`` once they have it.
+        self.busy = threading.Lock()
+        self.closed = False
+
+    @property
+    def offset(self) -> int:
+        return self.spool.size
+
+    @property
+    def complete(self) -> bool:
+        return self.offset == self.size
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"upload_id": self.id, "offset": self.offset, "size": self.size, "complete": self.complete}
+
+    def append(self, offset: int, stream: BinaryIO, length: Optional[int]) -> None:
+        """Append one chunk read from ``stream``; it must start at the current offset."""
+        if offset != self.offset:
+            raise UploadSessionError("Chunk does not start at the current upload offset.", status=409, offset=self.offset)
+        remaining = self.size - self.offset
+        if length is None:
+            raise UploadSessionError("Chunks need a Content-Length.", status=411, offset=self.offset)
+        if length > remaining:
+            raise UploadSessionError(f"Chunk of {length} bytes overruns the declared size ({remaining} bytes left).",
+                                     status=413, offset=self.offset)
+        self.spool.seek(0, 2)
+        while length > 0:
+            data = stream.read(min(READ_CHUNK_BYTES, length))
+            if not data:
+                break
+            # A dropped connection keeps the bytes already written; the client
+            # resumes from the offset it reads back.
+            self.spool.write(data)
+            length -= len(data)
+        self.updated_at = time.monotonic()
+
+    def finish(self) -> UploadSpool:
+        """The assembled upload, rewound; checks it is complete and matches its sha256."""
+        if not self.complete:
+            raise UploadSessionError(f"Upload incomplete: {self.offset} of {self.size} bytes received.",
+                                     status=409, offset=self.offset)
+        if self.sha256 and self.spool.digest != self.sha256:
+            raise UploadSessionError("Uploaded bytes do not match the declared sha256.", status=422, offset=self.offset)
+        self.spool.seek(0)
+        return self.spool
+
+    def close(self) -> None:
+        self.closed = True
+        self.spool.close()
+
+
+class UploadSessionStore:
+    """At most ``max_sessions`` open sessions, each dropped after ``ttl`` idle seconds."""
+
+    def __init__(self, max_sessions: int = 64, ttl: float = 900.0, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sessions: Dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.completed = 0
+        self.expired = 0
+
+    def create(self, size: int, content_type: Optional[str] = None, sha256: Optional[str] = None) -> UploadSession:
+        if size <= 0:
+            raise UploadSessionError("Upload size must be a positive number of bytes.")
+        if size > self.max_bytes:
+            raise UploadSessionError(UploadTooLarge.description, status=413)
+        if sha256 is not None and not (isinstance(sha256, str) and _SHA256_HEX.fullmatch(sha256)):
+            raise UploadSessionError("sha256 must be 64 hex digits.")
+        with self._lock:
+            self._prune()
+            if len(self._sessions) >= self.max_sessions:
+                raise UploadSessionError("Too many uploads in progress. Please try again shortly.", status=503)
+            session = UploadSession(size, content_type, sha256, self.max_bytes)
+            self._sessions[session.id] = session
+            self.created += 1
+        return session
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        with self._lock:
+            self._prune()
+            return self._sessions.get(upload_id)
+
+    def remove(self, upload_id: str, completed: bool = False) -> None:
+        """Drop and close a session; the caller holds its ``busy`` lock."""
+        with self._lock:
+            session = self._sessions.pop(upload_id, None)
+            if session is not None and completed:
+                self.completed += 1
+        if session is not None:
+            session.close()
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self.ttl
+        expired = [session for session in self._sessions.values()
+                   if session.updated_at < cutoff and session.busy.acquire(blocking=False)]
+        for session in expired:
+            del self._sessions[session.id]
+            try:
+                session.close()
+            finally:
+                session.busy.release()
+        self.expired += len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "open": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "created": self.created,
+                "completed": self.completed,
+                "expired": self.expired,
+            }
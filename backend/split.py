@@ -0,0 +1,229 @@
+# backend/split.py
+"""Exact split engine shared by the Flask backend and the Streamlit app.
+
+Allocations are read as an items x people share matrix (one row of
+{person: share} per item) and every person's total is accumulated in one pass
+over it using integer arithmetic only:
+
+* prices and discounts are converted to integer minor units (cents, or yen
+  with ``minor_units=1``),
+* each item's effective cost is ``price * (1 + tax) - discount``, kept as an
+  exact integer numerator over the tax-rate denominator,
+* shares are fractions, so each cell contributes ``cost * share / quantity``,
+  which is scaled onto one common denominator for the whole bill.
+
+The exact totals are then rounded with the largest-remainder method so the
+per-person amounts always add up to the bill total.
+"""
+import math
+from collections import Counter
+from dataclasses import dataclass, field
+from fractions import Fraction
+from functools import lru_cache
+from itertools import repeat
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from backend.tax_rules import get_tax_rate
+
+
+@lru_cache(maxsize=4096)
+def parse_share(share: str) -> Tuple[int, int]:
+    """Parse a share such as "1/3", "0.5" or "2" into (numerator, denominator).
+
+    Unparseable input counts as 0.
+    Memoized: a bill uses a handful of distinct share strings many times over.
+    """
+    try:
+        value = Fraction(str(share).strip() or "0")
+    except (ValueError, ZeroDivisionError):
+        return 0, 1
+    return value.numerator, value.denominator
+
+
+@lru_cache(maxsize=64)
+def _rate_multiplier(rate: float) -> Tuple[int, int]:
+    # 0.08 -> (108, 100): exact (1 + rate) as a fraction.
+    multiplier = 1 + Fraction(str(rate))
+    return multiplier.numerator, multiplier.denominator
+
+
+def check_minor_units(minor_units: Any) -> int:
+    """``minor_units`` if it is a positive integer (100 for cents, 1 for yen); raises ValueError otherwise."""
+    if isinstance(minor_units, bool) or not isinstance(minor_units, int) or minor_units <= 0:
+        raise ValueError(f"minor_units must be a positive integer, not {minor_units!r}")
+    return minor_units
+
+
+def to_minor_units(amount: Any, minor_units: int) -> int:
+    return int(round(float(amount or 0) * minor_units))
+
+
+@dataclass
+class SplitResult:
+    totals: Dict[str, float]
+    totals_minor: Dict[str, int]
+    errors: List[str] = field(default_factory=list)
+    # Amount (minor units) spread over people to reach total_bill beyond the
+    # sum of the item prices; non-zero when the receipt total and items differ.
+    adjustment_minor: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "totals": self.totals,
+            "totals_minor": self.totals_minor,
+            "errors": self.errors,
+            "adjustment_minor": self.adjustment_minor,
+        }
+
+
+def _allocation_fields(allocation: Mapping[str, Any]):
+    # Streamlit uses total_quantity; the React frontend sends totalQuantity.
+    quantity = allocation.get("total_quantity", allocation.get("totalQuantity", 0))
+    return quantity, allocation.get("shares", {})
+
+
+def largest_remainder(numerators: Sequence[int], denominator: int, total: int) -> List[int]:
+    """Round the exact amounts ``numerators[i] / denominator`` to integers summing to ``total``.
+
+    Any difference between ``total`` and the exact sum (a receipt total that
+    differs from the item prices) is spread first: in proportion to the
+    amounts when they all have the same sign, equally otherwise. Each amount
+    is then floored and the leftover units go to the largest remainders, so
+    every part is within one unit of its exact value. All-zero amounts stay
+    zero.
+    """
+    if not any(numerators):
+        return [0] * len(numerators)
+    exact_sum = sum(numerators)
+    if exact_sum == total * denominator:
+        scaled, divisor = numerators, denominator
+    elif exact_sum and (min(numerators) >= 0 or max(numerators) <= 0):
+        # Proportional: part i is total * n_i / sum(n).
+        sign = 1 if exact_sum > 0 else -1
+        scaled, divisor = [sign * total * n for n in numerators], sign * exact_sum
+    else:
+        # Mixed signs have no meaningful proportion: everyone gets an equal part of the gap.
+        count = len(numerators)
+        gap = total * denominator - exact_sum
+        scaled, divisor = [n * count + gap for n in numerators], denominator * count
+    parts, remainders = [], []
+    for index, numerator in enumerate(scaled):
+        part, remainder = divmod(numerator, divisor)
+        parts.append(part)
+        remainders.append((remainder, -index))
+    leftover = total - sum(parts)
+    for _, negative_index in sorted(remainders, reverse=True)[:leftover]:
+        parts[-negative_index] += 1
+    return parts
+
+
+def compute_split(
+    items: Sequence[Mapping[str, Any]],
+    allocations: Mapping[str, Mapping[str, Any]],
+    people: Sequence[str],
+    tax_rate: Optional[Callable[[str], float]] = None,
+    total_bill: Optional[float] = None,
+    minor_units: int = 100,
+    store: Optional[str] = None,
+) -> SplitResult:
+    """Compute what each person owes.
+
+    ``allocations`` maps an item's normalized_name to its total quantity and
+    a {person: share} dict. Items with a non-positive quantity are skipped.
+    Items whose shares don't add up to the quantity are reported in
+    ``errors``. When ``total_bill`` is given, the rounded totals add up to it
+    exactly; otherwise they add up to the rounded sum of the item costs.
+
+    Tax rates come from ``tax_rate(name)`` if given, otherwise from the tax
+    rule engine using the item's name and category and the bill's ``store``.
+    """
+    check_minor_units(minor_units)
+    errors: List[str] = []
+    missing = repeat("0")
+
+    # Pass 1 builds the share matrix: one row per allocated item, with the
+    # shares aligned to ``people``. Parsing and the quantity check work per
+    # distinct share value rather than per cell, since a row of 100 people
+    # typically holds two or three distinct strings ("0", "1/3").
+    rows = []
+    denominators = set()
+    for item in items:
+        name = item.get("normalized_name")
+        quantity, shares = _allocation_fields(allocations.get(name, {}))
+        quantity = int(quantity or 0)
+        if quantity <= 0:
+            if any(parse_share(share)[0] for share in set(shares.values())):
+                errors.append(f"Allocation error for '{name}': Shares are allocated but the quantity is {quantity}.")
+            continue
+        rate = tax_rate(name) if tax_rate is not None else get_tax_rate(name, item.get("category"), store)
+        rate_num, rate_den = _rate_multiplier(rate)
+        cost_num = (
+            to_minor_units(item.get("price_before_tax"), minor_units) * rate_num
+            - to_minor_units(item.get("discount_amount"), minor_units) * rate_den
+        )
+        row_den = rate_den * quantity
+        # Clients send a share for every person in ``people`` order; then the
+        # values already are the aligned row.
+        values = list(shares.values())
+        row = values if len(values) == len(people) and list(shares) == people else list(map(shares.get, people, missing))
+        parsed = {share: parse_share(share) for share in set(row)}
+        # list.count is fastest for the usual two or three distinct shares (the
+        # last count is whatever the others leave); Counter wins once rows get
+        # more varied.
+        if len(parsed) > 3:
+            counts = Counter(row)
+        else:
+            distinct = list(parsed)
+            counts = {share: row.count(share) for share in distinct[:-1]}
+            if distinct:
+                counts[distinct[-1]] = len(row) - sum(counts.values())
+        row_lcm = math.lcm(*(d for n, d in parsed.values()))
+        allocated = sum(n * counts[share] * (row_lcm // d) for share, (n, d) in parsed.items() if n)
+        if allocated != quantity * row_lcm:
+            total_allocated = Fraction(allocated, row_lcm)
+            errors.append(
+                f"Allocation error for '{name}': Total allocated is {float(total_allocated):.2f} but should equal {quantity}."
+            )
+        denominators.update(row_den * d for n, d in parsed.values() if n)
+        rows.append((cost_num, row_den, row, parsed, counts))
+
+    # Pass 2: turn every share into an exact integer weight over one common
+    # denominator and sum the matrix by column. Each row's most common share
+    # (usually "0", or the one share everybody has) is added once to a
+    # bill-wide base that every person gets; only the cells holding another
+    # share are visited, located with list.index, which scans in C.
+    common = math.lcm(*denominators) if denominators else 1
+    base = 0
+    accumulated = [0] * len(people)
+    for cost_num, row_den, row, parsed, counts in rows:
+        if not row:
+            continue
+        weights = {
+            share: (n * cost_num * (common // (row_den * d)) if n else 0)
+            for share, (n, d) in parsed.items()
+        }
+        row_base = max(counts, key=counts.__getitem__)
+        base_weight = weights[row_base]
+        base += base_weight
+        for share, count in counts.items():
+            if share == row_base:
+                continue
+            delta = weights[share] - base_weight
+            index = -1
+            for _ in range(count):
+                index = row.index(share, index + 1)
+                accumulated[index] += delta
+    if base:
+        accumulated = [base + weight for weight in accumulated]
+
+    exact_sum = sum(accumulated)
+    items_total = (2 * exact_sum + common) // (2 * common)  # round half up
+    target = to_minor_units(total_bill, minor_units) if total_bill else items_total
+    rounded = largest_remainder(accumulated, common, target)
+
+    return SplitResult(
+        totals={person: rounded[i] / minor_units for i, person in enumerate(people)},
+        totals_minor={person: rounded[i] for i, person in enumerate(people)},
+        errors=errors,
+        adjustment_minor=target - items_total if any(accumulated) else 0,
+    )
@@ -0,0 +1,245 @@
+# backend/store.py
+"""Persistent store for extracted bills and their allocations.
+
+A saved bill gets a random, shareable id. Allocations are kept one row per
+(item, person) cell and one row per item quantity rather than as a single
+JSON document, so several people filling in their shares at once each write
+only the cells they touch. Every write bumps the bill's ``version``.
+
+The document shape matches the ``/api/split`` request::
+
+    {"id": ..., "version": 3, "bill": {...}, "people": ["A", "B"],
+     "allocations": {"<item>": {"total_quantity": 1, "shares": {"A": "1/2"}}}}
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_QUANTITY = 1
+
+
+class BillNotFound(KeyError):
+    pass
+
+
+class InvalidUpdate(ValueError):
+    """A cell update names an item or person the bill doesn't have."""
+
+
+class BillStore:
+    """Interface for bill stores."""
+
+    def create(self, bill: Dict[str, Any], people: Optional[List[str]] = None,
+               allocations: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def get(self, bill_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def exists(self, bill_id: str) -> bool:
+        return self.get(bill_id) is not None
+
+    def replace(self, bill_id: str, bill: Dict[str, Any], people: List[str],
+                allocations: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def update_cells(self, bill_id: str, shares: Iterable[Tuple[str, str, str]] = (),
+                     quantities: Iterable[Tuple[str, int]] = (), people: Optional[List[str]] = None) -> int:
+        """Apply (item, person, share) and (item, quantity) updates; returns the new version."""
+        raise NotImplementedError
+
+
+def item_names(bill: Dict[str, Any]) -> List[str]:
+    return [item.get("normalized_name") for item in bill.get("items", [])]
+
+
+class SQLiteBillStore(BillStore):
+    """Bills untouched for ``ttl`` seconds are purged as new ones are created; None keeps them forever."""
+
+    def __init__(self, path: str, ttl: Optional[float] = 30 * 24 * 3600.0):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bills ("
+                " id TEXT PRIMARY KEY,"
+                " bill TEXT NOT NULL,"
+                " people TEXT NOT NULL,"
+                " version INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS quantities ("
+                " bill_id TEXT NOT NULL REFERENCES bills (id) ON DELETE CASCADE,"
+                " item TEXT NOT NULL,"
+                " total_quantity INTEGER NOT NULL,"
+                " PRIMARY KEY (bill_id, item))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS allocations ("
+                " bill_id TEXT NOT NULL REFERENCES bills (id) ON DELETE CASCADE,"
+                " item TEXT NOT NULL,"
+                " person TEXT NOT NULL,"
+                " share TEXT NOT NULL,"
+                " PRIMARY KEY (bill_id, item, person))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS bills_updated_at ON bills (updated_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across threads; keep one per thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _write_document(self, conn, bill_id, bill, people, allocations):
+        allocations = allocations or {}
+        items = item_names(bill)
+        conn.execute("DELETE FROM quantities WHERE bill_id = ?", (bill_id,))
+        conn.execute("DELETE FROM allocations WHERE bill_id = ?", (bill_id,))
+        conn.executemany(
+            "INSERT OR REPLACE INTO quantities (bill_id, item, total_quantity) VALUES (?, ?, ?)",
+            [
+                (bill_id, item, int(allocations.get(item, {}).get("total_quantity", DEFAULT_QUANTITY)))
+                for item in items
+            ],
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO allocations (bill_id, item, person, share) VALUES (?, ?, ?, ?)",
+            [
+                (bill_id, item, person, str(share))
+                for item, allocation in allocations.items() if item in items
+                for person, share in allocation.get("shares", {}).items()
+            ],
+        )
+
+    def create(self, bill, people=None, allocations=None):
+        bill_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO bills (id, bill, people, version, created_at, updated_at) VALUES (?, ?, ?, 1, ?, ?)",
+                (bill_id, json.dumps(bill), json.dumps(people or []), now, now),
+            )
+            self._write_document(conn, bill_id, bill, people, allocations)
+            self._purge(conn, now)
+        return self.get(bill_id)
+
+    def _purge(self, conn, now: float) -> int:
+        """Delete bills (and, by cascade, their allocations) not updated within ``ttl``."""
+        if self.ttl is None:
+            return 0
+        return conn.execute("DELETE FROM bills WHERE updated_at < ?", (now - self.ttl,)).rowcount
+
+    def exists(self, bill_id):
+        return self._connect().execute("SELECT 1 FROM bills WHERE id = ?", (bill_id,)).fetchone() is not None
+
+    def get(self, bill_id):
+        conn = self._connect()
+        row = conn.execute("SELECT bill, people, version, updated_at FROM bills WHERE id = ?", (bill_id,)).fetchone()
+        if row is None:
+            return None
+        bill, people, version, updated_at = row
+        allocations = {
+            item: {"total_quantity": quantity, "shares": {}}
+            for item, quantity in conn.execute(
+                "SELECT item, total_quantity FROM quantities WHERE bill_id = ?", (bill_id,)
+            )
+        }
+        for item, person, share in conn.execute(
+            "SELECT item, person, share FROM allocations WHERE bill_id = ?", (bill_id,)
+        ):
+            allocations.setdefault(item, {"total_quantity": DEFAULT_QUANTITY, "shares": {}})["shares"][person] = share
+        return {
+            "id": bill_id,
+            "version": version,
+            "updated_at": updated_at,
+            "bill": json.loads(bill),
+            "people": json.loads(people),
+            "allocations": allocations,
+        }
+
+    def replace(self, bill_id, bill, people, allocations):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            updated = conn.execute(
+                "UPDATE bills SET bill = ?, people = ?, version = version + 1, updated_at = ? WHERE id = ?",
+                (json.dumps(bill), json.dumps(people), now, bill_id),
+            ).rowcount
+            if not updated:
+                conn.execute(
+                    "INSERT INTO bills (id, bill, people, version, created_at, updated_at) VALUES (?, ?, ?, 1, ?, ?)",
+                    (bill_id, json.dumps(bill), json.dumps(people), now, now),
+                )
+            self._write_document(conn, bill_id, bill, people, allocations)
+        return self.get(bill_id)
+
+    def update_cells(self, bill_id, shares=(), quantities=(), people=None):
+        shares = list(shares)
+        quantities = list(quantities)
+        conn = self._connect()
+        with conn:
+            row = conn.execute("SELECT people FROM bills WHERE id = ?", (bill_id,)).fetchone()
+            if row is None:
+                raise BillNotFound(bill_id)
+            if people is not None:
+                conn.execute("UPDATE bills SET people = ? WHERE id = ?", (json.dumps(people), bill_id))
+                conn.execute(
+                    f"DELETE FROM allocations WHERE bill_id = ? AND person NOT IN ({','.join('?' * len(people))})",
+                    (bill_id, *people),
+                )
+            else:
+                people = json.loads(row[0])
+
+            # Items are validated against the quantity rows, so the bill JSON
+            # itself is never read or rewritten by a cell update.
+            touched = {item for item, _, _ in shares} | {item for item, _ in quantities}
+            if touched:
+                placeholders = ",".join("?" * len(touched))
+                known = {item for (item,) in conn.execute(
+                    f"SELECT item FROM quantities WHERE bill_id = ? AND item IN ({placeholders})",
+                    (bill_id, *touched),
+                )}
+                unknown = touched - known
+                if unknown:
+                    raise InvalidUpdate(f"Unknown items: {', '.join(sorted(unknown))}")
+            unknown_people = {person for _, person, _ in shares} - set(people)
+            if unknown_people:
+                raise InvalidUpdate(f"Unknown people: {', '.join(sorted(unknown_people))}")
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO allocations (bill_id, item, person, share) VALUES (?, ?, ?, ?)",
+                [(bill_id, item, person, str(share)) for item, person, share in shares],
+            )
+            conn.executemany(
+                "UPDATE quantities SET total_quantity = ? WHERE bill_id = ? AND item = ?",
+                [(int(quantity), bill_id, item) for item, quantity in quantities],
+            )
+            conn.execute(
+                "UPDATE bills SET version = version + 1, updated_at = ? WHERE id = ?",
+                (time.time(), bill_id),
+            )
+            (version,) = conn.execute("SELECT version FROM bills WHERE id = ?", (bill_id,)).fetchone()
+        return version
+
+
+def make_store_from_env() -> BillStore:
+    """Build the bill store configured by the BILL_STORE_* environment variables.
+
+    BILL_STORE_PATH      the SQLite database file
+    BILL_STORE_TTL       seconds a bill is kept after its last update; 0 keeps bills forever
+    """
+    path = os.getenv("BILL_STORE_PATH", os.path.join(os.path.dirname(__file__), "bills.sqlite3"))
+    ttl = float(os.getenv("BILL_STORE_TTL", str(30 * 24 * 3600)))
+    return SQLiteBillStore(path, ttl=ttl if ttl > 0 else None)
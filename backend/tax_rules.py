@@ -0,0 +1,155 @@
+# backend/tax_rules.py
+"""Rule-based consumption tax rates for receipt items.
+
+Rules are loaded from a JSON file (``tax_rules.json`` next to this module,
+or the file named by ``TAX_RULES_PATH``)::
+
+    {
+      "default_rate": 0.08,
+      "rules": [
+        {"name": "plastic bags", "rate": 0.10, "all_keywords": ["plastic", "bag"]},
+        {"name": "alcohol", "rate": 0.10, "any_keywords": ["beer", "sake"], "regex": "\\\\bwine\\\\b"},
+        {"name": "model says standard", "rate": 0.10, "categories": ["standard"]}
+      ],
+      "stores": {"some store": {"default_rate": 0.10, "rules": [...]}}
+    }
+
+A rule matches when every condition it sets holds: all of ``all_keywords``
+are substrings of the name, at least one of ``any_keywords`` is, ``regex``
+matches, and the model-provided category is one of ``categories``. Store
+rules are tried before the global ones; the first matching rule wins.
+
+All keywords and regexes are compiled into one combined pattern, so a name is
+scanned once regardless of how many rules there are, and results are
+memoized per normalized name, category and store.
+"""
+import json
+import os
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(__file__), "tax_rules.json")
+
+
+def normalize_name(name: str) -> str:
+    # NFKC folds full-width receipt text ("ＢＡＧ") to ASCII before matching.
+    return " ".join(unicodedata.normalize("NFKC", name or "").lower().split())
+
+
+class TaxRule:
+    def __init__(self, config: Dict[str, Any], regex_group: Optional[str]):
+        self.name = config.get("name", "")
+        self.rate = float(config["rate"])
+        self.all_keywords = frozenset(normalize_name(k) for k in config.get("all_keywords", []))
+        self.any_keywords = frozenset(normalize_name(k) for k in config.get("any_keywords", []))
+        self.categories = frozenset(c.lower() for c in config.get("categories", []))
+        self.regex = config.get("regex")
+        self.regex_group = regex_group
+
+    def matches(self, keywords: FrozenSet[str], regex_groups: FrozenSet[str], category: Optional[str]) -> bool:
+        if self.all_keywords and not self.all_keywords <= keywords:
+            return False
+        if self.any_keywords and not self.any_keywords & keywords:
+            return False
+        if self.regex_group is not None and self.regex_group not in regex_groups:
+            return False
+        if self.categories and (category or "").lower() not in self.categories:
+            return False
+        return True
+
+
+class TaxRuleEngine:
+    def __init__(self, config: Dict[str, Any]):
+        self.default_rate = float(config.get("default_rate", 0.08))
+        regexes: List[str] = []
+
+        def build(rule_configs) -> List[TaxRule]:
+            rules = []
+            for rule_config in rule_configs:
+                group = None
+                if rule_config.get("regex"):
+                    group = f"r{len(regexes)}"
+                    regexes.append(f"(?=(?P<{group}>{rule_config['regex']}))?")
+                rules.append(TaxRule(rule_config, group))
+            return rules
+
+        self.rules = build(config.get("rules", []))
+        self.stores: Dict[str, Dict[str, Any]] = {}
+        for store, store_config in config.get("stores", {}).items():
+            self.stores[normalize_name(store)] = {
+                "default_rate": float(store_config.get("default_rate", self.default_rate)),
+                "rules": build(store_config.get("rules", [])),
+            }
+
+        keywords = set()
+        for rule in self.rules + [r for s in self.stores.values() for r in s["rules"]]:
+            keywords |= rule.all_keywords | rule.any_keywords
+        # Longest first so "bags" is preferred over "bag" at the same position;
+        # the shorter keywords it contains are added back via _implied.
+        ordered = sorted(keywords, key=len, reverse=True)
+        self._implied = {k: frozenset(other for other in ordered if other in k) for k in ordered}
+        parts = []
+        if ordered:
+            parts.append("(?=(?P<kw>" + "|".join(re.escape(k) for k in ordered) + "))?")
+        parts.extend(regexes)
+        # Zero-width at every position: each optional lookahead records whether
+        # its keyword set / regex matches starting here.
+        self._pattern = re.compile("".join(parts)) if parts else None
+        # Keyed on the normalized name, so case and full-width variants of one
+        # item share an entry.
+        self._normalized_rate = lru_cache(maxsize=8192)(self._rate)
+
+    @classmethod
+    def from_file(cls, path: str) -> "TaxRuleEngine":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _scan(self, name: str):
+        keywords, groups = set(), set()
+        if self._pattern is not None:
+            for match in self._pattern.finditer(name):
+                for group, value in match.groupdict().items():
+                    if value is None:
+                        continue
+                    if group == "kw":
+                        keywords |= self._implied[value]
+                    else:
+                        groups.add(group)
+        return frozenset(keywords), frozenset(groups)
+
+    def rate(self, name: str, category: Optional[str] = None, store: Optional[str] = None) -> float:
+        return self._normalized_rate(
+            normalize_name(name),
+            category.lower() if category else None,
+            normalize_name(store) if store else None,
+        )
+
+    def _rate(self, normalized: str, category: Optional[str], store: Optional[str]) -> float:
+        keywords, groups = self._scan(normalized)
+        store_config = self.stores.get(store) if store else None
+        rules = (store_config["rules"] + self.rules) if store_config else self.rules
+        for rule in rules:
+            if rule.matches(keywords, groups, category):
+                return rule.rate
+        return store_config["default_rate"] if store_config else self.default_rate
+
+
+_default_engine: Optional[TaxRuleEngine] = None
+_default_engine_lock = threading.Lock()
+
+
+def default_engine() -> TaxRuleEngine:
+    global _default_engine
+    if _default_engine is None:
+        with _default_engine_lock:
+            if _default_engine is None:
+                _default_engine = TaxRuleEngine.from_file(os.getenv("TAX_RULES_PATH", DEFAULT_RULES_PATH))
+    return _default_engine
+
+
+def get_tax_rate(item_name: str, category: Optional[str] = None, store: Optional[str] = None) -> float:
+    """Tax rate for an item, e.g. 0.10 for plastic bags and 0.08 (reduced rate) otherwise."""
+    return default_engine().rate(item_name, category, store)
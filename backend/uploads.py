@@ -0,0 +1,126 @@
+# backend/uploads.py
+"""Streaming ingestion of uploaded images.
+
+Werkzeug writes each multipart file part into the stream returned by
+``Request._get_file_stream``. ``UploadRequest`` hands it an ``UploadSpool``
+instead of the default spooled file, so the upload is:
+
+* hashed as it arrives (the digest keys the result cache, no second pass),
+* size-limited while it is being written, not after it has been buffered,
+* kept in memory only while small; larger uploads roll over to a temp file
+  that is memory-mapped for decoding rather than read into a bytes object.
+
+Nothing is copied between the request body and ``Image.open``.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import mmap
+import os
+import sys
+import tempfile
+from typing import TYPE_CHECKING, Optional
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from backend.pipeline import decode_image
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+SPOOL_MAX_MEMORY = int(os.getenv("UPLOAD_SPOOL_MEMORY", str(1024 * 1024)))
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    description = f"Uploaded file exceeds the {MAX_UPLOAD_BYTES} byte limit."
+
+
+class UploadSpool(tempfile.SpooledTemporaryFile):
+    """A spooled temp file that hashes and size-checks everything written to it.
+
+    Request teardown closes uploaded files. Work that outlives the request
+    (batch timeouts, background jobs) calls ``claim()`` so that close is
+    deferred until it calls ``release()``.
+    """
+
+    def __init__(self, max_bytes: int = MAX_UPLOAD_BYTES, max_memory: int = SPOOL_MAX_MEMORY):
+        super().__init__(max_size=max_memory, mode="w+b")
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.on_disk = False
+        self._sha256 = hashlib.sha256()
+        self._claimed = False
+        self._map: Optional[mmap.mmap] = None
+
+    @classmethod
+    def from_bytes(cls, data: bytes, max_bytes: int = MAX_UPLOAD_BYTES) -> "UploadSpool":
+        spool = cls(max_bytes=max_bytes)
+        spool.write(data)
+        spool.seek(0)
+        return spool
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge()
+        self._sha256.update(data)
+        return super().write(data)
+
+    def rollover(self):
+        super().rollover()
+        self.on_disk = True
+
+    @property
+    def digest(self) -> str:
+        return self._sha256.hexdigest()
+
+    def open_image(self) -> Image.Image:
+        """Open (not decode) the image and check its pixel count; Pillow reads the pixels lazily."""
+        if self.size == 0:
+            raise ValueError("Uploaded file is empty")
+        self.seek(0)
+        if self.on_disk:
+            if self._map is None:
+                self._map = mmap.mmap(self.fileno(), 0, access=mmap.ACCESS_READ)
+            self._map.seek(0)
+            return decode_image(self._map)
+        return decode_image(self)
+
+    def claim(self) -> "UploadSpool":
+        self._claimed = True
+        return self
+
+    def release(self) -> None:
+        self._claimed = False
+        self.close()
+
+    def close(self):
+        if self._claimed:
+            return
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        super().close()
+
+
+class UploadRequest(Request):
+    """Flask request class that spools file uploads into UploadSpool."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadSpool()
+
+
+def peak_rss_kb() -> int:
+    """High-water mark of this process's resident set size, in KiB (0 if unknown)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak // 1024 if sys.platform == "darwin" else peak
@@ -0,0 +1,193 @@
+# benchmarks/bench_asgi.py
+"""Sync gunicorn workers vs the ASGI server under many concurrent extractions.
+
+Starts a ``FlakyGeminiServer`` with real model-like latency, then serves the
+backend as separate processes, each pointed at the stub through
+``GOOGLE_GEMINI_BASE_URL``:
+
+* ``gunicorn``: ``gunicorn backend.app:app`` with ``--workers`` sync workers
+  (the documented setup), one request per worker at a time;
+* ``asgi``: ``uvicorn backend.asgi:app``, a single process.
+
+Each server gets distinct corpus receipts from 1, 64 and 256 concurrent
+clients. The report shows requests/sec, latency, and the resident memory of
+the server's whole process tree: idle and peak under load. Memory per
+concurrent request divides that peak by the requests the server actually
+holds in flight, which for sync gunicorn is at most one per worker::
+
+    python -m benchmarks.bench_asgi --clients 1,64,256 --model-latency 1.0
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from typing import Any, Dict, List
+
+from benchmarks.corpus import synthetic_corpus
+from benchmarks.harness import load_test
+from benchmarks.stub_server import FlakyGeminiServer
+
+
+def _free_port() -> int:
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def tree_rss_kb(root: int) -> int:
+    """Resident memory of ``root`` and all its descendants (Linux /proc)."""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; the ppid follows its closing parenthesis.
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    total, pending = 0, [root]
+    while pending:
+        pid = pending.pop()
+        total += _rss_kb(pid)
+        pending.extend(children.get(pid, []))
+    return total
+
+
+class RssSampler:
+    """Samples a process tree's RSS in the background; ``peak`` is the maximum seen."""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, tree_rss_kb(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def start_server(kind: str, port: int, workers: int, env: Dict[str, str], log) -> subprocess.Popen:
+    if kind == "gunicorn":
+        command = ["gunicorn", "backend.app:app", "--bind", f"127.0.0.1:{port}", "--workers", str(workers),
+                   "--worker-class", "sync", "--timeout", "300", "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "backend.asgi:app", "--host", "127.0.0.1", "--port", str(port),
+                   "--no-access-log", "--log-level", "warning"]
+    process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{kind} exited with status {process.returncode}; see {log.name}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/health", timeout=2):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{kind} did not start within 60s; see {log.name}")
+
+
+def bench_server(kind: str, args, env: Dict[str, str], corpus, tmp: str) -> Dict[str, Any]:
+    port = _free_port()
+    with open(os.path.join(tmp, f"{kind}.log"), "w") as log:
+        process = start_server(kind, port, args.workers, env, log)
+        try:
+            # Warm up imports, the model client and its connection pool in every worker.
+            load_test(port, corpus, max(2, args.workers), max(4, 2 * args.workers))
+            idle_kb = tree_rss_kb(process.pid)
+            runs = []
+            for clients in (int(value) for value in args.clients.split(",")):
+                with RssSampler(process.pid) as sampler:
+                    result = load_test(port, corpus, clients, clients * args.rounds)
+                in_flight = min(clients, args.workers) if kind == "gunicorn" else clients
+                result.update({
+                    "in_flight": in_flight,
+                    "idle_rss_mb": round(idle_kb / 1024, 1),
+                    "peak_rss_mb": round(sampler.peak / 1024, 1),
+                    "rss_mb_per_concurrent_request": round(sampler.peak / 1024 / in_flight, 2),
+                })
+                runs.append(result)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+    return {"server": kind, "workers": args.workers if kind == "gunicorn" else 1, "runs": runs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", default="1,64,256", help="comma-separated concurrency levels")
+    parser.add_argument("--rounds", type=int, default=2, help="requests each client sends per concurrency level")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn sync workers")
+    parser.add_argument("--model-latency", type=float, default=1.0, help="seconds the stub model takes per call")
+    parser.add_argument("--corpus-size", type=int, default=64)
+    parser.add_argument("--servers", default="gunicorn,asgi")
+    parser.add_argument("--output", help="write the JSON results here as well as to stdout")
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.corpus_size)
+    with tempfile.TemporaryDirectory() as tmp, FlakyGeminiServer(latency=args.model_latency) as model:
+        env = dict(
+            os.environ,
+            API_KEY=os.environ.get("API_KEY", "bench"),
+            GOOGLE_GEMINI_BASE_URL=model.url,
+            EXTRACTOR_MODE="gemini",
+            REPAIR_MODEL_NAME="",
+            BILL_STORE_PATH=os.path.join(tmp, "bills.sqlite3"),
+            # Measure the servers, not the limiter or the caches.
+            MODEL_RATE_LIMIT="0",
+            BILL_CACHE_BACKEND="none",
+            BILL_PIXEL_INDEX_SIZE="0",
+        )
+        results = [bench_server(kind, args, env, corpus, tmp) for kind in args.servers.split(",")]
+        model_requests = model.requests
+
+    report = {
+        "meta": {"model_latency": args.model_latency, "corpus_size": args.corpus_size, "cpus": os.cpu_count(),
+                 "model_requests": model_requests},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    failed = [f"{result['server']} @ {run['clients']}: {run['statuses']}"
+              for result in results for run in result["runs"] if set(run["statuses"]) != {"200"}]
+    for failure in failed:
+        print(f"FAIL: non-200 responses from {failure}", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
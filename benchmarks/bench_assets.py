@@ -0,0 +1,117 @@
+# benchmarks/bench_assets.py
+"""Frontend asset serving: in-memory index vs the previous per-request filesystem route.
+
+Serves a build directory (default: the build copy committed under
+``backend/``) both ways through the Flask test client, as a browser on a
+first and a repeat visit would request it:
+
+* ``legacy``: ``os.path.exists`` / ``isfile`` then ``send_from_directory`` on
+  every request, uncompressed;
+* ``indexed``: ``backend.assets.AssetIndex``, served from memory with
+  negotiated compression.
+
+A repeat visit sends ``If-None-Match`` with the ETags of the first.
+
+Reports requests per second and bytes transferred per page load::
+
+    python -m benchmarks.bench_assets --build-dir frontend/build --repeat 500
+"""
+import argparse
+import json
+import os
+import time
+
+from flask import Flask, Response, request, send_from_directory
+
+from backend.assets import AssetIndex
+
+
+def page_paths(build_dir):
+    """What a first visit fetches: index.html, the entrypoint bundles and the icons."""
+    with open(os.path.join(build_dir, "asset-manifest.json")) as f:
+        manifest = json.load(f)
+    entrypoints = manifest["entrypoints"]
+    return ["", *entrypoints, "manifest.json", "favicon.ico", "logo192.png"]
+
+
+def legacy_app(build_dir):
+    app = Flask(__name__, static_folder=None)
+
+    @app.route("/", defaults={"path": ""})
+    @app.route("/<path:path>")
+    def serve(path):
+        full_path = os.path.join(build_dir, path)
+        if path != "" and os.path.exists(full_path):
+            if os.path.isfile(full_path):
+                return send_from_directory(build_dir, path)
+        return send_from_directory(build_dir, "index.html")
+
+    return app
+
+
+def indexed_app(build_dir):
+    app = Flask(__name__, static_folder=None)
+    index = AssetIndex.build(build_dir)
+
+    @app.route("/", defaults={"path": ""})
+    @app.route("/<path:path>")
+    def serve(path):
+        asset = (index.get(path) if path else None) or index.get("index.html")
+        result = index.respond(asset, "GET", request.headers.get("Accept-Encoding"), request.headers.get("If-None-Match"))
+        return Response(result.body, result.status, result.headers)
+
+    return app, index
+
+
+def page_load(client, paths, etags):
+    """Request every path once; returns the bytes received and records ETags for the next visit."""
+    received = 0
+    for path in paths:
+        headers = {"Accept-Encoding": "gzip, deflate, br"}
+        if path in etags:
+            headers["If-None-Match"] = etags[path]
+        response = client.get(f"/{path}", headers=headers)
+        received += len(response.get_data())
+        if response.headers.get("ETag") and "no-store" not in response.headers.get("Cache-Control", ""):
+            etags[path] = response.headers["ETag"]
+        response.close()
+    return received
+
+
+def bench(app, paths, repeat, revisit):
+    client = app.test_client()
+    first = page_load(client, paths, {})
+    etags = {}
+    page_load(client, paths, etags)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        page_load(client, paths, dict(etags) if revisit else {})
+    elapsed = time.perf_counter() - started
+    repeat_bytes = page_load(client, paths, dict(etags)) if revisit else first
+    return {
+        "requests_per_s": round(repeat * len(paths) / elapsed, 1),
+        "first_visit_bytes": first,
+        "page_load_bytes": repeat_bytes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--build-dir", default=os.path.join(os.path.dirname(__file__), "..", "backend"))
+    parser.add_argument("--repeat", type=int, default=300, help="page loads timed per scenario")
+    args = parser.parse_args()
+
+    build_dir = os.path.abspath(args.build_dir)
+    paths = page_paths(build_dir)
+    indexed, index = indexed_app(build_dir)
+    report = {"paths": paths, "index": index.stats()}
+    for name, app in (("legacy", legacy_app(build_dir)), ("indexed", indexed)):
+        report[name] = {
+            "first_visit": bench(app, paths, args.repeat, revisit=False),
+            "repeat_visit": bench(app, paths, args.repeat, revisit=True),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/bench_genai_client.py
+"""Compare a fresh genai.Client per request with the pooled ClientManager.
+
+Runs against the local stub server, so the numbers isolate client setup and
+connection establishment from model latency::
+
+    python -m benchmarks.bench_genai_client --requests 200
+"""
+import argparse
+import json
+import statistics
+import time
+
+from backend.genai_client import ClientManager
+from benchmarks.stub_server import StubGeminiServer
+
+MODEL = "gemini-2.0-flash"
+
+
+def _generate(client):
+    return client.models.generate_content(model=MODEL, contents=["ping"]).text
+
+
+def _summarize(name, durations, server, connections_before):
+    durations_ms = sorted(d * 1000 for d in durations)
+    return {
+        "mode": name,
+        "requests": len(durations_ms),
+        "mean_ms": statistics.mean(durations_ms),
+        "p50_ms": durations_ms[len(durations_ms) // 2],
+        "p95_ms": durations_ms[int(len(durations_ms) * 0.95) - 1],
+        "tcp_connections": server.connections - connections_before,
+    }
+
+
+def bench_per_request(server, requests):
+    from google import genai
+
+    durations = []
+    before = server.connections
+    for _ in range(requests):
+        started = time.perf_counter()
+        client = genai.Client(api_key="bench", http_options={"base_url": server.url})
+        _generate(client)
+        durations.append(time.perf_counter() - started)
+        close = getattr(client, "close", None)
+        if close is not None:
+            close()
+    return _summarize("client_per_request", durations, server, before)
+
+
+def bench_pooled(server, requests):
+    manager = ClientManager(http_options={"base_url": server.url})
+    durations = []
+    before = server.connections
+    for _ in range(requests):
+        started = time.perf_counter()
+        manager.call("bench", _generate)
+        durations.append(time.perf_counter() - started)
+    return _summarize("pooled_client", durations, server, before)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    args = parser.parse_args()
+
+    with StubGeminiServer() as server:
+        # Warm imports and the stub so the first mode isn't penalised.
+        bench_pooled(server, 5)
+        results = [bench_per_request(server, args.requests), bench_pooled(server, args.requests)]
+
+    per_request, pooled = results
+    print(json.dumps({
+        "results": results,
+        "setup_cost_saved_ms": per_request["mean_ms"] - pooled["mean_ms"],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/bench_incremental.py
+"""Single-cell edits: incremental split model vs recomputing the whole split.
+
+Replays random share (and occasional quantity) edits on a synthetic bill,
+applying each one both to an IncrementalSplit and by rerunning compute_split,
+checks that both give the same result, and reports the per-edit time of each.
+
+    python -m benchmarks.bench_incremental --people 6 --items 60
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from backend.incremental import IncrementalSplit
+from backend.split import compute_split
+from benchmarks.bench_split import synthetic_bill
+
+SHARES = ["0", "1", "1/2", "1/3", "2/3", "0.25"]
+
+
+def bench(people_count, item_count, edits, seed=0):
+    items, allocations, people, total_bill = synthetic_bill(people_count, item_count, seed=seed)
+    model = IncrementalSplit.from_allocations(items, allocations, people, total_bill=total_bill)
+    rng = random.Random(seed)
+    full_ms, edit_ms = [], []
+    for _ in range(edits):
+        name = rng.choice(items)["normalized_name"]
+        person = rng.choice(people)
+        share = rng.choice(SHARES)
+        quantity = rng.randint(0, 3) if rng.random() < 0.1 else None
+
+        started = time.perf_counter()
+        if quantity is None:
+            allocations[name]["shares"][person] = share
+        else:
+            allocations[name]["total_quantity"] = quantity
+        expected = compute_split(items, allocations, people, total_bill=total_bill)
+        full_ms.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        if quantity is None:
+            model.set_share(name, person, share)
+        else:
+            model.set_quantity(name, quantity)
+        result = model.result()
+        edit_ms.append((time.perf_counter() - started) * 1000)
+
+        assert result.to_dict() == expected.to_dict(), (name, person, share, quantity)
+    return {
+        "people": people_count,
+        "items": item_count,
+        "edits": edits,
+        "recompute_median_ms": statistics.median(full_ms),
+        "incremental_median_ms": statistics.median(edit_ms),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--people", type=int, default=6)
+    parser.add_argument("--items", type=int, default=60)
+    parser.add_argument("--edits", type=int, default=500)
+    args = parser.parse_args()
+    print(json.dumps(bench(args.people, args.items, args.edits), indent=2))
+
+
+if __name__ == "__main__":
+    main()
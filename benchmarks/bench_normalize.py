@@ -0,0 +1,61 @@
+# benchmarks/bench_normalize.py
+"""Single-pass item normalizer vs the previous multi-pass implementation.
+
+First checks on randomly generated receipts (repeated names, discount lines
+first, last and back to back, missing fields) that ``finalize_bill`` gives
+exactly what the previous normalize -> merge -> dedupe -> tax passes gave,
+then times both on synthetic 1,000-line receipts::
+
+    python -m benchmarks.bench_normalize --lines 1000 --cases 2000
+"""
+import argparse
+import copy
+import json
+import random
+import statistics
+import time
+
+from backend.pipeline import finalize_bill
+from tests.legacy_normalize import legacy_finalize_bill, random_receipt
+
+
+def check_equivalence(cases, seed=0):
+    rng = random.Random(seed)
+    for case in range(cases):
+        bill = random_receipt(rng, rng.randint(0, 40))
+        expected = legacy_finalize_bill(copy.deepcopy(bill))
+        actual = finalize_bill(copy.deepcopy(bill))
+        assert actual == expected, (case, bill)
+    return cases
+
+
+def bench(lines, repeat, seed=0):
+    bill = random_receipt(random.Random(seed), lines)
+    implementations = (("multi_pass", legacy_finalize_bill), ("single_pass", finalize_bill))
+    durations = {name: [] for name, _ in implementations}
+    # Interleaved, so drift in machine load hits both implementations alike.
+    for _ in range(repeat):
+        for name, finalize in implementations:
+            copied = copy.deepcopy(bill)
+            started = time.perf_counter()
+            finalize(copied)
+            durations[name].append((time.perf_counter() - started) * 1000)
+    timings = {}
+    for name, samples in durations.items():
+        timings[f"{name}_median_ms"] = statistics.median(samples)
+        timings[f"{name}_min_ms"] = min(samples)
+    return {"lines": lines, **timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--cases", type=int, default=2000)
+    args = parser.parse_args()
+    result = {"equivalence_cases": check_equivalence(args.cases), **bench(args.lines, args.repeat)}
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
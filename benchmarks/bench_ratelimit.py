@@ -0,0 +1,133 @@
+# benchmarks/bench_ratelimit.py
+"""Single-flight, token bucket and 429 backoff against a flaky model server.
+
+Starts a ``FlakyGeminiServer`` (latency plus injected 429s), points the
+backend's Gemini client at it and posts receipts to ``/api/process-bill``
+from many threads at once:
+
+* ``duplicates``: every client uploads the same photo; single-flight should
+  turn them into one model call.
+* ``distinct``: every client uploads a different photo; the token bucket
+  paces model calls, injected 429s are retried with backoff, and clients
+  beyond the wait queue get 503 with Retry-After.
+
+::
+
+    python -m benchmarks.bench_ratelimit --clients 32 --error-rate 0.3 --rate 5 --queue 8
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from benchmarks.stub_server import FlakyGeminiServer
+
+
+def receipt_image(index):
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (400, 700), "white")
+    draw = ImageDraw.Draw(image)
+    for line in range(0, 700, 35):
+        draw.text((20, line), f"RECEIPT {index} ITEM {line} .... {line * 3 + index}", fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def post_concurrently(app, images):
+    """POST each image from its own thread, all released at once."""
+    results = [None] * len(images)
+    start = threading.Barrier(len(images))
+
+    def worker(index):
+        client = app.test_client()
+        start.wait()
+        started = time.perf_counter()
+        response = client.post("/api/process-bill", data={"image": (io.BytesIO(images[index]), f"{index}.jpg")})
+        results[index] = (response.status_code, response.headers.get("Retry-After"), time.perf_counter() - started)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(len(images))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(name, results, server, requests_before, rejected_before):
+    latencies = sorted(elapsed * 1000 for _, _, elapsed in results)
+    statuses = Counter(status for status, _, _ in results)
+    return {
+        "scenario": name,
+        "clients": len(results),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "503_with_retry_after": sum(1 for status, retry, _ in results if status == 503 and retry),
+        "model_requests": server.requests - requests_before,
+        "injected_errors": server.rejected - rejected_before,
+        "p50_ms": statistics.median(latencies),
+        "max_ms": latencies[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.2, help="model latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.3, help="fraction of model calls answered 429")
+    parser.add_argument("--rate", type=float, default=5.0, help="MODEL_RATE_LIMIT")
+    parser.add_argument("--burst", type=int, default=4, help="MODEL_BURST")
+    parser.add_argument("--queue", type=int, default=8, help="MODEL_QUEUE_SIZE")
+    parser.add_argument("--retries", type=int, default=3, help="MODEL_RETRIES")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The backend reads its configuration at import time.
+        os.environ.update({
+            "API_KEY": os.environ.get("API_KEY", "bench"),
+            "BILL_CACHE_BACKEND": "none",
+            "BILL_PIXEL_INDEX_SIZE": "0",
+            "BILL_STORE_PATH": os.path.join(tmp, "bills.sqlite3"),
+            "REPAIR_MODEL_NAME": "",
+            "MODEL_RATE_LIMIT": str(args.rate),
+            "MODEL_BURST": str(args.burst),
+            "MODEL_QUEUE_SIZE": str(args.queue),
+            "MODEL_RETRIES": str(args.retries),
+            "MODEL_BACKOFF_BASE": "0.1",
+            "MODEL_BACKOFF_CAP": "1",
+        })
+        import logging
+
+        from backend import app as backend
+
+        logging.getLogger().setLevel(logging.ERROR)
+        with FlakyGeminiServer(latency=args.latency, error_rate=args.error_rate, retry_after=0.2) as server:
+            backend.client_manager.http_options = {"base_url": server.url}
+            backend.client_manager.reset()
+
+            results = []
+            image = receipt_image(0)
+            for name, images in (
+                ("duplicates", [image] * args.clients),
+                ("distinct", [receipt_image(index) for index in range(1, args.clients + 1)]),
+            ):
+                requests_before, rejected_before = server.requests, server.rejected
+                outcome = post_concurrently(backend.app, images)
+                results.append(summarize(name, outcome, server, requests_before, rejected_before))
+
+            report = {"results": results, "model_gate": backend.model_gate.stats(),
+                      "coalesced": backend.extraction_flight.coalesced}
+    print(json.dumps(report, indent=2))
+    # Every client must get a bill or a clean 503 with Retry-After, never a 500.
+    failed = [result for result in results if set(result["statuses"]) - {"200", "503"}]
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
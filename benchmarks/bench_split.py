@@ -0,0 +1,75 @@
+# benchmarks/bench_split.py
+"""Time the split engine on a synthetic 100 people x 500 items bill.
+
+Tax rates come from the default rule engine, as they do for the endpoints.
+
+    python -m benchmarks.bench_split
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from backend.split import compute_split
+from backend.tax_rules import default_engine
+
+
+def synthetic_bill(people_count, item_count, seed=0, dense=False):
+    rng = random.Random(seed)
+    people = [f"person {j}" for j in range(people_count)]
+    items = [
+        {
+            "normalized_name": f"item {i}",
+            "price_before_tax": rng.randint(50, 2000),
+            "discount_amount": rng.choice([0, 0, 0, 20, 50]),
+            "category": rng.choice(["reduced", "reduced", "reduced", "standard"]),
+        }
+        for i in range(item_count)
+    ]
+    allocations = {}
+    for item in items:
+        if dense:
+            # Every item shared equally by everyone: every cell is non-zero.
+            shares = {person: f"1/{people_count}" for person in people}
+        else:
+            # Typical receipt: each item split between a few people.
+            owners = rng.sample(people, rng.randint(1, 3))
+            shares = {person: (f"1/{len(owners)}" if person in owners else "0") for person in people}
+        allocations[item["normalized_name"]] = {"total_quantity": 1, "shares": shares}
+    total_bill = sum(item["price_before_tax"] for item in items) * 1.08
+    return items, allocations, people, total_bill
+
+
+def bench(people_count, item_count, dense, repeat):
+    items, allocations, people, total_bill = synthetic_bill(people_count, item_count, dense=dense)
+    default_engine()  # load the rules outside the timed runs
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = compute_split(items, allocations, people, total_bill=total_bill)
+        durations.append((time.perf_counter() - started) * 1000)
+    assert not result.errors and sum(result.totals_minor.values()) == round(total_bill * 100)
+    return {
+        "people": people_count,
+        "items": item_count,
+        "dense": dense,
+        "median_ms": statistics.median(durations),
+        "min_ms": min(durations),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--people", type=int, default=100)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps([
+        bench(args.people, args.items, dense=False, repeat=args.repeat),
+        bench(args.people, args.items, dense=True, repeat=args.repeat),
+    ], indent=2))
+
+
+if __name__ == "__main__":
+    main()
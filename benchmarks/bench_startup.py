@@ -0,0 +1,84 @@
+# benchmarks/bench_startup.py
+"""Cold-start import time of the backend, with a regression guard.
+
+Imports the module in fresh interpreters under ``python -X importtime`` and
+reports the median cumulative import time plus the heaviest imports. Exits
+non-zero if the time exceeds the budget or if a dependency that should load
+lazily (google-genai, PIL, streamlit, pytesseract) is imported at startup::
+
+    python -m benchmarks.bench_startup --budget-ms 800
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+# Imported on first use only; pulling any of these in at import time is a regression.
+LAZY_MODULES = ("google.genai", "PIL", "streamlit", "pytesseract")
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def import_profile(module):
+    """Return {module name: (self_us, cumulative_us, depth)} for one fresh import."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    profile = {}
+    for line in completed.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            profile[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return profile
+
+
+def bench(module, repeat):
+    profiles = [import_profile(module) for _ in range(repeat)]
+    totals_ms = [profile[module][1] / 1000 for profile in profiles]
+    last = profiles[-1]
+    heaviest = sorted(
+        ((name, cumulative / 1000) for name, (_, cumulative, depth) in last.items() if depth == 1),
+        key=lambda entry: entry[1],
+        reverse=True,
+    )[:10]
+    eager = sorted(
+        name for name in last
+        if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES)
+    )
+    return {
+        "module": module,
+        "repeat": repeat,
+        "median_ms": statistics.median(totals_ms),
+        "min_ms": min(totals_ms),
+        "heaviest_ms": dict(heaviest),
+        "eager_lazy_modules": eager,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="backend.app")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=800.0)
+    args = parser.parse_args()
+
+    result = bench(args.module, args.repeat)
+    print(json.dumps(result, indent=2))
+    failures = []
+    if result["median_ms"] > args.budget_ms:
+        failures.append(f"median import time {result['median_ms']:.0f}ms exceeds the {args.budget_ms:.0f}ms budget")
+    if result["eager_lazy_modules"]:
+        failures.append(f"imported at startup: {', '.join(result['eager_lazy_modules'])}")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
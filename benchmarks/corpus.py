@@ -0,0 +1,238 @@
+# benchmarks/corpus.py
+"""Synthetic receipt corpus and a recorded-response stand-in for genai.Client.
+
+``synthetic_corpus(count)`` draws receipt photos deterministically: a paper
+strip with item and discount lines on a darker background, so preprocessing
+(autocrop, downscale) does real work. Each receipt has the bill a model
+should return for it. Some receipts come back as fenced text instead of
+structured output, so both parse paths are exercised.
+
+``RecordedClient`` answers ``models.generate_content`` from those responses,
+keyed by the digest of the image bytes it is sent. Install it through the
+ClientManager factory; no network access is needed. Real model responses
+can replace the synthetic ones::
+
+    API_KEY=... python -m benchmarks.corpus record --count 20 --out benchmarks/recorded
+    python -m benchmarks.harness --responses benchmarks/recorded
+"""
+import argparse
+import hashlib
+import io
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from backend.pipeline import DISCOUNT_MARKER, decode_image, prepare_image
+
+ITEMS = [
+    ("牛乳", "milk", "🥛", "reduced"), ("食パン", "bread", "🍞", "reduced"), ("卵 10個", "eggs", "🥚", "reduced"),
+    ("納豆", "natto", "🫘", "reduced"), ("豆腐", "tofu", "🧈", "reduced"), ("バナナ", "banana", "🍌", "reduced"),
+    ("ヨーグルト", "yogurt", "🥣", "reduced"), ("ビール", "beer", "🍺", "standard"),
+    ("洗剤", "detergent", "🧴", "standard"), ("レジ袋", "plastic bag", "🛍️", "standard"),
+]
+
+
+@dataclass
+class Receipt:
+    id: str
+    image: bytes
+    bill: Dict
+    # "structured": valid JSON the SDK parses; "fenced": ```json text needing local repair.
+    response_format: str = "structured"
+
+    def response_text(self) -> str:
+        text = json.dumps(self.bill, ensure_ascii=False)
+        return f"```json\n{text}\n```" if self.response_format == "fenced" else text
+
+
+# Pillow's default font has no Japanese glyphs; use a CJK font when one is
+# installed (CORPUS_FONT overrides) so recorded model responses see real text.
+FONT_PATHS = [
+    os.getenv("CORPUS_FONT", ""),
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc",
+]
+
+
+def _font():
+    from PIL import ImageFont
+
+    for path in FONT_PATHS:
+        if path and os.path.exists(path):
+            return ImageFont.truetype(path, 20)
+    return ImageFont.load_default()
+
+
+def _draw_receipt(lines: List[str], rng: random.Random) -> bytes:
+    from PIL import Image, ImageDraw
+
+    width, height = rng.choice([(1200, 1600), (1500, 2000), (900, 1600)])
+    photo = Image.new("RGB", (width, height), (rng.randint(40, 90),) * 3)
+    paper_width = int(width * rng.uniform(0.45, 0.7))
+    paper_height = min(height - 40, 120 + 28 * len(lines))
+    left = rng.randint(20, width - paper_width - 20)
+    top = rng.randint(20, max(21, height - paper_height - 20))
+    paper = Image.new("RGB", (paper_width, paper_height), (245, 243, 238))
+    draw = ImageDraw.Draw(paper)
+    font = _font()
+    for row, line in enumerate(lines):
+        draw.text((20, 40 + row * 28), line, fill=(20, 20, 20), font=font)
+    photo.paste(paper, (left, top))
+    buffer = io.BytesIO()
+    photo.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def synthetic_receipt(index: int, seed: int = 0) -> Receipt:
+    rng = random.Random(f"{seed}:{index}")
+    lines, items = ["SUPER MARKET", f"RECEIPT {index:05d}"], []
+    for _ in range(rng.randint(4, 30)):
+        original, normalized, emoji, category = rng.choice(ITEMS)
+        price = rng.randint(50, 1200)
+        discount = rng.choice([0, 0, 0, 0, 20, 50])
+        lines.append(f"{original} {price}")
+        if discount:
+            lines.append(f"{DISCOUNT_MARKER} -{discount}")
+        items.append({
+            "original_name": original,
+            "normalized_name": normalized,
+            "price_before_tax": price,
+            "discount_amount": discount,
+            "emoji": emoji,
+            "category": category,
+        })
+    total = round(sum(item["price_before_tax"] - item["discount_amount"] for item in items) * 1.08)
+    lines.append(f"TOTAL {total}")
+    return Receipt(
+        id=f"synthetic-{seed}-{index:05d}",
+        image=_draw_receipt(lines, rng),
+        bill={"items": items, "total_bill": total, "store": "SUPER MARKET"},
+        response_format="fenced" if rng.random() < 0.2 else "structured",
+    )
+
+
+def synthetic_corpus(count: int, seed: int = 0) -> List[Receipt]:
+    return [synthetic_receipt(index, seed) for index in range(count)]
+
+
+def load_recorded(corpus: List[Receipt], directory: str) -> List[Receipt]:
+    """Swap in real responses saved by ``record`` (``<id>.json``) where they exist."""
+    for receipt in corpus:
+        path = os.path.join(directory, f"{receipt.id}.json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                recorded = json.load(f)
+            receipt.bill = recorded.get("bill") or receipt.bill
+            receipt.response_format = recorded.get("response_format", receipt.response_format)
+    return corpus
+
+
+def request_digest(image: bytes, options=None) -> str:
+    """Digest of the bytes the backend sends to the model for this upload."""
+    prepared = prepare_image(decode_image(io.BytesIO(image)), len(image), options)
+    return hashlib.sha256(prepared.data).hexdigest()
+
+
+# --- Recorded client ---
+class _RecordedResponse:
+    def __init__(self, text: str, parsed=None):
+        self.text = text
+        self.parsed = parsed
+
+
+class _RecordedModels:
+    def __init__(self, client: "RecordedClient"):
+        self._client = client
+
+    def generate_content(self, model, contents, config=None):
+        return self._client.respond(contents, config)
+
+
+class RecordedClient:
+    """Stands in for ``genai.Client``: replays responses keyed by image digest.
+
+    Images it has no response for get the next response in turn. ``latency``
+    seconds are slept per call to model network and inference time.
+    """
+
+    def __init__(self, responses: Dict[str, str], latency: float = 0.0):
+        self.responses = responses
+        self.latency = latency
+        self.models = _RecordedModels(self)
+        self.calls = 0
+        self.misses = 0
+        self._fallback = itertools.cycle(list(responses.values()))
+        self._lock = threading.Lock()
+
+    def respond(self, contents, config=None):
+        data = next((getattr(getattr(part, "inline_data", None), "data", None) for part in contents
+                     if getattr(part, "inline_data", None) is not None), None)
+        with self._lock:
+            self.calls += 1
+            text = self.responses.get(hashlib.sha256(data).hexdigest()) if data is not None else None
+            if text is None:
+                self.misses += 1
+                text = next(self._fallback)
+        if self.latency:
+            time.sleep(self.latency)
+        schema = (config or {}).get("response_schema") if isinstance(config, dict) else None
+        parsed = None
+        if schema is not None:
+            # Like the SDK: parsed is only set when the text is valid JSON for the schema.
+            try:
+                parsed = schema.model_validate_json(text)
+            except Exception:
+                parsed = None
+        return _RecordedResponse(text, parsed)
+
+    def factory(self, api_key: str, http_options: Optional[Dict] = None) -> "RecordedClient":
+        """Pass as ``ClientManager.factory``."""
+        return self
+# --- End Recorded client ---
+
+
+def record(count: int, seed: int, directory: str) -> None:
+    """Send the corpus to the real model and save its bills as ``<id>.json``."""
+    from backend.app import BILL_PROMPT, gemini_extractor, preprocess_options
+
+    if not gemini_extractor.api_key:
+        raise SystemExit("API_KEY must be set to record responses")
+    os.makedirs(directory, exist_ok=True)
+    for receipt in synthetic_corpus(count, seed):
+        prepared = prepare_image(decode_image(io.BytesIO(receipt.image)), len(receipt.image), preprocess_options)
+        extraction = gemini_extractor.extract(prepared)
+        with open(os.path.join(directory, f"{receipt.id}.json"), "w", encoding="utf-8") as f:
+            json.dump({"id": receipt.id, "prompt_sha256": hashlib.sha256(BILL_PROMPT.encode()).hexdigest(),
+                       "bill": extraction.bill, "response_format": "structured"}, f, ensure_ascii=False, indent=2)
+        print(f"recorded {receipt.id}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["record", "write"], help="record real responses, or write the synthetic images")
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="benchmarks/recorded")
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args.count, args.seed, args.out)
+    else:
+        # Handy for eyeballing the corpus or feeding it to other tools.
+        os.makedirs(args.out, exist_ok=True)
+        for receipt in synthetic_corpus(args.count, args.seed):
+            with open(os.path.join(args.out, f"{receipt.id}.jpg"), "wb") as f:
+                f.write(receipt.image)
+            with open(os.path.join(args.out, f"{receipt.id}.json"), "w", encoding="utf-8") as f:
+                json.dump({"id": receipt.id, "bill": receipt.bill, "response_format": receipt.response_format},
+                          f, ensure_ascii=False, indent=2)
+        print(f"wrote {args.count} receipts to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
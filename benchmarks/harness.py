@@ -0,0 +1,219 @@
+# benchmarks/harness.py
+"""Offline end-to-end benchmark and regression check.
+
+Serves ``backend.app`` on a local threaded WSGI server, with the Gemini
+client replaced by a ``RecordedClient`` that answers from the synthetic
+corpus. It then POSTs corpus receipts to ``/api/process-bill`` with 1, 8 and
+64 concurrent clients, reporting throughput and latency percentiles. The
+normalization and split micro-benchmarks run as well. Results are written as
+JSON; ``--baseline`` compares them with an earlier run and exits non-zero on
+a regression beyond ``--tolerance``::
+
+    python -m benchmarks.harness --output bench.json
+    python -m benchmarks.harness --baseline bench.json --tolerance 0.25
+
+The result cache and the pixel digest index are off by default, so every
+request runs the whole pipeline; ``--cache`` turns them back on.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, List
+
+from benchmarks.corpus import RecordedClient, load_recorded, request_digest, synthetic_corpus
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def multipart_body(image: bytes, filename: str):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="image"; filename="{filename}"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + image + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def load_test(port: int, corpus, clients: int, requests: int) -> Dict[str, Any]:
+    """``clients`` threads share ``requests`` POSTs, each over its own keep-alive connection."""
+    bodies = [multipart_body(receipt.image, f"{receipt.id}.jpg") for receipt in corpus]
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    next_request = iter(range(requests))
+    lock = threading.Lock()
+    start = threading.Barrier(clients + 1)
+
+    def worker():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        start.wait()
+        while True:
+            with lock:
+                index = next(next_request, None)
+            if index is None:
+                break
+            body, content_type = bodies[index % len(bodies)]
+            started = time.perf_counter()
+            connection.request("POST", "/api/process-bill", body=body, headers={"Content-Type": content_type})
+            response = connection.getresponse()
+            response.read()
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+        connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "throughput_rps": len(latencies) / wall,
+        "p50_ms": _percentile(latencies_ms, 0.50),
+        "p95_ms": _percentile(latencies_ms, 0.95),
+        "p99_ms": _percentile(latencies_ms, 0.99),
+        "mean_ms": statistics.mean(latencies_ms),
+    }
+
+
+def micro_benchmarks(repeat: int) -> Dict[str, Any]:
+    from benchmarks import bench_normalize, bench_split
+
+    normalize = bench_normalize.bench(lines=1000, repeat=repeat)
+    return {
+        "normalize_1000_lines": {"median_ms": normalize["single_pass_median_ms"], "min_ms": normalize["single_pass_min_ms"]},
+        "split_100x500": bench_split.bench(100, 500, dense=False, repeat=repeat),
+        "split_100x500_dense": bench_split.bench(100, 500, dense=True, repeat=repeat),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of ``result`` against ``baseline`` beyond ``tolerance`` (a fraction)."""
+    regressions = []
+    previous = {entry["clients"]: entry for entry in baseline.get("load", [])}
+    for entry in result["load"]:
+        old = previous.get(entry["clients"])
+        if old is None:
+            continue
+        if entry["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{entry['clients']} clients: throughput {entry['throughput_rps']:.1f} rps < {old['throughput_rps']:.1f} rps")
+        if entry["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{entry['clients']} clients: p95 {entry['p95_ms']:.1f} ms > {old['p95_ms']:.1f} ms")
+    for name, entry in result["micro"].items():
+        old = baseline.get("micro", {}).get(name)
+        if old is not None and entry["median_ms"] > old["median_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: median {entry['median_ms']:.2f} ms > {old['median_ms']:.2f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", default="1,8,64", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=128, help="requests per concurrency level")
+    parser.add_argument("--corpus-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model-latency", type=float, default=0.0, help="seconds slept per recorded model call")
+    parser.add_argument("--responses", help="directory of recorded responses (python -m benchmarks.corpus record)")
+    parser.add_argument("--cache", action="store_true", help="keep the result cache and the pixel digest index on")
+    parser.add_argument("--micro-repeat", type=int, default=20)
+    parser.add_argument("--output", help="write the JSON results here as well as to stdout")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The backend reads its configuration at import time.
+        os.environ.update({
+            "API_KEY": os.environ.get("API_KEY", "bench"),
+            "EXTRACTOR_MODE": "gemini",
+            "BILL_STORE_PATH": os.path.join(tmp, "bills.sqlite3"),
+            # The harness measures the pipeline, not the limiter.
+            "MODEL_RATE_LIMIT": "0",
+        })
+        if not args.cache:
+            os.environ.update({"BILL_CACHE_BACKEND": "none", "BILL_PIXEL_INDEX_SIZE": "0"})
+        import logging
+
+        from werkzeug.serving import make_server
+
+        from backend import app as backend
+
+        logging.disable(logging.INFO)
+
+        corpus = synthetic_corpus(args.corpus_size, args.seed)
+        if args.responses:
+            load_recorded(corpus, args.responses)
+        client = RecordedClient(
+            {request_digest(receipt.image, backend.preprocess_options): receipt.response_text() for receipt in corpus},
+            latency=args.model_latency,
+        )
+        backend.client_manager.factory = client.factory
+        backend.client_manager.reset()
+
+        server = make_server("127.0.0.1", 0, backend.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            load = [load_test(server.server_port, corpus, int(clients), args.requests) for clients in args.clients.split(",")]
+        finally:
+            server.shutdown()
+
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "corpus_size": args.corpus_size,
+            "model_latency": args.model_latency,
+            "cache": args.cache,
+            "recorded_client": {"calls": client.calls, "unmatched": client.misses},
+        },
+        "load": load,
+        "micro": micro_benchmarks(args.micro_repeat),
+    }
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+    failures = [f"{entry['clients']} clients: non-200 responses {entry['statuses']}"
+                for entry in load if set(entry["statuses"]) != {"200"}]
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures += compare(result, json.load(f), args.tolerance)
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# benchmarks/stub_server.py
+"""Local HTTP server that stands in for the Gemini API.
+
+Answers every ``POST .../models/<model>:generateContent`` with a fixed
+GenerateContentResponse so benchmarks can exercise the real ``genai.Client``
+(auth, HTTP pooling, response parsing) without network access. Point a client
+at it with ``http_options={"base_url": server.url}``. ``FlakyGeminiServer``
+adds latency and 429s to test rate limiting and retries.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BILL = {
+    "items": [
+        {"original_name": "F Mix Tamago 10", "normalized_name": "eggs", "price_before_tax": 257, "discount_amount": 0, "emoji": "🥚"},
+        {"original_name": "FM Bifidus Yogurt 400g", "normalized_name": "yogurt", "price_before_tax": 198, "discount_amount": 0, "emoji": "🥣"},
+        {"original_name": "Plastic Bag", "normalized_name": "plastic bag", "price_before_tax": 5, "discount_amount": 0, "emoji": "🛍️"},
+    ],
+    "total_bill": 496,
+}
+
+
+def generate_content_response(text: str) -> dict:
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": text}]},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {"promptTokenCount": 1, "candidatesTokenCount": 1, "totalTokenCount": 2},
+    }
+
+
+class StubGeminiServer(ThreadingHTTPServer):
+    """Threaded stub server; ``connections`` counts accepted TCP connections."""
+
+    daemon_threads = True
+    # socketserver's default listen backlog of 5 drops connections under load tests.
+    request_queue_size = 1024
+
+    def __init__(self, response_text: str = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _StubHandler)
+        self.response_text = response_text if response_text is not None else json.dumps(DEFAULT_BILL)
+        self.connections = 0
+        self.requests = 0
+        self._counter_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def get_request(self):
+        request = super().get_request()
+        with self._counter_lock:
+            self.connections += 1
+        return request
+
+    def respond(self, handler: "_StubHandler", body: bytes) -> None:
+        """Write the reply for one request; subclasses inject latency or errors."""
+        handler.send_json(200, generate_content_response(self.response_text))
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+class FlakyGeminiServer(StubGeminiServer):
+    """Stub server that behaves like an overloaded API.
+
+    Every request waits ``latency`` seconds (plus up to ``jitter``), then a
+    ``error_rate`` fraction of them are answered with ``error_status`` (429 by
+    default) and a Retry-After header instead of a bill. ``max_concurrent``
+    additionally rejects requests beyond that many in flight, like a quota.
+    """
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 429, retry_after: float = 1.0, max_concurrent: int = 0,
+                 seed: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.max_concurrent = max_concurrent
+        self.rejected = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._rng = random.Random(seed)
+
+    def respond(self, handler, body):
+        with self._counter_lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            over_quota = self.max_concurrent and self.in_flight > self.max_concurrent
+            reject = over_quota or self._rng.random() < self.error_rate
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+        try:
+            time.sleep(delay)
+            if reject:
+                with self._counter_lock:
+                    self.rejected += 1
+                status = "RESOURCE_EXHAUSTED" if self.error_status == 429 else "UNAVAILABLE"
+                handler.send_json(
+                    self.error_status,
+                    {"error": {"code": self.error_status, "message": "Injected by FlakyGeminiServer", "status": status}},
+                    headers={"Retry-After": f"{self.retry_after:g}"},
+                )
+            else:
+                super().respond(handler, body)
+        finally:
+            with self._counter_lock:
+                self.in_flight -= 1
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive between requests.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        with self.server._counter_lock:
+            self.server.requests += 1
+        self.server.respond(self, body)
+
+    def send_json(self, status: int, payload: dict, headers: dict = None) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
@@ -7,6 +7,7 @@ import ItemAllocationCard from './components/ItemAllocationCard';
 import PersonSetup from './components/PersonSetup';
 import BillUploader from './components/BillUploader';
 import BillSummary from './components/BillSummary';
+import { getUploadConfig, uploadBill } from './upload';
 import Emoji from 'react-emoji-render';
 import { toast, ToastContainer } from 'react-toastify';
 import 'react-toastify/dist/ReactToastify.css';
@@ -74,6 +75,7 @@ function App() {
   const [billImage, setBillImage] = useState(null);
   const [billData, setBillData] = useState(null);
   const [isProcessing, setIsProcessing] = useState(false);
+  const [uploadStatus, setUploadStatus] = useState(null);
   const [allocations, setAllocations] = useState({});
   const [currentStep, setCurrentStep] = useState(1);
   const [splitResults, setSplitResults] = useState(null);
@@ -161,6 +163,8 @@ function App() {
 
   const handleImageUpload = (file) => {
     setBillImage(file);
+    // Fetch the server's upload settings while the user looks at the preview.
+    getUploadConfig();
   };
 
   const processBill = async () => {
@@ -184,29 +188,12 @@ function App() {
 
     setIsProcessing(true);
 
-    const formData = new FormData();
-    formData.append('image', billImage);
-    // --- REMOVED Appending API Key ---
-    // formData.append('api_key', apiKey); // Removed
-    // --- End Removed Appending API Key ---
-
     try {
-      const response = await fetch('/api/process-bill', {
-        method: 'POST',
-        body: formData,
-        // No API key needed in request
-      });
-
-      // Try to parse the JSON response body, helpful for backend errors too
-      const data = await response.json();
-
-      if (!response.ok) {
-        // Use the error message from the backend JSON if available, otherwise use status text
-        const errorMessage = data?.error || `Error ${response.status}: ${response.statusText}`;
-        throw new Error(errorMessage);
-      }
+      // Resized in the browser, then sent in one request or in resumable
+      // chunks (src/upload.js). Errors carry the backend's message.
+      const data = await uploadBill(billImage, { onProgress: setUploadStatus });
 
-      // If response is ok, data should contain the bill details
+      // data contains the bill details
       setBillData(data);
       setCurrentStep(3);
       toast.success("Bill processed successfully!");
@@ -219,6 +206,7 @@ function App() {
       // setBillData(null);
     } finally {
       setIsProcessing(false);
+      setUploadStatus(null);
     }
   };
 
@@ -393,9 +381,9 @@ function App() {
       const priceBeforeTax = item.price_before_tax;
       const discount = item.discount_amount;
 
-      // Determine tax rate (same logic as before)
-      const taxRate = (itemName.toLowerCase().includes('plastic') &&
-                       itemName.toLowerCase().includes('bag')) ? 0.10 : 0.08;
+      // Tax rate resolved by the backend's rule engine; fall back to the old rule
+      const taxRate = item.tax_rate ?? ((itemName.toLowerCase().includes('plastic') &&
+                       itemName.toLowerCase().includes('bag')) ? 0.10 : 0.08);
 
       // Calculate effective price including tax and discount
       const itemTotalCost = (priceBeforeTax * (1 + taxRate)) - discount;
@@ -509,6 +497,7 @@ function App() {
             selectedImage={billImage}
             onProcessBill={processBill} // This function no longer needs apiKey
             isProcessing={isProcessing}
+            uploadStatus={uploadStatus}
             onBack={() => navigateToStep(1)}
           />
         );
@@ -6,11 +6,24 @@ import PhotoCameraIcon from '@mui/icons-material/PhotoCamera';
 import PhotoLibraryIcon from '@mui/icons-material/PhotoLibrary';
 // import APIKeyInput from './APIKeyInput';
 
+// Button label for the stages reported by uploadBill (src/upload.js).
+const processingLabel = (status) => {
+  switch (status?.stage) {
+    case 'optimizing':
+      return 'Optimizing photo...';
+    case 'uploading':
+      return status.progress != null ? `Uploading ${Math.round(status.progress * 100)}%...` : 'Uploading...';
+    default:
+      return 'Processing...';
+  }
+};
+
 const BillUploader = ({ 
   onImageUpload, 
   selectedImage, 
   onProcessBill, 
   isProcessing,
+  uploadStatus,
   onBack 
 }) => {
   const handleImageChange = (e) => {
@@ -158,7 +171,7 @@ const BillUploader = ({
           disabled={isProcessing || !selectedImage}
           startIcon={isProcessing ? <CircularProgress size={20} color="inherit" /> : null}
         >
-          {isProcessing ? 'Processing...' : 'Process Bill'}
+          {isProcessing ? processingLabel(uploadStatus) : 'Process Bill'}
         </Button>
       </Box>
     </Box>
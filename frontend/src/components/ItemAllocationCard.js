@@ -16,8 +16,8 @@ const ItemAllocationCard = ({
 
   const priceBeforeTax = item.price_before_tax;
   const discount = item.discount_amount;
-  const taxRate = (item.normalized_name.toLowerCase().includes('plastic') && 
-                  item.normalized_name.toLowerCase().includes('bag')) ? 0.10 : 0.08;
+  const taxRate = item.tax_rate ?? ((item.normalized_name.toLowerCase().includes('plastic') &&
+                  item.normalized_name.toLowerCase().includes('bag')) ? 0.10 : 0.08);
   const effectivePrice = (priceBeforeTax * (1 + taxRate)) - discount;
   
   // Calculate total allocation to check if it equals total quantity
@@ -0,0 +1,36 @@
+// src/imageWorker.js
+/* eslint-disable no-restricted-globals */
+// Downscales and re-encodes a photo off the main thread, so a 12MP decode
+// doesn't freeze the page. Used by upload.js.
+
+self.onmessage = async (event) => {
+  const { id, file, maxEdge, formats, quality } = event.data;
+  try {
+    // 'from-image' applies the EXIF orientation, which re-encoding would drop.
+    const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+    const scale = Math.min(1, maxEdge / Math.max(bitmap.width, bitmap.height));
+    const width = Math.round(bitmap.width * scale);
+    const height = Math.round(bitmap.height * scale);
+    const canvas = new OffscreenCanvas(width, height);
+    const context = canvas.getContext('2d');
+    context.imageSmoothingQuality = 'high';
+    context.drawImage(bitmap, 0, 0, width, height);
+    bitmap.close();
+
+    let blob = null;
+    for (const type of formats) {
+      const candidate = await canvas.convertToBlob({ type, quality });
+      // Browsers that can't encode a type silently return PNG instead.
+      if (candidate.type === type) {
+        blob = candidate;
+        break;
+      }
+    }
+    if (!blob) {
+      throw new Error('None of the advertised formats can be encoded in this browser');
+    }
+    self.postMessage({ id, blob, width, height });
+  } catch (error) {
+    self.postMessage({ id, error: error?.message || String(error) });
+  }
+};
@@ -0,0 +1,188 @@
+// src/upload.js
+// Negotiated upload of a bill photo.
+//
+// The server advertises what it wants (GET /api/upload-config): a longest
+// edge, the formats it decodes and an encoder quality. The photo is resized
+// and re-encoded to that in a Web Worker before it leaves the phone. Small
+// results are POSTed to /api/process-bill as before; larger ones go up in
+// chunks through /api/uploads, resuming from the server's offset after a
+// dropped connection. Upload sessions live in one server process; when a
+// session is not found (another worker, expired, an older backend) the photo
+// is sent in one request instead. The server enforces its own limits either way.
+
+const FALLBACK_CONFIG = {
+  target: null,
+  max_upload_bytes: Infinity,
+  chunk_bytes: 512 * 1024,
+  resumable_min_bytes: Infinity,
+};
+const MAX_CHUNK_RETRIES = 5;
+const RETRY_DELAY_MS = 500;
+
+let configPromise = null;
+
+export function getUploadConfig() {
+  if (!configPromise) {
+    configPromise = fetch('/api/upload-config')
+      .then((response) => (response.ok ? response.json() : Promise.reject(new Error(response.statusText))))
+      .catch((error) => {
+        // Older backends: upload the original photo in one request, and ask again next time.
+        console.warn('Upload config unavailable, sending photos unmodified:', error);
+        configPromise = null;
+        return FALLBACK_CONFIG;
+      });
+  }
+  return configPromise;
+}
+
+// --- Resizing in a worker ---
+let worker = null;
+let nextJobId = 0;
+const pendingJobs = new Map();
+
+function getWorker() {
+  if (!worker) {
+    worker = new Worker(new URL('./imageWorker.js', import.meta.url));
+    worker.onmessage = ({ data }) => {
+      const job = pendingJobs.get(data.id);
+      if (!job) return;
+      pendingJobs.delete(data.id);
+      if (data.error) {
+        job.reject(new Error(data.error));
+      } else {
+        job.resolve(data);
+      }
+    };
+  }
+  return worker;
+}
+
+function resizeInWorker(file, target) {
+  return new Promise((resolve, reject) => {
+    const id = nextJobId++;
+    pendingJobs.set(id, { resolve, reject });
+    getWorker().postMessage({
+      id,
+      file,
+      maxEdge: target.max_edge,
+      formats: target.formats,
+      quality: target.quality,
+    });
+  });
+}
+
+export async function prepareImage(file, config) {
+  const target = config.target;
+  if (!target || typeof Worker === 'undefined' || typeof OffscreenCanvas === 'undefined') {
+    return file;
+  }
+  try {
+    const { blob } = await resizeInWorker(file, target);
+    // Already small photos can come out larger after re-encoding.
+    if (blob.size >= file.size) {
+      return file;
+    }
+    const extension = blob.type === 'image/webp' ? 'webp' : 'jpg';
+    const name = (file.name || 'receipt').replace(/\.[^.]+$/, '') + `.${extension}`;
+    return new File([blob], name, { type: blob.type });
+  } catch (error) {
+    console.warn('Could not resize the photo in the browser, sending it unmodified:', error);
+    return file;
+  }
+}
+// --- End Resizing in a worker ---
+
+// --- Upload ---
+async function requestJson(url, options = {}) {
+  const response = await fetch(url, options);
+  let data = null;
+  try {
+    data = await response.json();
+  } catch (error) {
+    data = null;
+  }
+  if (!response.ok) {
+    const error = new Error(data?.error || `Error ${response.status}: ${response.statusText}`);
+    error.status = response.status;
+    error.data = data;
+    throw error;
+  }
+  return data;
+}
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+async function sha256Hex(file) {
+  // crypto.subtle only exists in secure contexts (HTTPS, localhost).
+  if (!window.crypto?.subtle) return undefined;
+  const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, '0')).join('');
+}
+
+async function resumableUpload(file, config, onProgress) {
+  const session = await requestJson('/api/uploads', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ size: file.size, content_type: file.type, sha256: await sha256Hex(file) }),
+  });
+
+  let offset = session.offset;
+  let failures = 0;
+  while (offset < file.size) {
+    onProgress({ stage: 'uploading', progress: offset / file.size });
+    try {
+      const state = await requestJson(session.upload_url, {
+        method: 'PUT',
+        headers: { 'Upload-Offset': String(offset), 'Content-Type': 'application/octet-stream' },
+        body: file.slice(offset, offset + config.chunk_bytes),
+      });
+      offset = state.offset;
+      failures = 0;
+    } catch (error) {
+      // Network errors have no status; 409 means we and the server disagree on the offset.
+      const retryable = !error.status || error.status >= 500 || error.status === 409;
+      failures += 1;
+      if (!retryable || failures > MAX_CHUNK_RETRIES) {
+        throw error;
+      }
+      await sleep(RETRY_DELAY_MS * 2 ** (failures - 1));
+      try {
+        // Carry on from whatever part of the chunk the server did receive.
+        offset = (await requestJson(session.upload_url)).offset;
+      } catch (statusError) {
+        if (statusError.status === 404) throw statusError;
+      }
+    }
+  }
+
+  onProgress({ stage: 'processing' });
+  return requestJson(session.process_url, { method: 'POST' });
+}
+
+// Resizes, uploads and extracts a bill photo; resolves with the bill JSON.
+// onProgress receives { stage: 'optimizing' | 'uploading' | 'processing', progress? }.
+export async function uploadBill(file, { onProgress = () => {} } = {}) {
+  onProgress({ stage: 'optimizing' });
+  const config = await getUploadConfig();
+  const upload = await prepareImage(file, config);
+  if (upload.size > config.max_upload_bytes) {
+    const megabytes = (bytes) => (bytes / (1024 * 1024)).toFixed(1);
+    throw new Error(`The photo is too large (${megabytes(upload.size)} MB; the limit is ${megabytes(config.max_upload_bytes)} MB).`);
+  }
+
+  if (upload.size >= config.resumable_min_bytes) {
+    try {
+      return await resumableUpload(upload, config, onProgress);
+    } catch (error) {
+      // 404: this server process doesn't know the session; any worker can take a plain POST.
+      if (error.status !== 404) throw error;
+      console.warn('Upload session not found, sending the photo in one request:', error);
+    }
+  }
+  // fetch reports no upload progress; a small photo is up in a moment anyway.
+  onProgress({ stage: 'processing' });
+  const formData = new FormData();
+  formData.append('image', upload, upload.name);
+  return requestJson('/api/process-bill', { method: 'POST', body: formData });
+}
+// --- End Upload ---
@@ -0,0 +1,89 @@
+# tests/legacy_normalize.py
+"""The multi-pass item normalizer that ``finalize_bill`` replaced, and a random receipt generator.
+
+Reference for tests/test_normalize.py; benchmarks/bench_normalize.py times
+the two implementations against each other.
+"""
+from backend.pipeline import DISCOUNT_MARKER
+from backend.split import to_minor_units
+from backend.tax_rules import get_tax_rate
+
+NAMES = ["milk", "eggs", "bread", "plastic bag", "beer", "tofu", "natto", "milk 1"]
+
+
+def legacy_normalize_bill(bill_data):
+    bill_data.setdefault("items", [])
+    for item in bill_data["items"]:
+        item.setdefault("normalized_name", item.get("original_name", ""))
+        if item.get("discount_amount") is None:
+            item["discount_amount"] = 0.0
+    return bill_data
+
+
+def legacy_merge_discount_items(bill_data):
+    items = bill_data.get("items", [])
+    merged_items = []
+    i = 0
+    while i < len(items):
+        current_item = items[i]
+        if (i + 1 < len(items)) and (DISCOUNT_MARKER in items[i+1].get("original_name", "").lower()):
+            discount_item = items[i+1]
+            discount_value = discount_item.get("discount_amount") or discount_item.get("price_before_tax", 0.0)
+            try:
+                current_item["discount_amount"] = abs(float(discount_value))
+            except (ValueError, TypeError):
+                current_item["discount_amount"] = 0.0
+            merged_items.append(current_item)
+            i += 2
+        else:
+            merged_items.append(current_item)
+            i += 1
+    bill_data["items"] = merged_items
+    return bill_data
+
+
+def legacy_make_item_keys_unique(bill_data):
+    items = bill_data.get("items", [])
+    frequency = {}
+    for item in items:
+        name = item.get("normalized_name")
+        frequency[name] = frequency.get(name, 0) + 1
+    occurrence = {}
+    for item in items:
+        name = item.get("normalized_name")
+        if frequency[name] > 1:
+            occurrence[name] = occurrence.get(name, 0) + 1
+            item["normalized_name"] = f"{name} {occurrence[name]}"
+    return bill_data
+
+
+def legacy_finalize_bill(bill_data, minor_units=100):
+    bill_data = legacy_make_item_keys_unique(legacy_merge_discount_items(legacy_normalize_bill(bill_data)))
+    for item in bill_data["items"]:
+        item["tax_rate"] = get_tax_rate(item["normalized_name"], item.get("category"), bill_data.get("store"))
+        # Not part of the previous output; added so both produce the same fields.
+        item["price_minor"] = to_minor_units(item.get("price_before_tax"), minor_units)
+        item["discount_minor"] = to_minor_units(item["discount_amount"], minor_units)
+    return bill_data
+def random_receipt(rng, lines):
+    items = []
+    for _ in range(lines):
+        if rng.random() < 0.2:
+            amount = rng.choice([10, 20, 50, 0.5])
+            item = {"original_name": f"{DISCOUNT_MARKER} {rng.randint(1, 9)}"}
+            # Models report the discount either as discount_amount or as a (negative) price.
+            if rng.random() < 0.5:
+                item.update(price_before_tax=0.0, discount_amount=amount)
+            else:
+                item.update(price_before_tax=-amount, discount_amount=rng.choice([0.0, None]))
+        else:
+            name = rng.choice(NAMES)
+            item = {"original_name": name.upper(), "price_before_tax": rng.randint(1, 3000) / rng.choice([1, 100])}
+            if rng.random() < 0.9:
+                item["normalized_name"] = name
+            if rng.random() < 0.7:
+                item["discount_amount"] = rng.choice([0.0, 0.0, 15.0])
+            if rng.random() < 0.5:
+                item["category"] = rng.choice(["reduced", "standard"])
+        items.append(item)
+    return {"items": items, "total_bill": 0.0, "store": rng.choice([None, "aeon"])}
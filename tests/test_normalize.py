@@ -0,0 +1,55 @@
+# tests/test_normalize.py
+"""The single-pass normalizer against the previous multi-pass implementation."""
+import copy
+import random
+
+import pytest
+
+from backend.pipeline import DISCOUNT_MARKER, finalize_bill, iter_normalized_items
+from tests.legacy_normalize import legacy_finalize_bill, random_receipt
+
+
+def assert_same_as_legacy(bill):
+    assert finalize_bill(copy.deepcopy(bill)) == legacy_finalize_bill(copy.deepcopy(bill))
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random_receipts_match_legacy(seed):
+    rng = random.Random(seed)
+    assert_same_as_legacy(random_receipt(rng, rng.randint(0, 60)))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_discount_heavy_receipts_match_legacy(seed):
+    # Long runs of discount lines: back to back, leading and trailing.
+    rng = random.Random(seed)
+    items = []
+    for _ in range(rng.randint(1, 30)):
+        if rng.random() < 0.6:
+            items.append({"original_name": f"{DISCOUNT_MARKER} x", "price_before_tax": -rng.randint(1, 99)})
+        else:
+            items.append({"original_name": "MILK", "normalized_name": rng.choice(["milk", "milk 1", "milk 2"]),
+                          "price_before_tax": rng.randint(100, 300)})
+    assert_same_as_legacy({"items": items, "total_bill": 0.0})
+
+
+@pytest.mark.parametrize("items", [
+    [],
+    [{"original_name": f"{DISCOUNT_MARKER} 1", "price_before_tax": -10}],
+    [{"original_name": "BEER", "price_before_tax": 300}, {"original_name": f"{DISCOUNT_MARKER} 1", "price_before_tax": -30}],
+    [{"original_name": "BAG", "price_before_tax": 5},
+     {"original_name": f"{DISCOUNT_MARKER} 1", "discount_amount": "n/a", "price_before_tax": 0}],
+    [{"original_name": "EGGS", "normalized_name": "eggs", "price_before_tax": 200, "discount_amount": None}
+     for _ in range(3)],
+], ids=["empty", "only-discount", "trailing-discount", "unparseable-discount", "repeated-names"])
+def test_edge_cases_match_legacy(items):
+    assert_same_as_legacy({"items": copy.deepcopy(items), "total_bill": 0.0})
+
+
+def test_names_are_final_once_exhausted():
+    items = [{"original_name": "tofu", "price_before_tax": 100} for _ in range(3)]
+    yielded = iter_normalized_items(items)
+    first = next(yielded)
+    assert first["normalized_name"] == "tofu"
+    rest = list(yielded)
+    assert [item["normalized_name"] for item in [first, *rest]] == ["tofu 1", "tofu 2", "tofu 3"]
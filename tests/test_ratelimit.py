@@ -0,0 +1,107 @@
+# tests/test_ratelimit.py
+"""Single-flight, the token bucket and 429 retries against a local flaky model server."""
+import io
+import threading
+
+import pytest
+
+from backend.cache import NullCache
+from backend.imagehash import PixelDigestIndex
+from backend.ratelimit import ModelGate, RateLimited, TokenBucket, retry_with_backoff
+from backend.store import SQLiteBillStore
+from benchmarks.stub_server import FlakyGeminiServer
+
+
+def receipt_image(index):
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (300, 400), "white")
+    draw = ImageDraw.Draw(image)
+    for line in range(0, 400, 40):
+        draw.text((20, line), f"RECEIPT {index} ITEM {line} .... {line * 3 + index}", fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def post_bill(app, image, name="receipt.png"):
+    return app.test_client().post("/api/process-bill", data={"image": (io.BytesIO(image), name)})
+
+
+@pytest.fixture
+def backend(monkeypatch, tmp_path):
+    # Configuration read at import time; the caches would hide repeat calls.
+    monkeypatch.setenv("API_KEY", "test")
+    monkeypatch.setenv("BILL_STORE_PATH", str(tmp_path / "bills.sqlite3"))
+    from backend import app as backend
+
+    monkeypatch.setattr(backend, "server_api_key", "test")
+    monkeypatch.setattr(backend.gemini_extractor, "api_key", "test")
+    monkeypatch.setattr(backend, "bill_cache", NullCache())
+    monkeypatch.setattr(backend, "pixel_duplicates", PixelDigestIndex(max_entries=0))
+    monkeypatch.setattr(backend, "bill_store", SQLiteBillStore(str(tmp_path / "bills.sqlite3")))
+    yield backend
+    backend.client_manager.http_options = None
+    backend.client_manager.reset()
+
+
+def use_server(backend, monkeypatch, server, gate):
+    monkeypatch.setattr(backend.gemini_extractor, "gate", gate)
+    backend.client_manager.http_options = {"base_url": server.url}
+    backend.client_manager.reset()
+
+
+def test_duplicate_uploads_share_one_model_call(backend, monkeypatch):
+    clients = 8
+    image = receipt_image(0)
+    statuses = []
+    start = threading.Barrier(clients)
+
+    def upload():
+        start.wait()
+        statuses.append(post_bill(backend.app, image).status_code)
+
+    with FlakyGeminiServer(latency=0.5) as server:
+        use_server(backend, monkeypatch, server, ModelGate(retries=0))
+        threads = [threading.Thread(target=upload) for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert statuses == [200] * clients
+    assert server.requests == 1
+
+
+def test_exhausted_bucket_returns_503_with_retry_after(backend, monkeypatch):
+    # One token and no wait queue: the second call is turned away at once.
+    gate = ModelGate(TokenBucket(rate=0.1, burst=1, max_waiters=0), retries=0)
+    with FlakyGeminiServer(latency=0.0) as server:
+        use_server(backend, monkeypatch, server, gate)
+        first = post_bill(backend.app, receipt_image(1))
+        second = post_bill(backend.app, receipt_image(2))
+    assert first.status_code == 200
+    assert second.status_code == 503
+    assert int(second.headers["Retry-After"]) >= 1
+    assert server.requests == 1
+
+
+def test_retry_with_backoff_stops_after_retries():
+    from google import genai
+
+    delays = []
+    with FlakyGeminiServer(latency=0.0, error_rate=1.0, retry_after=0) as server:
+        client = genai.Client(api_key="test", http_options={"base_url": server.url})
+        with pytest.raises(RateLimited):
+            retry_with_backoff(
+                lambda: client.models.generate_content(model="gemini-2.0-flash", contents="receipt"),
+                retries=2, base=0.0, cap=0.0, sleep=delays.append,
+            )
+    assert server.requests == 3
+    assert len(delays) == 2
+
+
+def test_negative_retries_are_rejected():
+    with pytest.raises(ValueError):
+        retry_with_backoff(lambda: "bill", retries=-1)
+    with pytest.raises(ValueError):
+        ModelGate(retries=-1)
@@ -0,0 +1,124 @@
+# tests/test_split.py
+"""The exact split engine: totals add up to the bill and stay within a unit of the exact shares."""
+import random
+from fractions import Fraction
+
+import pytest
+
+from backend.incremental import IncrementalSplit
+from backend.split import compute_split, largest_remainder
+
+PEOPLE = ["ann", "bob", "cy"]
+SHARES = ["0", "1", "1/2", "1/3", "2/3", "0.25"]
+
+
+def flat_rate(rate):
+    return lambda name: rate
+
+
+def exact_totals(items, allocations, people, rate, minor_units):
+    totals = {person: Fraction(0) for person in people}
+    for item in items:
+        allocation = allocations[item["normalized_name"]]
+        cost = (
+            Fraction(round(item["price_before_tax"] * minor_units)) * (1 + Fraction(str(rate)))
+            - Fraction(round(item.get("discount_amount", 0) * minor_units))
+        )
+        for person, share in allocation["shares"].items():
+            totals[person] += cost * Fraction(share) / allocation["total_quantity"]
+    return totals
+
+
+def random_bill(rng, discount_over_price=False):
+    items, allocations = [], {}
+    for i in range(rng.randint(1, 12)):
+        # Multiples of 25 keep each item's cost with 8% tax a whole number.
+        price = 25 * rng.randint(1, 120)
+        discount = rng.choice([0, 0, rng.randint(1, price)])
+        if discount_over_price and rng.random() < 0.3:
+            discount = price + rng.randint(1, 500)
+        quantity = rng.randint(1, 3)
+        # Each person takes a random share; the last one takes what is left.
+        shares = {person: rng.choice(SHARES) for person in PEOPLE[:-1]}
+        shares[PEOPLE[-1]] = str(quantity - sum(Fraction(share) for share in shares.values()))
+        items.append({"normalized_name": f"item {i}", "price_before_tax": price, "discount_amount": discount})
+        allocations[f"item {i}"] = {"total_quantity": quantity, "shares": shares}
+    return items, allocations
+
+
+@pytest.mark.parametrize("seed", range(100))
+@pytest.mark.parametrize("discount_over_price", [False, True], ids=["discounts", "negative-costs"])
+def test_totals_round_the_exact_shares(seed, discount_over_price):
+    rng = random.Random(seed)
+    items, allocations = random_bill(rng, discount_over_price)
+    exact = exact_totals(items, allocations, PEOPLE, 0.08, 1)
+    result = compute_split(items, allocations, PEOPLE, flat_rate(0.08), minor_units=1)
+    assert not result.errors
+    assert sum(result.totals_minor.values()) == sum(exact.values())
+    for person in PEOPLE:
+        assert abs(result.totals_minor[person] - exact[person]) < 1
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_totals_add_up_to_total_bill(seed):
+    rng = random.Random(seed)
+    items, allocations = random_bill(rng)
+    total_bill = round(sum(item["price_before_tax"] for item in items) * rng.uniform(0.9, 1.2), 2)
+    result = compute_split(items, allocations, PEOPLE, flat_rate(0.08), total_bill=total_bill)
+    assert sum(result.totals_minor.values()) == round(total_bill * 100)
+    incremental = IncrementalSplit.from_allocations(items, allocations, PEOPLE, tax_rate=flat_rate(0.08), total_bill=total_bill)
+    assert incremental.result().to_dict() == result.to_dict()
+
+
+def test_thirds():
+    items = [{"normalized_name": "pizza", "price_before_tax": 1000}]
+    allocations = {"pizza": {"total_quantity": 1, "shares": {person: "1/3" for person in PEOPLE}}}
+    result = compute_split(items, allocations, PEOPLE, flat_rate(0.0), total_bill=1000, minor_units=1)
+    assert result.totals_minor == {"ann": 334, "bob": 333, "cy": 333}
+    assert result.adjustment_minor == 0
+
+
+def test_discount_is_taken_after_tax():
+    items = [{"normalized_name": "beef", "price_before_tax": 1000, "discount_amount": 100}]
+    allocations = {"beef": {"total_quantity": 1, "shares": {"ann": "1/2", "bob": "1/2", "cy": "0"}}}
+    result = compute_split(items, allocations, PEOPLE, flat_rate(0.08), minor_units=1)
+    assert result.totals_minor == {"ann": 490, "bob": 490, "cy": 0}
+
+
+def test_discount_larger_than_price():
+    items = [
+        {"normalized_name": "coupon", "price_before_tax": 100, "discount_amount": 300},
+        {"normalized_name": "rice", "price_before_tax": 200, "discount_amount": 0},
+    ]
+    allocations = {
+        "coupon": {"total_quantity": 1, "shares": {"ann": "1", "bob": "0", "cy": "0"}},
+        "rice": {"total_quantity": 1, "shares": {"ann": "0", "bob": "1/2", "cy": "1/2"}},
+    }
+    result = compute_split(items, allocations, PEOPLE, flat_rate(0.08), minor_units=1)
+    assert result.totals_minor == {"ann": -192, "bob": 108, "cy": 108}
+
+
+def test_total_bill_gap_with_mixed_signs_is_spread_equally():
+    items = [
+        {"normalized_name": "coupon", "price_before_tax": 0, "discount_amount": 500},
+        {"normalized_name": "wine", "price_before_tax": 500, "discount_amount": 0},
+    ]
+    allocations = {
+        "coupon": {"total_quantity": 1, "shares": {"ann": "1", "bob": "0", "cy": "0"}},
+        "wine": {"total_quantity": 1, "shares": {"ann": "0", "bob": "1", "cy": "0"}},
+    }
+    result = compute_split(items, allocations, PEOPLE, flat_rate(0.0), total_bill=30, minor_units=1)
+    assert result.totals_minor == {"ann": -490, "bob": 510, "cy": 10}
+    assert result.adjustment_minor == 30
+
+
+@pytest.mark.parametrize("numerators, denominator, total, expected", [
+    ([5, -5], 1, 0, [5, -5]),
+    ([-19600 * 3, 2, 1], 3, -19599, [-19600, 1, 0]),
+    ([1, 1, 1], 3, 1, [1, 0, 0]),
+    ([10, 20, 30], 1, 7, [1, 2, 4]),
+    ([-3, -3], 1, -5, [-2, -3]),
+    ([0, 0], 1, 5, [0, 0]),
+], ids=["mixed-signs", "exact-negative", "thirds", "proportional", "negative-proportional", "all-zero"])
+def test_largest_remainder(numerators, denominator, total, expected):
+    assert largest_remainder(numerators, denominator, total) == expected
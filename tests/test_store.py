@@ -0,0 +1,79 @@
+# tests/test_store.py
+"""Cell updates and expiry in the SQLite bill store."""
+import time
+
+import pytest
+
+from backend.store import BillNotFound, InvalidUpdate, SQLiteBillStore
+
+BILL = {
+    "items": [
+        {"normalized_name": "milk", "price_before_tax": 200},
+        {"normalized_name": "beer", "price_before_tax": 300},
+    ],
+    "total_bill": 540,
+}
+ALLOCATIONS = {
+    "milk": {"total_quantity": 1, "shares": {"ann": "1/2", "bob": "1/2"}},
+    "beer": {"total_quantity": 2, "shares": {"ann": "1", "bob": "1"}},
+}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteBillStore(str(tmp_path / "bills.sqlite3"), ttl=60)
+
+
+def age(store, bill_id, seconds):
+    with store._connect() as conn:
+        conn.execute("UPDATE bills SET updated_at = updated_at - ? WHERE id = ?", (seconds, bill_id))
+
+
+def test_update_cells_changes_only_the_given_cells(store):
+    saved = store.create(BILL, ["ann", "bob"], ALLOCATIONS)
+    version = store.update_cells(saved["id"], shares=[("milk", "ann", "1")], quantities=[("beer", 3)])
+    updated = store.get(saved["id"])
+    assert version == updated["version"] == saved["version"] + 1
+    assert updated["allocations"] == {
+        "milk": {"total_quantity": 1, "shares": {"ann": "1", "bob": "1/2"}},
+        "beer": {"total_quantity": 3, "shares": {"ann": "1", "bob": "1"}},
+    }
+    assert updated["bill"] == BILL
+
+
+def test_update_cells_drops_the_shares_of_removed_people(store):
+    saved = store.create(BILL, ["ann", "bob"], ALLOCATIONS)
+    store.update_cells(saved["id"], shares=[("milk", "ann", "1")], people=["ann"])
+    updated = store.get(saved["id"])
+    assert updated["people"] == ["ann"]
+    assert updated["allocations"]["milk"]["shares"] == {"ann": "1"}
+    assert updated["allocations"]["beer"]["shares"] == {"ann": "1"}
+    with pytest.raises(InvalidUpdate):
+        store.update_cells(saved["id"], shares=[("milk", "bob", "1/2")])
+
+
+def test_update_cells_rejects_unknown_items(store):
+    saved = store.create(BILL, ["ann", "bob"], ALLOCATIONS)
+    with pytest.raises(InvalidUpdate):
+        store.update_cells(saved["id"], shares=[("bread", "ann", "1")])
+    assert store.get(saved["id"])["version"] == saved["version"]
+
+
+def test_stale_bills_are_purged_when_a_bill_is_created(store):
+    stale = store.create(BILL, ["ann", "bob"], ALLOCATIONS)
+    fresh = store.create(BILL, ["ann"])
+    age(store, stale["id"], 120)
+    store.create(BILL)
+    assert store.get(stale["id"]) is None
+    assert store.exists(fresh["id"])
+    with pytest.raises(BillNotFound):
+        store.update_cells(stale["id"], shares=[("milk", "ann", "1")])
+
+
+def test_updates_keep_a_bill_from_being_purged(store):
+    saved = store.create(BILL, ["ann", "bob"], ALLOCATIONS)
+    age(store, saved["id"], 120)
+    store.update_cells(saved["id"], quantities=[("milk", 2)])
+    assert store.get(saved["id"])["updated_at"] > time.time() - 60
+    store.create(BILL)
+    assert store.exists(saved["id"])